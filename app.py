@@ -1,40 +1,648 @@
-from flask import Flask, render_template, Response
+from flask import Flask, render_template, Response, abort, make_response, request, stream_with_context
+from markupsafe import escape
 # import pandas as pd
+from collections import OrderedDict
+from datetime import datetime
+import hashlib
 import io
+import json
+import os
 import random
+import shutil
+import threading
+from urllib.parse import quote, urlencode
 from detector.analysis import Analysis
+from detector.cache import PriceCache
+from detector.jobs import JobManager
+from detector.profiler import profiler
+from detector.providers import get_price_provider
+from detector.rules import get_rule_names
 
 app = Flask(__name__)
 
-# initiate analysis from traders_data.csv
-analysis = Analysis("traders_data.csv", ["AMZN"])
+# Data files can be set by environment variables
+TRADERS_DATA_FILE = os.environ.get("TRADERS_DATA_FILE", "traders_data.csv")
+PRICE_CACHE_FILE = os.environ.get("PRICE_CACHE_FILE", "price_cache.sqlite")
+# Source of stocks data: yahoo, directory of files or url template, see detector.providers.get_price_provider
+PRICE_PROVIDER = os.environ.get("PRICE_PROVIDER", "yahoo")
+# TCP port of live trade feeds (JSON lines, see detector.stream), no live dashboard if not set
+STREAM_PORT = os.environ.get("STREAM_PORT")
+# Directory of analysis snapshots (see Analysis.save) shared by all workers, not used if not set:
+# written after each analysis job, loaded at startup instead of running an analysis, and when another
+# worker writes a more recent one. Workers memory-map the same files, so most of the data is held in memory once
+ANALYSIS_SNAPSHOT = os.environ.get("ANALYSIS_SNAPSHOT")
+# Number of analysis jobs run at the same time
+ANALYSIS_WORKERS = int(os.environ.get("ANALYSIS_WORKERS", "1"))
+# Comma separated rules flagging suspicious records (see detector.rules), all for all rules, default rules if not set
+ANALYSIS_RULES = os.environ.get("ANALYSIS_RULES")
+# Analyse all stocks once, stock symbols and date range are selected per request
+STOCK_SYMBOLS = []
+
+# Analyses run as background jobs, the server starts without waiting for the first one
+jobs = JobManager(ANALYSIS_WORKERS)
+# Job and result of the latest completed analysis, replaced as one tuple when a more recent job completes
+current = (None, None)
+swap_lock = threading.Lock()
+# Snapshot of the analysis served, and latest snapshot of another worker submitted for loading
+served_snapshot = None
+requested_snapshot = None
+
+# Rendered pages by (analysis job, data version, report filters), least recently used first,
+# at most PAGE_CACHE_SIZE pages (filters are query parameters), cleared when analysis is replaced
+PAGE_CACHE_SIZE = 32
+page_cache = OrderedDict()
+page_cache_lock = threading.Lock()
+
+# Report filters of the dashboard without query parameters, rendered when an analysis completes
+DEFAULT_FILTERS = {'stock_symbols': None, 'countries': None, 'start_date': None, 'end_date': None}
+
+# Page size of JSON API
+DEFAULT_PER_PAGE = 100
+MAX_PER_PAGE = 1000
+# Number of traders of top traders API
+DEFAULT_TOP_TRADERS = 50
+# Columns of suspicious trades of a trader or country, with the names of the rules flagging each trade
+TRADES_COLUMNS = ['tradeDate', 'stockSymbol', 'stockName', 'price', 'High', 'Low', 'countryCode', 'traderId', 'name']
 
 
 @app.route("/")
 def index():
-    html_body = generate_html_body()
+    '''
+    Dashboard, optionally filtered by query parameters symbol, country, start and end
+    '''
+    page = get_cached_page(get_report_filters())
+    response = make_response(page['html'])
+    # browsers and proxies revalidate with ETag / Last-Modified and get 304 if unchanged
+    response.set_etag(page['etag'])
+    response.last_modified = page['last_modified']
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+@app.route("/live")
+def live():
+    '''
+    Dashboard of trades flagged so far from live trade feeds
+    '''
+    if stream_detector is None:
+        abort(404, description="no live trade feed, set STREAM_PORT")
+    response = make_response(render_template(
+        'index.html', records=u''.join(generate_html_body(stream_detector))))
+    response.cache_control.no_store = True
+    return response
+
+
+@app.route("/reload", methods=["POST"])
+def reload():
+    '''
+    Start a new analysis from the traders data file, served when completed
+    '''
+    return job_response(submit_analysis(), 202)
+
+
+@app.route("/jobs", methods=["GET"])
+def list_jobs():
+    '''
+    Analysis jobs, most recent first, and id of the job of the analysis served
+    '''
+    job, _ = current
+    return {'current': job.id if job else None,
+            'jobs': [job.to_dict() for job in jobs.list()]}
+
+
+@app.route("/jobs", methods=["POST"])
+def create_job():
+    '''
+    Submit an analysis job
+    '''
+    return job_response(submit_analysis(), 202)
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    return job_response(find_job(job_id))
+
+
+@app.route("/jobs/<job_id>", methods=["DELETE"])
+def cancel_job(job_id):
+    '''
+    Cancel a job: a pending job does not run, the result of a running job is not served
+    '''
+    job = find_job(job_id)
+    if not jobs.cancel(job_id):
+        abort(409, description="job already {}".format(job.status))
+    return job_response(job)
+
+
+@app.route("/metrics")
+def metrics():
+    '''
+    Time, rows and memory of pipeline stages in Prometheus text format
+    '''
+    return Response(profiler.to_prometheus(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route("/api/traders")
+def api_traders():
+    '''
+    Suspicious traders ranking, paginated
+    '''
+    _, analysis = get_analysis()
+    report = analysis.count_suspicious_per_trader(
+        **get_report_filters()).reset_index()
+    return stream_report(report)
+
+
+@app.route("/api/traders/top")
+def api_top_traders():
+    '''
+    Top k traders by suspicious trades in the last days up to end (rolling window)
+    Query parameters: k (default 50), days (all data if not provided), end (YYYY-MM-DD, last trade date by default)
+    '''
+    k = get_int_arg('k', DEFAULT_TOP_TRADERS, 1, MAX_PER_PAGE)
+    days = get_int_arg('days', None, 1)
+    end_date = get_date_arg('end')
+    _, analysis = get_analysis()
+    report = analysis.top_suspicious_traders(k, days, end_date).reset_index()
+    return {
+        'k': k,
+        'days': days,
+        'end': end_date or analysis.end_date,
+        'items': json.loads(report.to_json(orient='records')),
+    }
+
+
+@app.route("/api/countries")
+def api_countries():
+    '''
+    Suspicious trades by country per month, paginated
+    '''
+    _, analysis = get_analysis()
+    report = analysis.count_suspicious_by_country_per_month(
+        **get_report_filters())
+    report.index = report.index.astype(str)
+    report = report.rename_axis(columns=None).reset_index()
+    months = [column for column in report.columns
+              if column not in ('country code', 'total')]
+
+    def to_item(record):
+        return {'countryCode': record['country code'],
+                'months': {month: record[month] for month in months},
+                'total': record['total']}
+    return stream_report(report, to_item)
+
+
+@app.route("/traders/<trader_id>")
+def trader_trades(trader_id):
+    '''
+    Suspicious trades of a trader, paginated, linked from the ranking table
+    Query parameters: name, start, end (YYYY-MM-DD), page (from 1), per_page
+    '''
+    name = request.args.get('name')
+    title = "Suspicious Trades of {}{}".format(trader_id, " ({})".format(name) if name else "")
+    return render_trades(title, lambda analysis, **kwargs: analysis.trader_trades(trader_id, name, **kwargs))
+
+
+@app.route("/countries/<country>")
+def country_trades(country):
+    '''
+    Suspicious trades of a country, paginated, linked from the country table
+    Query parameters: start, end (YYYY-MM-DD), page (from 1), per_page
+    '''
+    return render_trades("Suspicious Trades of {}".format(country),
+                         lambda analysis, **kwargs: analysis.country_trades(country, **kwargs))
+
+
+@app.route("/api/traders/<trader_id>/trades")
+def api_trader_trades(trader_id):
+    '''
+    Suspicious trades of a trader sorted by trade date, paginated
+    Query parameters: name, start, end (YYYY-MM-DD), page (from 1), per_page
+    '''
+    name = request.args.get('name')
+    return stream_trades(lambda analysis, **kwargs: analysis.trader_trades(trader_id, name, **kwargs))
+
+
+@app.route("/api/countries/<country>/trades")
+def api_country_trades(country):
+    '''
+    Suspicious trades of a country sorted by trade date, paginated
+    Query parameters: start, end (YYYY-MM-DD), page (from 1), per_page
+    '''
+    return stream_trades(lambda analysis, **kwargs: analysis.country_trades(country, **kwargs))
+
+
+def get_trades_page(get_trades):
+    '''
+    Get a page of suspicious trades from get_trades(analysis, start_date, end_date, offset, limit),
+    only the trades of the page are read
+    '''
+    start_date, end_date = get_date_arg('start'), get_date_arg('end')
+    page = get_int_arg('page', 1, 1)
+    per_page = get_int_arg('per_page', DEFAULT_PER_PAGE, 1, MAX_PER_PAGE)
+    _, analysis = get_analysis()
+    trades, total = get_trades(analysis, start_date=start_date, end_date=end_date,
+                               offset=(page - 1) * per_page, limit=per_page)
+    report = trades[TRADES_COLUMNS].reset_index(drop=True)
+    report['tradeDate'] = report.tradeDate.dt.strftime('%Y-%m-%d')
+    report['rules'] = [get_rule_names(flags) for flags in trades['flags'].values]
+    return report, total, page, per_page
+
+
+def stream_trades(get_trades):
+    report, total, page, per_page = get_trades_page(get_trades)
+
+    def to_item(record):
+        # missing High / Low (not a trading date) as null
+        return {key: None if isinstance(value, float) and value != value else value
+                for key, value in record.items()}
+    return stream_page(report, total, page, per_page, to_item)
+
+
+def render_trades(title, get_trades):
+    '''
+    Render a page of suspicious trades, with links to the previous and next pages
+    '''
+    report, total, page, per_page = get_trades_page(get_trades)
+    report.index += (page - 1) * per_page + 1
+    html_body = ["<h1>Market Abuse Detection</h1>", "<h3>{}</h3>".format(escape(title)),
+                 "<h4><em>{} trades, page {} of {}</em></h4>".format(total, page, max(-(-total // per_page), 1)),
+                 report.to_html(formatters={'rules': ', '.join}, na_rep='')]
+    args = request.args.to_dict()
+    links = []
+    if page > 1:
+        links.append('<a href="?{}">previous</a>'.format(escape(urlencode(dict(args, page=page - 1)))))
+    if page * per_page < total:
+        links.append('<a href="?{}">next</a>'.format(escape(urlencode(dict(args, page=page + 1)))))
+    html_body.append("<p>{}</p>".format(" | ".join(links)))
     return render_template('index.html', records=u''.join(html_body))
 
 
-def generate_html_body():
+def get_report_filters():
+    '''
+    Get filters of reports from query parameters
+    - symbol: comma separated stock symbols
+    - country: comma separated country codes
+    - start, end: trade date range YYYY-MM-DD
+    '''
+    return {
+        'stock_symbols': get_list_arg('symbol'),
+        'countries': get_list_arg('country'),
+        'start_date': get_date_arg('start'),
+        'end_date': get_date_arg('end'),
+    }
+
+
+def get_list_arg(name):
+    value = request.args.get(name)
+    return [item.strip() for item in value.split(',') if item.strip()] if value else None
+
+
+def get_date_arg(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        abort(400, description="{} must be YYYY-MM-DD".format(name))
+    return value
+
+
+def get_int_arg(name, default, minimum, maximum=None):
+    if name not in request.args:
+        return default
+    value = request.args.get(name, type=int)
+    if value is None or value < minimum or (maximum and value > maximum):
+        abort(400, description="invalid {}".format(name))
+    return value
+
+
+def stream_report(report, to_item=dict):
+    '''
+    Stream a page of report as JSON, rows are serialised one by one
+    Query parameters:
+    - sort: column to sort by, order: asc or desc (default)
+    - limit: keep top N rows only (after sorting)
+    - page (from 1), per_page
+    '''
+    sort = request.args.get('sort')
+    if sort:
+        if sort not in report.columns:
+            abort(400, description="invalid sort {}".format(sort))
+        ascending = request.args.get('order', 'desc') == 'asc'
+        report = report.sort_values(sort, ascending=ascending, kind='stable')
+    limit = get_int_arg('limit', None, 1)
+    if limit:
+        report = report.head(limit)
+    page = get_int_arg('page', 1, 1)
+    per_page = get_int_arg('per_page', DEFAULT_PER_PAGE, 1, MAX_PER_PAGE)
+    return stream_page(report.iloc[(page - 1) * per_page: page * per_page], len(report), page, per_page, to_item)
+
+
+def stream_page(rows, total, page, per_page, to_item=dict):
+    '''
+    Stream rows of a page as JSON, rows are serialised one by one
+    total: number of rows of all pages
+    '''
+    columns = list(rows.columns)
+
+    def generate():
+        yield '{{"page": {}, "per_page": {}, "total": {}, "pages": {}, "items": ['.format(
+            page, per_page, total, -(-total // per_page))
+        for i, row in enumerate(rows.itertuples(index=False, name=None)):
+            item = to_item(dict(zip(columns, row)))
+            yield (', ' if i else '') + json.dumps(item, default=to_json_value)
+        yield ']}'
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+
+def to_json_value(value):
+    '''
+    Convert numpy values to JSON serialisable python values
+    '''
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(type(value))
+
+
+def build_analysis():
+    '''
+    Analysis of traders data file, stocks data cached locally (run in a job)
+    '''
+    rules = ANALYSIS_RULES if ANALYSIS_RULES in (None, 'all') else ANALYSIS_RULES.split(',')
+    return Analysis(TRADERS_DATA_FILE, STOCK_SYMBOLS,
+                    PriceCache(PRICE_CACHE_FILE, provider=get_price_provider(PRICE_PROVIDER)), rules=rules)
+
+
+def submit_analysis():
+    '''
+    Submit an analysis job, its result replaces the analysis served when completed
+    and is saved to snapshot if ANALYSIS_SNAPSHOT is set
+    '''
+    return jobs.submit('analysis', build_analysis, on_done=complete_analysis)
+
+
+def complete_analysis(job, result):
+    '''
+    Render the dashboard in the job, so the first request after the swap does not wait for it.
+    With ANALYSIS_SNAPSHOT, save the snapshot and serve its memory-mapped copy instead of the result,
+    then make it the current snapshot of all workers
+    '''
+    with app.app_context():
+        page = render_page(result, DEFAULT_FILTERS)
+    name = None
+    if ANALYSIS_SNAPSHOT:
+        name = save_snapshot(job, result, page)
+        result = Analysis.load(os.path.join(ANALYSIS_SNAPSHOT, name))
+    if swap_analysis(job, result, page, name):
+        if name:
+            publish_snapshot(name)
+    elif name:
+        shutil.rmtree(os.path.join(ANALYSIS_SNAPSHOT, name), ignore_errors=True)
+
+
+def save_snapshot(job, analysis, page):
+    '''
+    Save analysis and rendered dashboard to a new directory of ANALYSIS_SNAPSHOT,
+    named by analysis time and job so names sort by time, return its name
+    '''
+    name = '{:%Y%m%dT%H%M%S%f}-{}'.format(analysis.updated_at, job.id)
+    path = os.path.join(ANALYSIS_SNAPSHOT, name)
+    analysis.save(path)
+    with open(os.path.join(path, 'index.html'), 'w', encoding='utf-8') as file:
+        file.write(page['html'])
+    return name
+
+
+def publish_snapshot(name):
+    '''
+    Make snapshot name the current snapshot, replaced at once so other workers never read a partial name.
+    Only the current and previous snapshots are kept (workers that still map removed files keep their pages)
+    '''
+    tmp_path = os.path.join(ANALYSIS_SNAPSHOT, 'CURRENT.{}.tmp'.format(os.getpid()))
+    with open(tmp_path, 'w') as file:
+        file.write(name)
+    os.replace(tmp_path, os.path.join(ANALYSIS_SNAPSHOT, 'CURRENT'))
+    names = sorted(entry for entry in os.listdir(ANALYSIS_SNAPSHOT)
+                   if os.path.isdir(os.path.join(ANALYSIS_SNAPSHOT, entry)) and entry <= name)
+    for old in names[:-2]:
+        shutil.rmtree(os.path.join(ANALYSIS_SNAPSHOT, old), ignore_errors=True)
+
+
+def get_current_snapshot():
+    '''
+    Name of the current snapshot, None if no snapshot
+    '''
+    try:
+        with open(os.path.join(ANALYSIS_SNAPSHOT, 'CURRENT')) as file:
+            return file.read().strip() or None
+    except OSError:
+        return None
+
+
+def load_snapshot(name):
+    '''
+    Load analysis (memory-mapped) and rendered dashboard of snapshot name
+    '''
+    path = os.path.join(ANALYSIS_SNAPSHOT, name)
+    analysis = Analysis.load(path)
+    page = None
+    if os.path.exists(os.path.join(path, 'index.html')):
+        with open(os.path.join(path, 'index.html'), encoding='utf-8') as file:
+            page = make_page(file.read(), analysis)
+    return {'name': name, 'analysis': analysis, 'page': page}
+
+
+def restore_snapshot(job, snapshot):
+    swap_analysis(job, snapshot['analysis'], snapshot['page'], snapshot['name'])
+
+
+def check_snapshot():
+    '''
+    Load the current snapshot in a job if another worker saved it after the analysis served
+    '''
+    global requested_snapshot
+    name = get_current_snapshot()
+    if name and name > (served_snapshot or '') and name != requested_snapshot:
+        requested_snapshot = name
+        jobs.submit('snapshot', load_snapshot, name, on_done=restore_snapshot)
+
+
+def start():
+    '''
+    Serve the current snapshot if any (loaded before serving requests),
+    otherwise (or if the snapshot can not be loaded) start the first analysis job
+    '''
+    name = get_current_snapshot() if ANALYSIS_SNAPSHOT else None
+    if name:
+        job = jobs.submit('snapshot', load_snapshot, name, on_done=restore_snapshot)
+        if jobs.wait(job.id).status == 'done':
+            return
+    submit_analysis()
+
+
+def swap_analysis(job, result, page=None, snapshot=None):
+    '''
+    Serve the analysis of a completed job, unless a more recent job already completed, return True if served.
+    Requests keep the analysis they started with, rendered pages of the previous analysis are dropped,
+    page is the dashboard of the analysis already rendered with DEFAULT_FILTERS if any,
+    snapshot is the name of its snapshot if any
+    '''
+    global current, served_snapshot
+    with swap_lock:
+        if current[0] is not None and job.seq <= current[0].seq:
+            return False
+        current = (job, result)
+        served_snapshot = snapshot
+        with page_cache_lock:
+            page_cache.clear()
+        if page is not None:
+            cache_page(get_page_key(job, result, DEFAULT_FILTERS), page)
+        return True
+
+
+def get_analysis():
+    '''
+    Get job and result of the analysis served, 503 if no analysis completed yet
+    '''
+    if ANALYSIS_SNAPSHOT:
+        check_snapshot()
+    job, result = current
+    if result is None:
+        latest = next(iter(jobs.list()), None)
+        description = "analysis failed: {}".format(latest.error) if latest and latest.error else \
+            "analysis in progress"
+        abort(make_response({'error': description}, 503, {'Retry-After': '5'}))
+    return job, result
+
+
+def find_job(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        abort(404, description="unknown job {}".format(job_id))
+    return job
+
+
+def job_response(job, status=200):
+    '''
+    Job as JSON, with its url in Location header
+    '''
+    return job.to_dict(), status, {'Location': '/jobs/{}'.format(job.id)}
+
+
+def start_stream_detector(port):
+    '''
+    Flag trades of live trade feeds on TCP port in a background thread with its own event loop,
+    return the detector, its counters back the live dashboard
+    '''
+    # imported only with a live feed
+    import asyncio
+    from detector.stream import StreamDetector, serve
+
+    detector = StreamDetector(STOCK_SYMBOLS, PriceCache(
+        PRICE_CACHE_FILE, provider=get_price_provider(PRICE_PROVIDER)))
+    loop = asyncio.new_event_loop()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(serve(detector, '0.0.0.0', port))
+        loop.run_forever()
+    threading.Thread(target=run, daemon=True).start()
+    return detector
+
+
+def get_cached_page(filters):
+    '''
+    Get rendered page of current analysis, render once per analysis job, data version and report filters
+    (again if dropped from the cache)
+    '''
+    job, analysis = get_analysis()
+    key = get_page_key(job, analysis, filters)
+    with page_cache_lock:
+        page = page_cache.get(key)
+        if page is not None:
+            page_cache.move_to_end(key)
+    if page is None:
+        page = render_page(analysis, filters)
+        cache_page(key, page)
+    return page
+
+
+def cache_page(key, page):
+    '''
+    Keep rendered page, drop the least recently used pages beyond PAGE_CACHE_SIZE
+    '''
+    with page_cache_lock:
+        page_cache[key] = page
+        page_cache.move_to_end(key)
+        while len(page_cache) > PAGE_CACHE_SIZE:
+            page_cache.popitem(last=False)
+
+
+def get_page_key(job, analysis, filters):
+    return (job.seq, analysis.version) + tuple(
+        tuple(value) if isinstance(value, list) else value for value in filters.values())
+
+
+def render_page(analysis, filters):
+    '''
+    Render dashboard of analysis with report filters, with its ETag and Last-Modified
+    '''
+    return make_page(render_template(
+        'index.html', records=u''.join(generate_html_body(analysis, filters))), analysis)
+
+
+def make_page(html, analysis):
+    return {
+        'html': html,
+        'etag': hashlib.sha1(html.encode('utf-8')).hexdigest(),
+        'last_modified': analysis.updated_at,
+    }
+
+
+def generate_html_body(analysis, filters={}):
 
     html_body = []
     # header
     html_body.append(
         "<h1>Market Abuse Detection</h1>")
-    start_date = analysis.start_date
-    end_date = analysis.end_date
+    start_date = filters.get('start_date') or analysis.start_date
+    end_date = filters.get('end_date') or analysis.end_date
     html_body.append(
         "<h4><em>{} - {}</em></h4>".format(start_date, end_date))
+    if filters.get('stock_symbols'):
+        html_body.append(
+            "<h4>{}</h4>".format(escape(', '.join(filters['stock_symbols']))))
     # title for table suspicious traders
     html_body.append("<br><h3>Suspicious Traders Ranking</h1>")
-    # table suspicious traders
-    suspicious_traders = analysis.count_suspicious_per_trader()
-    html_body.append(suspicious_traders.to_html())
+    # table suspicious traders, traders link to their suspicious trades
+    suspicious_traders = analysis.count_suspicious_per_trader(**filters)
+    suspicious_traders['traderId'] = [
+        get_trades_link(trader_id, '/traders/', filters, name=name)
+        for trader_id, name in zip(suspicious_traders.traderId, suspicious_traders.name)]
+    suspicious_traders['name'] = [escape(name) for name in suspicious_traders.name]
+    html_body.append(suspicious_traders.to_html(escape=False))
     # title for table suspicious trades by country
     html_body.append("<br><h3>Suspicious Trades By Country</h1>")
     # table suspicious trades by country
-    country_monthly = analysis.count_suspicious_by_country_per_month()
-    html_body.append(country_monthly.to_html())
+    country_monthly = analysis.count_suspicious_by_country_per_month(**filters)
+    country_monthly.index = country_monthly.index.map(
+        lambda country: get_trades_link(country, '/countries/', filters))
+    html_body.append(country_monthly.to_html(escape=False))
 
     return html_body
+
+
+def get_trades_link(value, path, filters, **args):
+    '''
+    HTML link to the suspicious trades of a trader or country (path), in the date range of the report filters
+    '''
+    query = urlencode({key: arg for key, arg in dict(
+        start=filters.get('start_date'), end=filters.get('end_date'), **args).items() if arg})
+    url = path + quote(str(value), safe='') + ('?' + query if query else '')
+    return '<a href="{}">{}</a>'.format(escape(url), escape(value))
+
+
+stream_detector = start_stream_detector(int(STREAM_PORT)) if STREAM_PORT else None
+start()
@@ -0,0 +1,86 @@
+'''
+Benchmark: memory of manipulated traders data per trade, compact model (text columns as category)
+against text columns as one python string per row (previous model), on generated data
+
+python -m benchmarks.bench_memory --sizes 100000,1000000,10000000
+
+Target: at most BYTES_PER_TRADE_TARGET bytes per trade in the manipulated data frame
+(1 byte codes for countryCode, stockSymbol and stockName, 2 to 4 bytes codes for traderId and name,
+8 bytes each for price, tradeDate, High and Low)
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from detector.cache import PriceCache
+from detector.manipulator import Manipulator
+from benchmarks.generator import generate_traders_data, prefill_cache
+
+BYTES_PER_TRADE_TARGET = 48
+# text columns stored as category
+TEXT_COLUMNS = ['countryCode', 'name', 'traderId', 'stockSymbol', 'stockName']
+
+
+def bytes_per_trade(df):
+    '''
+    (pandas DataFrame) -> pandas Series
+
+    Memory per trade of each column, including python strings
+    '''
+    return df.memory_usage(index=False, deep=True) / len(df)
+
+
+def as_strings(df):
+    '''
+    (pandas DataFrame) -> pandas DataFrame
+
+    Text columns as one python string per row, as before the compact model
+    '''
+    # deep memory usage counts the python string of each row, shared or not
+    return df.assign(**{column: df[column].astype(object) for column in TEXT_COLUMNS})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='100000,1000000',
+                        help='comma separated numbers of trades')
+    parser.add_argument('--traders', type=int, default=10000)
+    parser.add_argument('--symbols', type=int, default=50)
+    args = parser.parse_args()
+
+    print('{:>12} {:>14} {:>14} {:>10} {:>10}'.format(
+        'trades', 'compact B/row', 'strings B/row', 'peak MB', 'seconds'))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in [int(size) for size in args.sizes.split(',')]:
+            filename = os.path.join(tmp_dir, 'traders.csv')
+            stocks_data_df = generate_traders_data(
+                filename, size, args.symbols, args.traders)
+            price_cache = PriceCache(os.path.join(tmp_dir, 'cache.sqlite'))
+            prefill_cache(price_cache, stocks_data_df,
+                          '2020-01-01', '2020-12-31')
+            price_cache.offline = True
+
+            tracemalloc.start()
+            start = time.perf_counter()
+            manipulated = Manipulator(
+                filename, [], price_cache).manipulate()
+            seconds = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            compact = bytes_per_trade(manipulated)
+            strings = bytes_per_trade(as_strings(manipulated))
+            print('{:>12,} {:>14.1f} {:>14.1f} {:>10.0f} {:>10.2f}'.format(
+                size, compact.sum(), strings.sum(), peak / 2 ** 20, seconds))
+            print('    per column (compact / strings): ' + ', '.join(
+                '{} {:.1f} / {:.1f}'.format(column, compact[column], strings[column]) for column in compact.index))
+            if compact.sum() > BYTES_PER_TRADE_TARGET:
+                print('    above target of {} bytes per trade'.format(
+                    BYTES_PER_TRADE_TARGET))
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+'''
+Benchmark: Reader, Manipulator, Analysis and Flask render stages on generated traders data,
+compared against a stored baseline
+
+python -m benchmarks.bench_pipeline --sizes 10000,1000000,100000000 --baseline benchmarks/baseline.json
+python -m benchmarks.bench_pipeline --sizes 10000,1000000 --save-baseline benchmarks/baseline.json
+
+Each stage runs in a new process, so its peak RSS is not affected by other stages.
+Generated files are kept in --data-dir and reused by later runs with the same parameters.
+Exit code is 1 if throughput drops or peak RSS grows by more than --tolerance against the baseline,
+or if analysis results differ from the baseline
+'''
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from detector.cache import PriceCache
+from detector.profiler import Profiler
+from benchmarks.generator import generate_traders_data, prefill_cache
+
+STAGES = ['reader', 'manipulator', 'analysis', 'render']
+
+
+def prepare_data(data_dir, rows, args):
+    '''
+    (str, int, argparse.Namespace) -> Tuple (str, str)
+
+    Generate traders data csv file and stocks data cache, if not generated before
+    '''
+    params = [rows, args.symbols, args.traders, args.countries, args.start, args.end,
+              args.null_rate, args.out_of_range_rate, args.non_trading_day_rate, args.seed]
+    key = hashlib.sha1(json.dumps(params).encode()).hexdigest()[:10]
+    filename = os.path.join(data_dir, 'traders_{}_{}.csv'.format(rows, key))
+    cache_file = os.path.join(data_dir, 'price_cache_{}.sqlite'.format(key))
+    if not (os.path.exists(filename) and os.path.exists(cache_file)):
+        stocks_data_df = generate_traders_data(
+            filename + '.tmp', *params)
+        prefill_cache(PriceCache(cache_file, max_rows=max(
+            1000000, stocks_data_df.size)), stocks_data_df, args.start, args.end)
+        os.replace(filename + '.tmp', filename)
+    return filename, cache_file
+
+
+def run_stage(stage, filename, cache_file, chunksize=None, engine=None, workers=None):
+    '''
+    (str, str, str, int, str, int) -> dict
+
+    Run one stage in this process: seconds, rows out, peak RSS and checksum of results
+    '''
+    from detector.analysis import Analysis
+    from detector.manipulator import Manipulator
+    from detector.reader import Reader
+    from detector.schema import TRADERS_COLUMNS, TRADERS_DTYPES
+
+    price_cache = PriceCache(cache_file, offline=True)
+    checksum = None
+    if stage == 'render':
+        # Flask app reads data files from environment variables at import
+        os.environ['TRADERS_DATA_FILE'] = filename
+        os.environ['PRICE_CACHE_FILE'] = cache_file
+        import app
+        # first analysis runs as a background job, render its page only
+        for job in app.jobs.list():
+            app.jobs.wait(job.id)
+        # the job renders the dashboard when it completes: drop it, so the request renders it again
+        with app.page_cache_lock:
+            app.page_cache.clear()
+        client = app.app.test_client()
+    start = time.perf_counter()
+    if stage == 'reader':
+        rows = len(Reader.load_csv_to_df(
+            filename, TRADERS_COLUMNS, TRADERS_DTYPES, engine))
+    elif stage == 'manipulator':
+        manipulator = Manipulator(filename, [], price_cache, chunksize, engine)
+        rows = sum(len(chunk) for chunk in manipulator.manipulate_chunks())
+    elif stage == 'analysis':
+        analysis = Analysis(filename, [], price_cache,
+                            chunksize, engine, workers)
+        traders = analysis.count_suspicious_per_trader()
+        countries = analysis.count_suspicious_by_country_per_month()
+        rows = len(analysis.data)
+        checksum = hashlib.sha1(
+            (traders.to_csv() + countries.to_csv()).encode()).hexdigest()
+    elif stage == 'render':
+        html = client.get('/').data
+        rows = len(html)
+        checksum = hashlib.sha1(html).hexdigest()
+    seconds = time.perf_counter() - start
+    return {'seconds': seconds, 'rows': rows, 'max_rss_bytes': Profiler.max_rss(), 'checksum': checksum}
+
+
+def measure(stage, size, filename, cache_file, args):
+    '''
+    (str, int, str, str, argparse.Namespace) -> dict
+
+    Run stage in a new process, throughput in traders data rows per second
+    '''
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        result = executor.submit(run_stage, stage, filename, cache_file,
+                                 args.chunksize, args.engine, args.workers).result()
+    result['rows_per_second'] = size / result['seconds']
+    return result
+
+
+def compare(results, baseline, tolerance):
+    '''
+    (dict, dict, float) -> list
+
+    Regressions of results against baseline:
+    throughput lower or peak RSS higher by more than tolerance, or different results
+    '''
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if result['rows_per_second'] < base['rows_per_second'] * (1 - tolerance):
+            regressions.append('{}: throughput {:,.0f} rows/s, baseline {:,.0f}'.format(
+                key, result['rows_per_second'], base['rows_per_second']))
+        if result['max_rss_bytes'] > base['max_rss_bytes'] * (1 + tolerance):
+            regressions.append('{}: peak RSS {:,.0f} MB, baseline {:,.0f} MB'.format(
+                key, result['max_rss_bytes'] / 2 ** 20, base['max_rss_bytes'] / 2 ** 20))
+        if base.get('checksum') and result['checksum'] != base['checksum']:
+            regressions.append('{}: results differ from baseline'.format(key))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000,1000000',
+                        help='comma separated numbers of trades, 10000 to 100000000')
+    parser.add_argument('--stages', default=','.join(STAGES),
+                        help='comma separated stages: {}'.format(', '.join(STAGES)))
+    parser.add_argument('--symbols', type=int, default=50)
+    parser.add_argument('--traders', type=int, default=10000)
+    parser.add_argument('--countries', type=int, default=30)
+    parser.add_argument('--start', default='2020-01-01')
+    parser.add_argument('--end', default='2020-12-31')
+    parser.add_argument('--null-rate', type=float, default=0.01)
+    parser.add_argument('--out-of-range-rate', type=float, default=0.05)
+    parser.add_argument('--non-trading-day-rate', type=float, default=0.02)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunksize', type=int)
+    parser.add_argument('--engine', choices=['c', 'pyarrow'])
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--data-dir', default='benchmark_data',
+                        help='directory of generated files')
+    parser.add_argument('--baseline', help='baseline json file to compare with')
+    parser.add_argument('--save-baseline', help='save results to json file')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    stages = args.stages.split(',')
+    results = {}
+    print('{:>12} {:>12} {:>10} {:>14} {:>10}'.format(
+        'trades', 'stage', 'seconds', 'rows/s', 'peak MB'))
+    for size in [int(size) for size in args.sizes.split(',')]:
+        filename, cache_file = prepare_data(args.data_dir, size, args)
+        for stage in stages:
+            result = measure(stage, size, filename, cache_file, args)
+            results['{}/{}'.format(stage, size)] = result
+            print('{:>12,} {:>12} {:>10.2f} {:>14,.0f} {:>10,.0f}'.format(
+                size, stage, result['seconds'], result['rows_per_second'], result['max_rss_bytes'] / 2 ** 20))
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print('REGRESSION ' + regression)
+        if regressions:
+            sys.exit(1)
+        print('No regression against {}'.format(args.baseline))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+'''
+Benchmark: join traders data with stocks data by pandas merge (previous implementation)
+against PriceIndex lookup, on synthetic trades
+
+python -m benchmarks.bench_price_lookup --sizes 1000000,10000000,50000000
+'''
+import argparse
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from detector.price_index import PriceIndex
+
+
+def make_data(n_trades, n_symbols=50, seed=0):
+    '''
+    (int, int, int) -> Tuple of pandas DataFrame (traders data, stocks data)
+
+    Synthetic processed traders data and stocks data over one year,
+    trades on any day (including non trading days)
+    '''
+    rng = np.random.default_rng(seed)
+    symbols = ['S{:03d}'.format(i) for i in range(n_symbols)]
+    days = pd.bdate_range('2020-01-01', '2020-12-31')
+    stocks_data_df = pd.DataFrame({
+        'Symbols': pd.Categorical(np.repeat(symbols, len(days))),
+        'Date': np.tile(days.values, n_symbols),
+        'High': rng.uniform(110, 120, n_symbols * len(days)),
+        'Low': rng.uniform(80, 90, n_symbols * len(days)),
+    })
+    all_days = pd.date_range('2020-01-01', '2020-12-31').values
+    traders_data_df = pd.DataFrame({
+        'stockSymbol': pd.Categorical.from_codes(rng.integers(0, n_symbols, n_trades), symbols),
+        'tradeDate': all_days[rng.integers(0, len(all_days), n_trades)],
+        'price': rng.uniform(70, 130, n_trades),
+    })
+    return traders_data_df, stocks_data_df
+
+
+def merge_join(traders_data_df, stocks_data_df):
+    '''
+    Previous implementation: left merge on (stockSymbol, tradeDate) = (Symbols, Date)
+    '''
+    joined_df = pd.merge(traders_data_df, stocks_data_df, left_on=[
+                         'stockSymbol', 'tradeDate'], right_on=['Symbols', 'Date'], how='left')
+    return joined_df.Date.isnull() | (joined_df.price > joined_df.High) | (joined_df.price < joined_df.Low)
+
+
+def index_lookup(traders_data_df, stocks_data_df):
+    '''
+    PriceIndex: build index, then vectorised searchsorted lookup
+    '''
+    price_index = PriceIndex(stocks_data_df)
+    return price_index.is_suspicious(traders_data_df.stockSymbol, traders_data_df.tradeDate, traders_data_df.price)
+
+
+def measure(func, *args):
+    '''
+    (function, ...) -> Tuple (result, seconds, peak MB)
+
+    Wall time and peak memory allocated by func
+    '''
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak / 2 ** 20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='1000000,10000000,50000000',
+                        help='comma separated numbers of trades')
+    parser.add_argument('--symbols', type=int, default=50)
+    args = parser.parse_args()
+
+    print('{:>12} {:>10} {:>10} {:>10} {:>10} {:>8} {:>8}'.format(
+        'trades', 'merge s', 'index s', 'merge MB', 'index MB', 'speedup', 'memory'))
+    for size in [int(size) for size in args.sizes.split(',')]:
+        traders_data_df, stocks_data_df = make_data(size, args.symbols)
+        merged, merge_seconds, merge_mb = measure(
+            merge_join, traders_data_df, stocks_data_df)
+        looked_up, index_seconds, index_mb = measure(
+            index_lookup, traders_data_df, stocks_data_df)
+        # same trades flagged either way
+        assert (merged.values == looked_up).all()
+        print('{:>12,} {:>10.2f} {:>10.2f} {:>10.0f} {:>10.0f} {:>7.1f}x {:>7.1f}x'.format(
+            size, merge_seconds, index_seconds, merge_mb, index_mb,
+            merge_seconds / index_seconds, merge_mb / index_mb))
+
+
+if __name__ == '__main__':
+    main()
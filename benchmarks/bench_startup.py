@@ -0,0 +1,113 @@
+'''
+Benchmark: import time of the detector package, and boot time of a Flask server worker
+until its first page is served, with and without analysis snapshot, on generated traders data.
+Also private memory of the worker (anonymous pages, Linux only): data of a snapshot is memory-mapped,
+shared by all workers, so it is not counted
+
+python -m benchmarks.bench_startup --rows 1000000
+
+Each measure runs in a new python process (cold start, as a new worker), median of --repeat runs.
+Target: worker boot with snapshot under BOOT_SECONDS_TARGET seconds, exit code is 1 if above
+'''
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from benchmarks.bench_pipeline import prepare_data
+
+BOOT_SECONDS_TARGET = 1.0
+
+# Code run in a new process, prints seconds from start of the process script and private MB,
+# exits without waiting for background jobs
+CHILD = '''
+import os
+import time
+start = time.perf_counter()
+{}
+seconds = time.perf_counter() - start
+private = float('nan')
+if os.path.exists('/proc/self/smaps_rollup'):
+    with open('/proc/self/smaps_rollup') as file:
+        private = sum(int(line.split()[1]) for line in file if line.startswith('Anonymous:')) / 1024
+print(seconds, private, flush=True)
+os._exit(0)
+'''
+BOOT = '''
+import app
+for job in app.jobs.list():
+    app.jobs.wait(job.id)
+assert app.app.test_client().get('/').status_code == 200
+'''
+
+
+def run_python(code, env):
+    '''
+    (str, dict) -> Tuple (float, float, float)
+
+    Run code in a new python process from the repository directory, return seconds measured
+    in the process, private MB and wall seconds including interpreter start
+    '''
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', CHILD.format(code)], env=env, check=True,
+                            capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout
+    seconds, private = output.strip().splitlines()[-1].split()
+    return float(seconds), float(private), time.perf_counter() - start
+
+
+def measure(name, code, env, repeat):
+    '''
+    (str, str, dict, int) -> float
+
+    Print median seconds of repeat runs, return median wall seconds
+    '''
+    results = [run_python(code, env) for _ in range(repeat)]
+    seconds = statistics.median(result[0] for result in results)
+    private = statistics.median(result[1] for result in results)
+    wall = statistics.median(result[2] for result in results)
+    print('{:<36} {:>10.3f} {:>10.3f} {:>12.1f}'.format(name, seconds, wall, private))
+    return wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000, help='number of trades')
+    parser.add_argument('--symbols', type=int, default=50)
+    parser.add_argument('--traders', type=int, default=10000)
+    parser.add_argument('--countries', type=int, default=30)
+    parser.add_argument('--start', default='2020-01-01')
+    parser.add_argument('--end', default='2020-12-31')
+    parser.add_argument('--null-rate', type=float, default=0.01)
+    parser.add_argument('--out-of-range-rate', type=float, default=0.05)
+    parser.add_argument('--non-trading-day-rate', type=float, default=0.02)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--data-dir', default='benchmark_data',
+                        help='directory of generated files')
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    filename, cache_file = prepare_data(args.data_dir, args.rows, args)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        env = dict(os.environ, TRADERS_DATA_FILE=os.path.abspath(filename),
+                   PRICE_CACHE_FILE=os.path.abspath(cache_file))
+        snapshot_env = dict(env, ANALYSIS_SNAPSHOT=os.path.join(tmp_dir, 'snapshots'))
+        # first boot runs the analysis and writes the snapshot
+        run_python(BOOT, snapshot_env)
+
+        print('{:<36} {:>10} {:>10} {:>12}'.format('{:,} trades'.format(args.rows), 'seconds', 'wall',
+                                                   'private MB'))
+        measure('import detector.analysis', 'import detector.analysis', env, args.repeat)
+        measure('import app (analysis in background)', 'import app', env, args.repeat)
+        measure('boot to first page, analysis', BOOT, env, args.repeat)
+        boot = measure('boot to first page, snapshot', BOOT, snapshot_env, args.repeat)
+    if boot > BOOT_SECONDS_TARGET:
+        print('Worker boot with snapshot above target of {} seconds'.format(BOOT_SECONDS_TARGET))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
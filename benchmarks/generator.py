@@ -0,0 +1,179 @@
+'''
+Seeded generator of synthetic traders data csv files and matching daily stocks data,
+same format as traders_data.csv and yahoo
+
+python -m benchmarks.generator traders_1m.csv --rows 1000000 --cache price_cache.sqlite
+'''
+import argparse
+import string
+import numpy as np
+import pandas as pd
+from detector.cache import PriceCache
+
+# Columns of traders data csv files
+COLUMNS = ['countryCode', 'firstName', 'lastName', 'traderId', 'stockSymbol',
+           'stockName', 'tradeId', 'price', 'volume', 'tradeDatetime']
+# Columns left empty in rows with missing values
+NULLABLE_COLUMNS = ['countryCode', 'firstName', 'lastName', 'traderId',
+                    'stockSymbol', 'price', 'tradeDatetime']
+FIRST_NAMES = ['Anna', 'Boris', 'Chen', 'Dana', 'Emeka', 'Farah', 'Goran', 'Hana',
+               'Ivan', 'Jia', 'Kofi', 'Lena', 'Mateo', 'Nadia', 'Omar', 'Priya']
+LAST_NAMES = ['Green', 'Ivanov', 'Kim', 'Lopez', 'Mensah', 'Novak', 'Okafor',
+              'Petrov', 'Quinn', 'Rossi', 'Sato', 'Tanaka', 'Usman', 'Weber']
+
+
+def make_symbols(n_symbols):
+    '''
+    (int) -> list
+
+    Stock symbols S000, S001, ...
+    '''
+    return ['S{:03d}'.format(i) for i in range(n_symbols)]
+
+
+def generate_stocks_data(symbols, start_date, end_date, seed=0):
+    '''
+    (list, str, str, int) -> pandas DataFrame
+
+    Daily pricing data of symbols on business days between start_date and end_date,
+    yahoo format: Date index, (Attributes, Symbols) columns.
+    Prices are a random walk per symbol, Low <= Open, Close <= High
+    '''
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(start_date, end_date, name='Date')
+    shape = (len(dates), len(symbols))
+    base = rng.uniform(10, 3000, len(symbols))
+    close = base * np.exp(np.cumsum(rng.normal(0, 0.02, shape), axis=0))
+    open_ = close * np.exp(rng.normal(0, 0.01, shape))
+    high = np.maximum(open_, close) * (1 + rng.uniform(0, 0.03, shape))
+    low = np.minimum(open_, close) * (1 - rng.uniform(0, 0.03, shape))
+    volume = rng.integers(100000, 10000000, shape).astype('float64')
+    columns = pd.MultiIndex.from_product(
+        [['Adj Close', 'Close', 'High', 'Low', 'Open', 'Volume'], symbols], names=['Attributes', 'Symbols'])
+    return pd.DataFrame(np.hstack([close, close, high, low, open_, volume]), index=dates, columns=columns)
+
+
+def generate_traders_data(filename, rows, symbols=50, traders=10000, countries=30,
+                          start_date='2020-01-01', end_date='2020-12-31',
+                          null_rate=0.01, out_of_range_rate=0.05, non_trading_day_rate=0.02,
+                          seed=0, chunksize=1000000):
+    '''
+    (str, int, int, int, int, str, str, float, float, float, int, int) -> pandas DataFrame
+
+    Write a traders data csv file of rows trades, chunk by chunk so memory is bounded by chunksize.
+    Return the matching stocks data (see generate_stocks_data)
+
+    symbols, traders, countries: number of stock symbols, traders and countries
+    null_rate: rate of rows with one empty field
+    out_of_range_rate: rate of trades priced outside of the High / Low range of the day
+    non_trading_day_rate: rate of trades on weekends (no stocks data)
+    Other trades are priced within the range of the day, on business days
+    '''
+    rng = np.random.default_rng(seed)
+    stock_symbols = make_symbols(symbols)
+    stocks_data_df = generate_stocks_data(
+        stock_symbols, start_date, end_date, seed)
+    high = stocks_data_df['High'].values
+    low = stocks_data_df['Low'].values
+    business_days = stocks_data_df.index.values.astype('datetime64[D]')
+    all_days = np.arange(np.datetime64(start_date, 'D'),
+                         np.datetime64(end_date, 'D') + 1)
+    weekend_days = all_days[pd.DatetimeIndex(all_days).dayofweek >= 5]
+
+    # Traders: id, name and country
+    letters = np.array(list(string.ascii_letters))
+    trader_ids = np.array([''.join(chars) for chars in rng.choice(
+        letters, (traders, 20))], dtype=object)
+    first_names = np.array(FIRST_NAMES, dtype=object)[
+        rng.integers(0, len(FIRST_NAMES), traders)]
+    last_names = np.array(LAST_NAMES, dtype=object)[
+        rng.integers(0, len(LAST_NAMES), traders)]
+    # two letter country codes, except NA (read as missing value)
+    country_codes = np.array([a + b for a in string.ascii_uppercase for b in string.ascii_uppercase
+                              if a + b != 'NA'], dtype=object)
+    country_codes = country_codes[rng.choice(
+        len(country_codes), countries, replace=False)]
+    trader_countries = country_codes[rng.integers(0, countries, traders)]
+    stock_names = np.array(['Stock {}'.format(symbol)
+                           for symbol in stock_symbols], dtype=object)
+
+    for first in range(0, rows, chunksize):
+        n = min(chunksize, rows - first)
+        trader = rng.integers(0, traders, n)
+        symbol = rng.integers(0, symbols, n)
+        day = rng.integers(0, len(business_days), n)
+        trade_days = business_days[day]
+        off_day = rng.random(n) < non_trading_day_rate
+        if len(weekend_days):
+            trade_days = np.where(off_day, weekend_days[rng.integers(
+                0, len(weekend_days), n)], trade_days)
+        # price within the range of the day, or up to 10% above High / below Low
+        day_high, day_low = high[day, symbol], low[day, symbol]
+        price = day_low + rng.random(n) * (day_high - day_low)
+        out_of_range = rng.random(n) < out_of_range_rate
+        above = rng.random(n) < 0.5
+        price = np.where(out_of_range & above, day_high *
+                         (1.001 + rng.random(n) * 0.1), price)
+        price = np.where(out_of_range & ~above, day_low *
+                         (0.999 - rng.random(n) * 0.1), price)
+        seconds = rng.integers(0, 86400, n).astype('timedelta64[s]')
+        trade_datetime = np.char.replace(np.datetime_as_string(
+            trade_days + seconds, unit='s'), 'T', ' ').astype(object)
+        df = pd.DataFrame({
+            'countryCode': trader_countries[trader],
+            'firstName': first_names[trader],
+            'lastName': last_names[trader],
+            'traderId': trader_ids[trader],
+            'stockSymbol': np.array(stock_symbols, dtype=object)[symbol],
+            'stockName': stock_names[symbol],
+            'tradeId': ['T{:09d}'.format(i) for i in range(first, first + n)],
+            'price': price.round(2),
+            'volume': rng.integers(1, 1000, n).astype('float64'),
+            'tradeDatetime': trade_datetime,
+        }, columns=COLUMNS)
+        # one empty field in null_rate of rows
+        nulls = np.flatnonzero(rng.random(n) < null_rate)
+        null_columns = rng.integers(0, len(NULLABLE_COLUMNS), len(nulls))
+        for i, column in enumerate(NULLABLE_COLUMNS):
+            df.loc[nulls[null_columns == i], column] = None
+        df.to_csv(filename, mode='w' if first == 0 else 'a',
+                  header=first == 0, index=False)
+    return stocks_data_df
+
+
+def prefill_cache(price_cache, stocks_data_df, start_date, end_date):
+    '''
+    (PriceCache, pandas DataFrame, str, str) -> NoneType
+
+    Store generated stocks data in a local cache as fetched for start_date - end_date,
+    so analysis runs without network
+    '''
+    price_cache.store(stocks_data_df, start_date, end_date)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('filename', help='traders data csv file to write')
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--symbols', type=int, default=50)
+    parser.add_argument('--traders', type=int, default=10000)
+    parser.add_argument('--countries', type=int, default=30)
+    parser.add_argument('--start', default='2020-01-01')
+    parser.add_argument('--end', default='2020-12-31')
+    parser.add_argument('--null-rate', type=float, default=0.01)
+    parser.add_argument('--out-of-range-rate', type=float, default=0.05)
+    parser.add_argument('--non-trading-day-rate', type=float, default=0.02)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--cache', help='local stocks data cache file (sqlite) to fill with matching stocks data')
+    args = parser.parse_args()
+
+    stocks_data_df = generate_traders_data(
+        args.filename, args.rows, args.symbols, args.traders, args.countries, args.start, args.end,
+        args.null_rate, args.out_of_range_rate, args.non_trading_day_rate, args.seed)
+    if args.cache:
+        prefill_cache(PriceCache(args.cache, max_rows=max(
+            1000000, stocks_data_df.size)), stocks_data_df, args.start, args.end)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+'''
+Command line interface
+
+python -m detector analyse traders_data.csv --symbols AMZN,FB --profile
+python -m detector analyse traders_data.csv --rules all --volume-ratio 0.2
+python -m detector analyse 'trades/*.csv.gz'
+python -m detector analyse traders_data.csv --database trades.sqlite
+python -m detector convert traders_data.csv traders_parquet
+python -m detector stream --input-format csv < new_trades.csv
+'''
+import argparse
+import asyncio
+import json
+import sys
+import pandas as pd
+from .analysis import Analysis
+from .cache import PriceCache
+from .profiler import profiler
+from .providers import get_price_provider
+from .reader import Reader
+from .rules import RULES, RuleSet
+from .stream import StreamDetector, read_stdin, serve
+from .writer import Writer
+
+
+def get_parser():
+    '''
+    () -> argparse.ArgumentParser
+
+    Parser of command line arguments
+    '''
+    parser = argparse.ArgumentParser(prog='python -m detector',
+                                     description='Market abuse detection')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    analyse = commands.add_parser(
+        'analyse', help='print suspicious traders ranking and suspicious trades by country')
+    analyse.add_argument('filename', nargs='+',
+                         help='traders data file, or csv files: directories, glob patterns (quoted) or files, '
+                         'compressed or not, read concurrently and without duplicate tradeId')
+    analyse.add_argument('--symbols', default='',
+                         help='comma separated stock symbols, all stocks if not provided')
+    analyse.add_argument('--cache', help='local stocks data cache file (sqlite)')
+    analyse.add_argument('--prices', help='stocks data source: yahoo (default), '
+                         'directory of <SYMBOL>.csv / <SYMBOL>.parquet files or url template with {symbol}, {start} and {end}')
+    analyse.add_argument('--chunksize', type=int,
+                         help='stream traders data in chunks of CHUNKSIZE rows')
+    analyse.add_argument('--engine', choices=['c', 'pyarrow'], help='csv parser engine')
+    analyse.add_argument('--workers', type=int,
+                         help='number of processes, data partitioned by stock symbol')
+    analyse.add_argument('--rules',
+                         help='comma separated rules flagging suspicious records, all for all rules: {} '
+                         '(default: not_trading_day,price_out_of_range)'.format(','.join(RULES)))
+    analyse.add_argument('--volume-ratio', type=float, default=0.1,
+                         help='large_volume: share of the market volume of the day')
+    analyse.add_argument('--move', type=float, default=0.05,
+                         help='cluster_before_move: close price change on the next trading day (0.05 is 5%%)')
+    analyse.add_argument('--cluster-size', type=int, default=3,
+                         help='cluster_before_move: trades of the trader in the stock in the day')
+    analyse.add_argument('--database',
+                         help='sqlite database file: analyse traders data in the database, out of memory')
+    analyse.add_argument('--output', help='write suspicious records and reports to directory')
+    analyse.add_argument('--format', choices=['parquet', 'ipc'], default='parquet',
+                         help='file format of --output')
+    analyse.add_argument('--profile', action='store_true',
+                         help='print time, rows and memory of each pipeline stage')
+    analyse.add_argument('--trace-memory', action='store_true',
+                         help='with --profile, measure peak memory allocated in each stage (slower)')
+
+    convert = commands.add_parser(
+        'convert', help='convert traders data csv file to Parquet / Arrow IPC files partitioned by stock symbol and month')
+    convert.add_argument('filename', help='traders data csv file')
+    convert.add_argument('directory', help='output directory')
+    convert.add_argument('--format', choices=['parquet', 'ipc'], default='parquet')
+
+    stream = commands.add_parser(
+        'stream', help='flag suspicious trades of a live feed (standard input or TCP port), print alerts as JSON lines')
+    stream.add_argument('--input-format', choices=['json', 'csv'], default='json',
+                        help='one trade per line, JSON object or csv row (first line is the header)')
+    stream.add_argument('--port', type=int,
+                        help='accept trade feeds on TCP port instead of standard input, alerts are also sent back')
+    stream.add_argument('--host', default='127.0.0.1', help='address to listen on with --port')
+    stream.add_argument('--symbols', default='',
+                        help='comma separated stock symbols, all stocks if not provided')
+    stream.add_argument('--cache', help='local stocks data cache file (sqlite)')
+    stream.add_argument('--prices', help='stocks data source, same as analyse --prices')
+    stream.add_argument('--batch-size', type=int, default=1000,
+                        help='maximum number of trades flagged together')
+    stream.add_argument('--batch-timeout', type=float, default=0,
+                        help='seconds to wait for more trades before flagging a batch')
+    stream.add_argument('--refresh-interval', type=float, default=300,
+                        help='seconds before High / Low of today (and days without stocks data) are fetched again')
+    return parser
+
+
+def get_stock_symbols(args):
+    '''
+    (argparse.Namespace) -> list
+
+    Stock symbols of --symbols
+    '''
+    return [symbol.strip() for symbol in args.symbols.split(',') if symbol.strip()]
+
+
+def get_rules(args):
+    '''
+    (argparse.Namespace) -> RuleSet
+
+    Rules of --rules with their parameters, default rules if not provided
+    '''
+    names = None
+    if args.rules == 'all':
+        names = 'all'
+    elif args.rules:
+        names = [name.strip() for name in args.rules.split(',') if name.strip()]
+    return RuleSet(names, args.volume_ratio, args.move, args.cluster_size)
+
+
+def get_price_cache(args):
+    '''
+    (argparse.Namespace) -> PriceProvider
+
+    Price provider of --prices, behind a local cache if --cache
+    '''
+    price_provider = get_price_provider(args.prices)
+    return PriceCache(args.cache, provider=price_provider) if args.cache else price_provider
+
+
+def analyse(args):
+    '''
+    (argparse.Namespace) -> NoneType
+
+    Run analysis and print reports, and profiling report if required
+    '''
+    profiler.enabled = args.profile
+    profiler.trace_memory = args.trace_memory
+    filename = args.filename[0] if len(args.filename) == 1 else args.filename
+    analysis = Analysis(filename, get_stock_symbols(args), get_price_cache(args),
+                        args.chunksize, args.engine, args.workers, get_rules(args), args.database)
+    print("Suspicious Traders Ranking ({} - {})".format(
+        analysis.start_date, analysis.end_date))
+    print(analysis.count_suspicious_per_trader().to_string())
+    print()
+    print("Suspicious Trades By Country")
+    print(analysis.count_suspicious_by_country_per_month().to_string())
+    if args.rules:
+        print()
+        print("Suspicious Records By Rule")
+        print(analysis.count_suspicious_per_rule().to_string())
+    if args.output:
+        analysis.write_results(args.output, args.format)
+    if args.profile:
+        print()
+        print("Profile")
+        with pd.option_context('display.width', 200, 'display.max_columns', None):
+            print(profiler.report().to_string())
+
+
+def convert(args):
+    '''
+    (argparse.Namespace) -> NoneType
+
+    Convert traders data csv file to columnar files, all columns as read from csv
+    '''
+    Writer.write_dataset(Reader.load_csv_to_df(
+        args.filename), args.directory, args.format)
+
+
+def stream(args):
+    '''
+    (argparse.Namespace) -> NoneType
+
+    Flag trades from standard input until its end (or from TCP connections until interrupted),
+    print alerts as JSON lines, and counts and latency to standard error at the end
+    '''
+    detector = StreamDetector(get_stock_symbols(args), get_price_cache(args),
+                              args.batch_size, args.batch_timeout, args.refresh_interval)
+
+    def print_alert(alert):
+        print(json.dumps(alert), flush=True)
+    try:
+        asyncio.run(run_stream(detector, args, print_alert))
+    except KeyboardInterrupt:
+        pass
+    print(json.dumps(detector.stats()), file=sys.stderr)
+
+
+async def run_stream(detector, args, on_alert):
+    '''
+    (StreamDetector, argparse.Namespace, callable) -> NoneType
+    '''
+    if args.port:
+        server = await serve(detector, args.host, args.port, on_alert, args.input_format)
+        async with server:
+            await server.serve_forever()
+    else:
+        await detector.run(read_stdin(), on_alert, args.input_format)
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    if args.command == 'analyse':
+        analyse(args)
+    elif args.command == 'convert':
+        convert(args)
+    elif args.command == 'stream':
+        stream(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,14 @@
+from .database import CHUNKSIZE, TradesDatabase
 from .manipulator import Manipulator
+from .profiler import profiler
+from .reader import Reader
+from .rules import RuleSet
+from .schema import concat_frames, find_duplicate_trades
+from .writer import FILE_EXTENSIONS, Writer
+from datetime import datetime, timezone
+import json
+import os
+import numpy as np
 import pandas as pd
 
 
@@ -8,72 +18,465 @@ class Analysis():
 
     - count_suspicious_per_trader()
     - count_suspicious_by_country_per_month()
+    - top_suspicious_traders(k, days)
+    - trader_trades(trader_id), country_trades(country)
+    - count_suspicious_per_rule()
+    - append(trades)
+    - write_results(directory)
+    - save(path), Analysis.load(path)
     '''
 
-    def __init__(self, filename, stock_symbols=[]):
+    def __init__(self, filename, stock_symbols=[], price_cache=None, chunksize=None, engine=None, workers=None,
+                 rules=None, database=None):
         '''
-        (str, list) -> NoneType
+        (str or list, list, PriceCache, int, str, int, RuleSet or list, str) -> NoneType
 
         Get suspicious data
+        filename: traders data file, or csv files (directory, glob pattern or list, compressed or not)
+        read concurrently, trades read twice dropped (see Manipulator)
+        price_cache: optional local cache of stocks data
+        chunksize: stream traders data in chunks of chunksize rows, only suspicious records are kept in memory
+        engine: csv parser engine, 'c' (default) or 'pyarrow'
+        workers: number of processes to join and flag data partitioned by stock symbol (not used if streaming)
+        rules: rules flagging suspicious records, RuleSet or names of rules (see detector.rules),
+        not a trading date and price out of the day range if not provided
+        database: sqlite database file (replaced): traders data is written to it in chunks (of chunksize rows,
+        CHUNKSIZE by default) with stocks data, suspicious records and counts are computed by SQL queries,
+        suspicious records are read when data is accessed (see detector.database, workers not used)
         '''
         self.stock_symbols = stock_symbols
-        self.data = self.__get_data_for_analysis(
+        self.price_cache = price_cache
+        self.chunksize = chunksize
+        self.engine = engine
+        self.workers = workers
+        self.rules = rules if isinstance(rules, RuleSet) else RuleSet(rules)
+        self.database = database
+        self.__database = TradesDatabase(database) if database else None
+        # Categories of countryCode and stockSymbol in all manipulated data
+        self.__categories = {'countryCode': set(), 'stockSymbol': set()}
+        # Countries trading each stock symbol in all manipulated data
+        self.__symbol_countries = {}
+        # Suspicious records sorted by stock symbol and trade date, built on first select()
+        self.__selection_index = None
+        # Suspicious counts per trader and day, built on first top_suspicious_traders()
+        self.__trader_day_index = None
+        # Batches appended since data or manipulated were last accessed
+        self.__new_data = []
+        self.__new_manipulated = []
+        # Suspicious records, counts per trader and per country and month, counts updated by append()
+        self.__data, self.__trader_counts, self.__country_month_counts = self.__get_data_for_analysis(
             filename)
+        # Suspicious records grouped by trader and by country, batches merged by append() (not with database)
+        self.__drill_down_index = None if self.__database is not None else self.__get_drill_down_index(self.__data)
+        # Version of the data analysed, increased by append()
+        self.version = 1
+        self.updated_at = datetime.now(timezone.utc)
+
+    @property
+    def data(self):
+        '''
+        () -> pandas DataFrame
+
+        Suspicious records, including appended batches
+        '''
+        if self.__data is None:
+            # read from database on first access
+            self.__data = self.__concat_with_categories([self.__database.read_suspicious()])
+        if self.__new_data:
+            self.__data = self.__concat_with_categories(
+                [self.__data] + self.__new_data)
+            self.__new_data = []
+        return self.__data
+
+    @property
+    def manipulated(self):
+        '''
+        () -> pandas DataFrame
+
+        Manipulated data, including appended batches (None if streaming)
+        '''
+        if self.__new_manipulated:
+            self.__manipulated = self.__concat_with_categories(
+                [self.__manipulated] + self.__new_manipulated)
+            self.__new_manipulated = []
+        return self.__manipulated
 
     def __get_data_for_analysis(self, filename):
         '''
-        (str) -> pandas DataFrame
+        (str) -> Tuple (pandas DataFrame, pandas Series, pandas DataFrame)
 
-        Keep suspicious records, start date and end date from manipulated data
+        Keep suspicious records and their counts, start date and end date from manipulated data
         '''
-        self.__get_manipulated_data(filename)
-        suspicious = self.__get_suspicious(self.manipulated)
-        return suspicious
+        manipulator = self.__get_manipulator(filename)
+        if self.__database is not None:
+            # Out of core: manipulated data is not kept, suspicious records and counts are computed in the database
+            self.__manipulated = None
+            return self.__get_suspicious_from_database(manipulator)
+        if self.chunksize:
+            # Streaming: manipulated data is not kept, only suspicious records of each chunk
+            self.__manipulated = None
+            if 'cluster_before_move' in self.rules.names:
+                # clusters can span chunks, count them in all chunks before flagging
+                for chunk in manipulator.manipulate_chunks():
+                    self.rules.count_clusters(chunk)
+            suspicious = self.__get_suspicious_from_chunks(
+                manipulator.manipulate_chunks())
+            # appended batches are counted on their own, as in other modes
+            self.rules.cluster_counts = None
+        elif self.workers and self.workers > 1:
+            # Parallel: manipulated data is not kept, suspicious records and counts come from worker processes
+            self.__manipulated = None
+            return self.__get_suspicious_by_symbol(manipulator)
+        else:
+            self.__get_manipulated_data(manipulator)
+            suspicious = self.__get_suspicious(self.__manipulated, self.rules)
+        return suspicious, self.__count_suspicious_per_trader(suspicious), self.__count_suspicious_per_country_month(suspicious)
 
-    def __get_manipulated_data(self, filename):
+    def __get_suspicious_by_symbol(self, manipulator):
         '''
-        (str)
+        (Manipulator) -> Tuple (pandas DataFrame, pandas Series, pandas DataFrame)
 
-        Get manipulated data
+        Join and flag data of each stock symbol in worker processes, then merge
+        suspicious records (in original order) and add up counts of all partitions.
+        Trades of a tradeId can be in several partitions: duplicates are found on all traders data
+        before partitioning
+        '''
+        # imports multiprocessing, only needed with workers
+        from concurrent.futures import ProcessPoolExecutor
+
+        traders_data_df = manipulator.traders_data_df
+        self.__update_categories(traders_data_df)
+        duplicates, trade_keys = None, self.rules.trade_keys
+        if 'duplicate_trade' in self.rules.names:
+            duplicates, trade_keys = find_duplicate_trades(traders_data_df.tradeId, self.rules.trade_keys)
+            duplicates = pd.Series(duplicates, index=traders_data_df.index)
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(Analysis._analyse_partition, partition_df, stocks_data_df, self.rules,
+                                       None if duplicates is None else duplicates[partition_df.index].values)
+                       for partition_df, stocks_data_df in manipulator.partition_by_symbol()]
+            results = [future.result() for future in futures]
+        suspicious = pd.concat([result[0]
+                                for result in results]).sort_index()
+        trader_counts = pd.concat([result[1] for result in results]).groupby(
+            level=['traderId', 'name']).sum()
+        country_month_counts = pd.concat([result[2] for result in results]).groupby(
+            level='countryCode').sum().fillna(0).astype('int64').sort_index(axis=1)
+        # tradeIds of all partitions, for duplicates of appended trades
+        self.rules.trade_keys = trade_keys
+        return suspicious, trader_counts, country_month_counts
+
+    def __get_suspicious_from_database(self, manipulator):
+        '''
+        (Manipulator) -> Tuple (NoneType, pandas Series, pandas DataFrame)
+
+        Write traders data chunk by chunk and stocks data to the database, then flag suspicious records
+        and count them with SQL queries. Suspicious records are not read (None)
+        '''
+        self.__database.create()
+        for chunk in manipulator.iter_traders_data():
+            self.__update_categories(chunk)
+            self.__database.write_trades(chunk)
+        self.__database.write_bars(manipulator.get_stocks_data())
+        self.__database.flag_suspicious(self.rules)
+        return None, self.__database.count_suspicious_per_trader(), self.__database.count_suspicious_per_country_month()
+
+    @staticmethod
+    def _analyse_partition(traders_data_df, stocks_data_df, rules, duplicates=None):
         '''
-        manipulator = Manipulator(filename, self.stock_symbols)
+        (pandas DataFrame, pandas DataFrame, RuleSet, numpy array) -> Tuple (pandas DataFrame, pandas Series, pandas DataFrame)
+
+        Run in worker process (not name mangled so it can be pickled):
+        join and flag data of one stock symbol, count suspicious per trader and per country and month.
+        All trades of the stock symbol are in the partition, so clusters of cluster_before_move are counted
+        as in the whole data. duplicates: records of the partition flagged by duplicate_trade, found on
+        all traders data. Each worker gets a copy of rules, tradeIds of other partitions are not
+        seen by duplicate_trade
+        '''
+        # rules is a copy of the rules of the analysis
+        rules.duplicates = duplicates
+        manipulated = Manipulator.join_stocks_data(
+            traders_data_df, stocks_data_df, rules.stocks_columns)
+        suspicious = Analysis.__get_suspicious(manipulated, rules)
+        return (suspicious, Analysis.__count_suspicious_per_trader(suspicious),
+                Analysis.__count_suspicious_per_country_month(suspicious))
+
+    def __get_manipulator(self, filename):
+        '''
+        (str) -> Manipulator
+
+        Get manipulator of traders data, and date range from data
+        '''
+        chunksize = (self.chunksize or CHUNKSIZE) if self.__database is not None else self.chunksize
+        manipulator = Manipulator(
+            filename, self.stock_symbols, self.price_cache, chunksize, self.engine, self.rules)
         # Get date range from data
         self.start_date = manipulator.trading_start_date
         self.end_date = manipulator.trading_end_date
+        return manipulator
+
+    def __get_manipulated_data(self, manipulator):
+        '''
+        (Manipulator)
+
+        Get manipulated data
+        '''
         # Get cleaned and transformed data
-        self.manipulated = manipulator.manipulate()
+        self.__manipulated = manipulator.manipulate()
+        self.__update_categories(self.__manipulated)
+
+    def __get_suspicious_from_chunks(self, chunks):
+        '''
+        (generator of pandas DataFrame) -> pandas DataFrame
+
+        Keep suspicious data of each manipulated chunk.
+        Categories of countryCode and stockSymbol are collected from all chunks,
+        same as the categories of the whole manipulated data
+        '''
+        suspicious = []
+        for chunk in chunks:
+            self.__update_categories(chunk)
+            suspicious.append(self.__get_suspicious(chunk, self.rules))
+        return self.__concat_with_categories(suspicious)
+
+    def __update_categories(self, data):
+        '''
+        (pandas DataFrame) -> NoneType
+
+        Add countryCode and stockSymbol values of manipulated data to known categories,
+        and countries to known countries of each stock symbol
+        '''
+        for column, values in self.__categories.items():
+            values.update(data[column].dropna().unique())
+        pairs = data[['stockSymbol', 'countryCode']].dropna().drop_duplicates()
+        for symbol, country in pairs.itertuples(index=False, name=None):
+            self.__symbol_countries.setdefault(symbol, set()).add(country)
+
+    def __concat_with_categories(self, frames):
+        '''
+        (list of pandas DataFrame) -> pandas DataFrame
+
+        Concatenate data frames, countryCode and stockSymbol as category of all known values
+        '''
+        data = concat_frames(frames)
+        for column, values in self.__categories.items():
+            data[column] = pd.Categorical(
+                data[column], categories=sorted(values))
+        return data
 
     @staticmethod
-    def __get_suspicious(data):
+    @profiler.profile('analysis.flag_suspicious')
+    def __get_suspicious(data, rules):
         '''
-        (pandas DataFrame) -> pandas DataFrame
+        (pandas DataFrame, RuleSet) -> pandas DataFrame
 
-        Keep suspicious data, add suspicious column with value 1
+        Keep suspicious data, add flags column (bitmask of the rules flagging the record)
+        and suspicious column with value 1
         '''
-        # Mark suspicious
-        # 1. Not a trading date for the stock - missing Data values from yahoo
+        # Mark suspicious: all rules evaluated together, by default
+        # 1. Not a trading date for the stock - missing High / Low values from yahoo
         # 2. Price is outside of the trading price range in the day
-
-        # Series of true or false
-        suspicious = data.Date.isnull() | (
-            data.price > data.High) | (data.price < data.Low)
+        flags = rules.evaluate(data)
+        suspicious = flags != 0
         # Filter data by suspicious
         data = data[suspicious]
-        # Create new column suspicious and put value as 1
-        data.loc[:, 'suspicious'] = 1
+        data['flags'] = flags[suspicious]
+        # Create new column suspicious and put value as 1 (also if no record is suspicious)
+        data['suspicious'] = 1
         return data
 
-    def count_suspicious_per_trader(self):
+    def append(self, trades):
         '''
-        () -> pandas DataFrame
+        (pandas DataFrame) -> pandas DataFrame
 
-        List suspicious trades by traders in descending order (return pandas data frame)
+        Analyse a new batch of traders data (same columns as the csv file)
+        and add it to the results without recomputing previous data.
+        Only the date range and stocks of the batch are fetched from yahoo, and only the counts of the traders,
+        countries and months of the batch are updated (new ones are added to the counts, which copies them).
+        Suspicious records of the batch are merged into the drill-down index (inserted, not sorted again).
+        Costs in proportion to all suspicious records: inserting into the drill-down index, and once after
+        an append, suspicious records of the batch are concatenated to data on first access, and the selection
+        and trader-day indexes are built again on the first select() and top_suspicious_traders().
+        Return suspicious records of the batch
+        '''
+        manipulator = Manipulator(
+            trades, self.stock_symbols, self.price_cache, rules=self.rules)
+        manipulated = manipulator.manipulate()
+        suspicious = self.__get_suspicious(manipulated, self.rules)
+        # Keep date range current
+        self.start_date = min(self.start_date, manipulator.trading_start_date)
+        self.end_date = max(self.end_date, manipulator.trading_end_date)
+        # Keep batch, concatenated with previous data when accessed
+        self.__update_categories(manipulated)
+        if self.__manipulated is not None:
+            self.__new_manipulated.append(manipulated)
+        if self.__database is not None:
+            self.__database.write_suspicious(suspicious)
+        if self.__drill_down_index is not None:
+            self.__merge_drill_down_index(suspicious)
+        # with database, suspicious records not read yet are read with the batch
+        if self.__data is not None:
+            self.__new_data.append(suspicious)
+        self.version += 1
+        self.updated_at = datetime.now(timezone.utc)
+        # Add batch counts to the counts of previous data
+        self.__add_trader_counts(self.__count_suspicious_per_trader(suspicious))
+        self.__add_country_month_counts(self.__count_suspicious_per_country_month(suspicious))
+        return suspicious
+
+    def __add_trader_counts(self, trader_counts):
+        '''
+        (pandas Series) -> NoneType
+
+        Add counts of a batch to the counts per trader in place, new traders are added at the end (not sorted)
+        '''
+        positions = self.__trader_counts.index.get_indexer(trader_counts.index)
+        known = positions >= 0
+        self.__trader_counts.iloc[positions[known]] += trader_counts.values[known]
+        if not known.all():
+            self.__trader_counts = pd.concat([self.__trader_counts, trader_counts[~known]])
+
+    def __add_country_month_counts(self, country_month_counts):
+        '''
+        (pandas DataFrame) -> NoneType
+
+        Add counts of a batch to the counts per country and month in place,
+        new countries and months are added at the end (not sorted)
+        '''
+        counts = self.__country_month_counts
+        rows = counts.index.get_indexer(country_month_counts.index)
+        columns = counts.columns.get_indexer(country_month_counts.columns)
+        if (rows < 0).any() or (columns < 0).any():
+            counts = counts.reindex(index=counts.index.append(country_month_counts.index[rows < 0]),
+                                    columns=counts.columns.append(country_month_counts.columns[columns < 0]),
+                                    fill_value=0)
+            rows = counts.index.get_indexer(country_month_counts.index)
+            columns = counts.columns.get_indexer(country_month_counts.columns)
+        counts.iloc[rows, columns] = counts.iloc[rows, columns].values + country_month_counts.values
+        self.__country_month_counts = counts
+
+    @classmethod
+    @profiler.profile('analysis.count_per_trader')
+    def __count_suspicious_per_trader(cls, data):
+        '''
+        (pandas DataFrame) -> pandas Series
+
+        Sum suspicious trades group by trader
+        '''
+        return cls.__group_suspicious_data(data, ['traderId', 'name'])
+
+    @staticmethod
+    @profiler.profile('analysis.count_per_country_month')
+    def __count_suspicious_per_country_month(data):
+        '''
+        (pandas DataFrame) -> pandas DataFrame
+
+        Sum suspicious trades by country (rows) and month (columns) in one pass:
+        each record is counted in cell (country code, month number) of a flat matrix.
+        Only countries with suspicious trades, all months between the first and last month
+        '''
+        countries = pd.Categorical(data.countryCode)
+        valid = (countries.codes >= 0) & ~np.isnat(data.tradeDate.values)
+        codes = countries.codes[valid].astype('int64')
+        days = data.tradeDate.values[valid].astype('datetime64[D]').astype('int64')
+        months = np.empty(0, dtype='int64')
+        if len(days):
+            # month numbers since 1970-01 (same as ordinals of monthly periods),
+            # looked up in a table of the days in range, faster than converting each date
+            first_day = days.min()
+            months = np.arange(first_day, days.max() + 1).astype('datetime64[D]').astype(
+                'datetime64[M]').astype('int64')[days - first_day]
+        first = months.min() if len(months) else 0
+        span = months.max() - first + 1 if len(months) else 0
+        # suspicious is 1 for every record, so the sum is the count
+        counts = np.bincount(codes * span + (months - first), minlength=len(countries.categories) * span).reshape(
+            len(countries.categories), span)
+        observed = counts.sum(axis=1) > 0
+        return pd.DataFrame(counts[observed],
+                            index=pd.Index(countries.categories[observed].astype(object), name='countryCode'),
+                            columns=pd.period_range(pd.Period(ordinal=int(first), freq='M'),
+                                                    periods=span, freq='M', name='month'))
+
+    def __get_selection_index(self):
+        '''
+        () -> dict
+
+        Positions of suspicious records sorted by stock symbol and trade date:
+        - symbols: stock symbols (categories), code is position
+        - order: positions of records in data, sorted by symbol code and day
+        - days: day numbers of sorted records
+        - bounds: records of symbol code i are order[bounds[i]:bounds[i + 1]]
+        Rebuilt when data version changes
         '''
-        # sum suspicious trades group by trader and sort in descending order
-        grouped = self.__group_suspicious_data(
-            self.data, ['traderId', 'name'])
+        if self.__selection_index is None or self.__selection_index['version'] != self.version:
+            data = self.data
+            symbols = pd.Categorical(data.stockSymbol)
+            codes = symbols.codes
+            days = data.tradeDate.values.astype(
+                'datetime64[D]').astype('int32')
+            order = np.lexsort((days, codes))
+            self.__selection_index = {
+                'version': self.version,
+                'symbols': symbols.categories,
+                'order': order,
+                'days': days[order],
+                'bounds': np.searchsorted(codes[order], np.arange(len(symbols.categories) + 1)),
+            }
+        return self.__selection_index
 
-        grouped = grouped.sort_values(ascending=False)
+    @profiler.profile('analysis.select')
+    def select(self, stock_symbols=None, countries=None, start_date=None, end_date=None):
+        '''
+        (list, list, str, str) -> pandas DataFrame
+
+        Suspicious records of stock symbols and countries, with trade date between start_date and end_date (YYYY-MM-DD),
+        no filter on None.
+        Records of each stock symbol within the date range are found by binary search on the selection index,
+        so the cost is in proportion to the records selected
+        '''
+        index = self.__get_selection_index()
+        if stock_symbols:
+            codes = index['symbols'].get_indexer(stock_symbols)
+            codes = np.unique(codes[codes >= 0])
+        else:
+            codes = range(len(index['symbols']))
+        start_day = np.datetime64(start_date, 'D').astype(
+            'int64') if start_date else None
+        end_day = np.datetime64(end_date, 'D').astype(
+            'int64') if end_date else None
+        positions = []
+        for code in codes:
+            lo, hi = index['bounds'][code], index['bounds'][code + 1]
+            days = index['days'][lo:hi]
+            first = np.searchsorted(days, start_day, 'left') if start_day is not None else 0
+            last = np.searchsorted(days, end_day, 'right') if end_day is not None else len(days)
+            positions.append(index['order'][lo + first:lo + last])
+        # keep original order of records
+        positions = np.sort(np.concatenate(positions)) if positions else np.array([], dtype='int64')
+        data = self.data.iloc[positions]
+        if countries:
+            data = data[data.countryCode.isin(countries)]
+        return data
+
+    @profiler.profile('analysis.report_traders')
+    def count_suspicious_per_trader(self, stock_symbols=None, countries=None, start_date=None, end_date=None):
+        '''
+        (list, list, str, str) -> pandas DataFrame
+
+        List suspicious trades by traders in descending order (return pandas data frame)
+        Optionally only trades of stock symbols, countries and between start_date and end_date, see select()
+        '''
+        if not (stock_symbols or countries or start_date or end_date):
+            counts = self.__trader_counts
+            # traders added by append() are not sorted, ties are ranked in order of traders
+            if not counts.index.is_monotonic_increasing:
+                counts = counts.sort_index()
+        elif self.__database is not None:
+            counts = self.__database.count_suspicious_per_trader(stock_symbols, countries, start_date, end_date)
+        else:
+            counts = self.__count_suspicious_per_trader(self.select(
+                stock_symbols, countries, start_date, end_date))
+        # suspicious trades counted by trader, sort in descending order
+        grouped = counts.sort_values(ascending=False)
         # convert to data frame
         data = grouped.to_frame().reset_index()
         # index starts from 1
@@ -82,52 +485,400 @@ class Analysis():
         data.index.name = "rank"
         return data
 
-    def count_suspicious_by_country_per_month(self):
+    def __get_trader_day_index(self):
+        '''
+        () -> dict
+
+        Suspicious counts per (trader, day), sorted by day:
+        - traders: data frame of traderId and name, sorted, code is position
+        - days: day numbers (days since 1970-01-01)
+        - traders_codes: trader code of each (trader, day)
+        - counts: suspicious trades of each (trader, day)
+        Records without trader name are not counted, same as count_suspicious_per_trader().
+        Rebuilt when data version changes
+        '''
+        if self.__trader_day_index is None or self.__trader_day_index['version'] != self.version:
+            data = self.data
+            trader_ids = pd.Categorical(data.traderId)
+            names = pd.Categorical(data.name)
+            valid = (trader_ids.codes >= 0) & (names.codes >= 0)
+            # distinct (traderId, name) pairs of codes, and pair of each record
+            pairs, trader_codes = np.unique(trader_ids.codes[valid].astype(
+                'int64') * len(names.categories) + names.codes[valid], return_inverse=True)
+            traders = pd.DataFrame({
+                'traderId': trader_ids.categories.astype(object)[pairs // len(names.categories)],
+                'name': names.categories.astype(object)[pairs % len(names.categories)]})
+            # trader codes in order of traderId and name
+            order = np.lexsort((traders.name.values, traders.traderId.values))
+            rank = np.empty(len(order), dtype='int64')
+            rank[order] = np.arange(len(order))
+            days = data.tradeDate.values[valid].astype('datetime64[D]').astype('int64')
+            # distinct (day, trader) keys, sorted by day
+            keys, counts = np.unique(days * len(order) + rank[trader_codes], return_counts=True)
+            self.__trader_day_index = {
+                'version': self.version,
+                'traders': traders.iloc[order].reset_index(drop=True),
+                'days': keys // max(len(order), 1),
+                'trader_codes': keys % max(len(order), 1),
+                'counts': counts,
+            }
+        return self.__trader_day_index
+
+    @profiler.profile('analysis.top_traders')
+    def top_suspicious_traders(self, k=50, days=None, end_date=None):
+        '''
+        (int, int, str) -> pandas DataFrame
+
+        Top k traders by suspicious trades in the last days (rolling window) up to end_date (YYYY-MM-DD,
+        last trade date if not provided), all data if days is not provided.
+        Same columns as count_suspicious_per_trader(), ties ranked by traderId and name.
+        The window is found by binary search on the (trader, day) index, and the top k traders
+        are selected without sorting all traders
+        '''
+        if k < 1 or (days is not None and days < 1):
+            raise ValueError("k and days must be positive")
+        index = self.__get_trader_day_index()
+        n_traders = len(index['traders'])
+        end_day = np.datetime64(end_date or self.end_date, 'D').astype('int64')
+        last = np.searchsorted(index['days'], end_day, 'right')
+        first = np.searchsorted(index['days'], end_day - days + 1, 'left') if days else 0
+        counts = np.bincount(index['trader_codes'][first:last], weights=index['counts'][first:last],
+                             minlength=n_traders).astype('int64')
+        # one key per trader: count descending, then trader order
+        keys = counts * n_traders + (n_traders - 1 - np.arange(n_traders))
+        top = np.flatnonzero(counts)
+        if len(top) > k:
+            top = top[np.argpartition(-keys[top], k - 1)[:k]]
+        top = top[np.argsort(-keys[top])]
+        data = index['traders'].iloc[top].assign(suspicious=counts[top]).reset_index(drop=True)
+        data.index += 1
+        data.index.name = "rank"
+        return data
+
+    @staticmethod
+    def __group_positions(values, days):
+        '''
+        (pandas Series, numpy array) -> dict
+
+        Positions of records grouped by value, each group sorted by day then original order:
+        - keys: values (categories), code is position
+        - order: positions of records in data, sorted by code and day (missing values first)
+        - codes, days: codes and day numbers of sorted records
+        - bounds: records of code i are order[bounds[i]:bounds[i + 1]]
+        '''
+        keys = pd.Categorical(values)
+        codes = keys.codes
+        order = np.lexsort((days, codes))
+        return {
+            'keys': keys.categories,
+            'order': order,
+            'codes': codes[order],
+            'days': days[order],
+            'bounds': np.searchsorted(codes[order], np.arange(len(keys.categories) + 1)),
+        }
+
+    @staticmethod
+    def __merge_positions(index, values, days, offset):
+        '''
+        (dict, pandas Series, numpy array, int) -> dict
+
+        Index of __group_positions() with records of a batch at positions offset and after in data:
+        new values are added to keys (not sorted), records of the batch are inserted after the records
+        of the same value and day, so the index is the same as built from data with the batch
+        '''
+        batch_keys = pd.Categorical(values)
+        positions = index['keys'].get_indexer(batch_keys.categories)
+        keys = index['keys'].append(batch_keys.categories[positions < 0])
+        positions[positions < 0] = np.arange(len(index['keys']), len(keys))
+        codes = np.where(batch_keys.codes >= 0, positions[batch_keys.codes], -1)
+        order = np.lexsort((days, codes))
+        codes, days = codes[order], days[order]
+
+        def sort_keys(codes, days):
+            return codes.astype('int64') << 32 | (days.astype('int64') - np.iinfo('int32').min)
+        where = np.searchsorted(sort_keys(index['codes'], index['days']), sort_keys(codes, days), 'right')
+        codes = np.insert(index['codes'], where, codes)
+        return {
+            'keys': keys,
+            'order': np.insert(index['order'], where, order + offset),
+            'codes': codes,
+            'days': np.insert(index['days'], where, days),
+            'bounds': np.searchsorted(codes, np.arange(len(keys) + 1)),
+        }
+
+    @classmethod
+    @profiler.profile('analysis.drill_down_index')
+    def __get_drill_down_index(cls, data):
+        '''
+        (pandas DataFrame) -> dict
+
+        Positions of suspicious records grouped by traderId and by countryCode (see __group_positions)
+        - size: number of suspicious records
+        '''
+        days = data.tradeDate.values.astype('datetime64[D]').astype('int32')
+        return {
+            'size': len(data),
+            'traderId': cls.__group_positions(data.traderId, days),
+            'countryCode': cls.__group_positions(data.countryCode, days),
+        }
+
+    def __merge_drill_down_index(self, suspicious):
+        '''
+        (pandas DataFrame) -> NoneType
+
+        Merge suspicious records of a batch, appended to data, into the drill-down index
+        '''
+        index = self.__drill_down_index
+        days = suspicious.tradeDate.values.astype('datetime64[D]').astype('int32')
+        self.__drill_down_index = {
+            'size': index['size'] + len(suspicious),
+            'traderId': self.__merge_positions(index['traderId'], suspicious.traderId, days, index['size']),
+            'countryCode': self.__merge_positions(index['countryCode'], suspicious.countryCode, days, index['size']),
+        }
+
+    def __drill_down(self, column, value, name=None, start_date=None, end_date=None, offset=0, limit=None):
+        '''
+        (str, str, str, str, str, int, int) -> Tuple (pandas DataFrame, int)
+
+        Page of suspicious records with value in column, sorted by trade date, and the number of records.
+        The records of value within the date range are found by binary search on the drill-down index,
+        only the records of the page are read from data
+        '''
+        index = self.__drill_down_index[column]
+        code = index['keys'].get_indexer([value])[0]
+        if code < 0:
+            return self.data.iloc[:0], 0
+        lo, hi = index['bounds'][code], index['bounds'][code + 1]
+        days = index['days'][lo:hi]
+        first = np.searchsorted(days, np.datetime64(start_date, 'D').astype('int64'), 'left') if start_date else 0
+        last = np.searchsorted(days, np.datetime64(end_date, 'D').astype('int64'), 'right') if end_date else len(days)
+        positions = index['order'][lo + first:lo + last]
+        if name is not None:
+            positions = positions[self.data.name.values[positions] == name]
+        end = len(positions) if limit is None else offset + limit
+        return self.data.iloc[positions[offset:end]], len(positions)
+
+    @profiler.profile('analysis.trader_trades')
+    def trader_trades(self, trader_id, name=None, start_date=None, end_date=None, offset=0, limit=None):
+        '''
+        (str, str, str, str, int, int) -> Tuple (pandas DataFrame, int)
+
+        Suspicious records of a trader (and name if provided, as ranked by count_suspicious_per_trader())
+        between start_date and end_date (YYYY-MM-DD), sorted by trade date: limit records (all if not provided)
+        from offset, and the number of records of the trader.
+        The cost is in proportion to the records of the trader, not to data
+        '''
+        if offset < 0 or (limit is not None and limit < 0):
+            raise ValueError("offset and limit must not be negative")
+        if self.__database is not None:
+            return self.__database.read_suspicious_page(
+                trader_id=trader_id, name=name, start_date=start_date, end_date=end_date, offset=offset, limit=limit)
+        return self.__drill_down('traderId', trader_id, name, start_date, end_date, offset, limit)
+
+    @profiler.profile('analysis.country_trades')
+    def country_trades(self, country, start_date=None, end_date=None, offset=0, limit=None):
+        '''
+        (str, str, str, int, int) -> Tuple (pandas DataFrame, int)
+
+        Suspicious records of a country, same as trader_trades()
+        '''
+        if offset < 0 or (limit is not None and limit < 0):
+            raise ValueError("offset and limit must not be negative")
+        if self.__database is not None:
+            return self.__database.read_suspicious_page(
+                country=country, start_date=start_date, end_date=end_date, offset=offset, limit=limit)
+        return self.__drill_down('countryCode', country, None, start_date, end_date, offset, limit)
+
+    def count_suspicious_per_rule(self):
         '''
         () -> pandas DataFrame
 
+        Suspicious records flagged by each rule evaluated (a record can be flagged by several rules)
+        '''
+        flags = self.data['flags'].values
+        data = pd.DataFrame({
+            'rule': self.rules.names,
+            'description': [rule.description for rule in self.rules.rules],
+            'suspicious': [int(np.count_nonzero(flags >> rule.bit & 1)) for rule in self.rules.rules]})
+        return data.set_index('rule')
+
+    @profiler.profile('analysis.report_countries')
+    def count_suspicious_by_country_per_month(self, stock_symbols=None, countries=None, start_date=None, end_date=None):
+        '''
+        (list, list, str, str) -> pandas DataFrame
+
         List suspicious trades by country per month (return pandas data frame)
+        Optionally only trades of stock symbols, countries and between start_date and end_date, see select()
         '''
-        # sum suspicious trades group by tradeDate and country and sort in descending order
-        grouped = self.__group_suspicious_data(
-            self.data, ['tradeDate', 'countryCode'])
-        # Group data monthly
-        monthly = self.__group_suspicious_data(grouped.to_frame(), [pd.Grouper(
-            level='tradeDate', freq='M'), pd.Grouper(level='countryCode')])
-        # Pivot the months
-        data = monthly.to_frame().unstack(level='tradeDate')
+        if not (stock_symbols or countries or start_date or end_date):
+            counts = self.__country_month_counts
+        elif self.__database is not None:
+            counts = self.__database.count_suspicious_per_country_month(stock_symbols, countries, start_date, end_date)
+        else:
+            counts = self.__count_suspicious_per_country_month(self.select(
+                stock_symbols, countries, start_date, end_date))
+        # all known countries (trading the selected stock symbols, if any, and selected countries only),
+        # all months between the first and last month with suspicious trades
+        countries = sorted(self.__get_countries(stock_symbols, countries))
+        months = pd.period_range(
+            counts.columns.min(), counts.columns.max(), freq='M') if not counts.empty else pd.PeriodIndex([], freq='M')
+        data = counts.reindex(index=countries, columns=months, fill_value=0)
         # format data frame headers
         data.columns, data.index = self.__format_country_headers(
-            data.columns, data.index)
+            data.columns, data.index, countries)
         # add total column
-        data['total'] = data.sum(axis=1)
+        data['total'] = data.sum(axis=1).astype('int64')
         # sort data frame by total descending
         data = data.sort_values('total', ascending=False)
         return data
 
+    def write_results(self, directory, file_format='parquet'):
+        '''
+        (str, str) -> NoneType
+
+        Write suspicious records (partitioned by stockSymbol and trade month, see Writer.write_dataset)
+        and both reports to directory, as Parquet or Arrow IPC ('ipc') files:
+        suspicious/, traders.parquet, countries.parquet
+        '''
+        extension = FILE_EXTENSIONS.get(file_format)
+        if extension is None:
+            raise ValueError("Unknown file format {}".format(file_format))
+        os.makedirs(directory, exist_ok=True)
+        Writer.write_dataset(self.data, os.path.join(
+            directory, 'suspicious'), file_format)
+        Writer.write_report(self.count_suspicious_per_trader(), os.path.join(
+            directory, 'traders.' + extension), file_format)
+        Writer.write_report(self.count_suspicious_by_country_per_month(), os.path.join(
+            directory, 'countries.' + extension), file_format)
+
+    @profiler.profile('analysis.save')
+    def save(self, path):
+        '''
+        (str) -> NoneType
+
+        Save the analysis to directory path, loaded back with Analysis.load: suspicious records,
+        manipulated data (if kept) and counts as Arrow IPC files (see Writer.write_frame),
+        dates, version, rules and known categories in analysis.json. Needs pyarrow
+        '''
+        os.makedirs(path, exist_ok=True)
+        Writer.write_frame(self.data, os.path.join(path, 'data.arrow'))
+        if self.manipulated is not None:
+            Writer.write_frame(self.manipulated, os.path.join(path, 'manipulated.arrow'))
+        elif os.path.exists(os.path.join(path, 'manipulated.arrow')):
+            os.remove(os.path.join(path, 'manipulated.arrow'))
+        Writer.write_frame(self.__trader_counts.reset_index(), os.path.join(path, 'traders.arrow'))
+        countries = self.__country_month_counts.reset_index()
+        countries.columns = [str(column) for column in countries.columns]
+        Writer.write_frame(countries, os.path.join(path, 'countries.arrow'))
+        # tradeIds seen so far, so duplicates of appended trades are still flagged after load
+        Writer.write_frame(self.rules.trade_keys, os.path.join(path, 'trade_keys.arrow'))
+        state = {
+            'stock_symbols': list(self.stock_symbols),
+            'chunksize': self.chunksize,
+            'engine': self.engine,
+            'workers': self.workers,
+            'rules': {'names': self.rules.names, 'volume_ratio': self.rules.volume_ratio,
+                      'move': self.rules.move, 'cluster_size': self.rules.cluster_size},
+            'start_date': self.start_date,
+            'end_date': self.end_date,
+            'version': self.version,
+            'updated_at': self.updated_at.isoformat(),
+            'categories': {column: sorted(values) for column, values in self.__categories.items()},
+            'symbol_countries': {symbol: sorted(countries) for symbol, countries in self.__symbol_countries.items()},
+        }
+        with open(os.path.join(path, 'analysis.json'), 'w') as file:
+            json.dump(state, file)
+
+    @classmethod
+    @profiler.profile('analysis.load')
+    def load(cls, path, price_cache=None):
+        '''
+        (str, PriceCache) -> Analysis
+
+        Load an analysis saved with save(), without reading traders data or fetching stocks data.
+        Files are memory-mapped: processes loading the same directory share its pages, except
+        columns pandas copies when it consolidates columns of the same type. Needs pyarrow
+        price_cache: local cache of stocks data, used by append()
+        '''
+        filename = os.path.join(path, 'analysis.json')
+        if not os.path.exists(filename):
+            raise ValueError("No data available")
+        with open(filename) as file:
+            state = json.load(file)
+        analysis = cls.__new__(cls)
+        analysis.stock_symbols = state['stock_symbols']
+        analysis.price_cache = price_cache
+        analysis.chunksize = state['chunksize']
+        analysis.engine = state['engine']
+        analysis.workers = state['workers']
+        analysis.database = None
+        analysis.__database = None
+        rules = state['rules']
+        analysis.rules = RuleSet(rules['names'], rules['volume_ratio'], rules['move'], rules['cluster_size'])
+        analysis.rules.trade_keys = Reader.load_frame(os.path.join(path, 'trade_keys.arrow'))
+        analysis.start_date = state['start_date']
+        analysis.end_date = state['end_date']
+        analysis.__categories = {column: set(values) for column, values in state['categories'].items()}
+        analysis.__symbol_countries = {symbol: set(countries)
+                                       for symbol, countries in state['symbol_countries'].items()}
+        analysis.__selection_index = None
+        analysis.__trader_day_index = None
+        analysis.__new_data = []
+        analysis.__new_manipulated = []
+        analysis.__data = Reader.load_frame(os.path.join(path, 'data.arrow'))
+        analysis.__drill_down_index = analysis.__get_drill_down_index(analysis.__data)
+        filename = os.path.join(path, 'manipulated.arrow')
+        analysis.__manipulated = Reader.load_frame(filename) if os.path.exists(filename) else None
+        traders = Reader.load_frame(os.path.join(path, 'traders.arrow'))
+        # counts are updated in place by append(), not memory-mapped
+        analysis.__trader_counts = traders.set_index(['traderId', 'name']).suspicious.copy()
+        countries = Reader.load_frame(os.path.join(path, 'countries.arrow')).set_index('countryCode')
+        countries.columns = pd.PeriodIndex(countries.columns, freq='M', name='month')
+        analysis.__country_month_counts = countries.copy()
+        analysis.version = state['version']
+        analysis.updated_at = datetime.fromisoformat(state['updated_at'])
+        return analysis
+
+    def __get_countries(self, stock_symbols=None, countries=None):
+        '''
+        (list, list) -> set
+
+        Known countries trading stock symbols (all stock symbols if not provided),
+        within countries if provided
+        '''
+        if stock_symbols:
+            known = set().union(
+                *[self.__symbol_countries.get(symbol, set()) for symbol in stock_symbols])
+        else:
+            known = self.__categories['countryCode']
+        return known.intersection(countries) if countries else known
+
     @staticmethod
     def __group_suspicious_data(data, groupers):
         '''
         (pandas DataFrame, list) -> pandas DataFrameGroupBy
 
-        Group data frame by groupers, and sum suspicious
+        Group data frame by groupers, and sum suspicious.
+        Only groups in data are kept for category groupers, groups are values (not category)
         '''
-        return data.groupby(
-            groupers).suspicious.sum()
+        grouped = data.groupby(
+            groupers, observed=True).suspicious.sum()
+        if isinstance(grouped.index, pd.MultiIndex):
+            grouped.index = pd.MultiIndex.from_arrays(
+                [grouped.index.get_level_values(i).astype(object) for i in range(grouped.index.nlevels)], names=grouped.index.names)
+        # observed groups of several category groupers are not sorted
+        return grouped.sort_index()
 
     @staticmethod
-    def __format_country_headers(columns, index):
+    def __format_country_headers(columns, index, countries):
         '''
-        (pandas Index, pandas Index) -> Tuple of pandas Index
+        (pandas PeriodIndex, pandas Index, list) -> Tuple of pandas Index
 
         Format and remane column headers and index
         '''
-        # drop top level index
-        new_cols = columns.droplevel(0)
         # format headers as YYYY-MM
-        columns = new_cols.map(lambda x: x.strftime('%Y-%m'))
-        # rename column index
-        columns.name = "month"
-        # rename index (row)
-        index.name = "country code"
+        columns = pd.Index(columns.strftime('%Y-%m'), name="month")
+        # index (row) as category of countries, rename
+        index = pd.CategoricalIndex(
+            index, categories=countries, name="country code")
         return columns, index
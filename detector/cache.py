@@ -0,0 +1,303 @@
+from .profiler import profiler
+from .providers import ATTRIBUTES, PriceProvider, YahooProvider
+import sqlite3
+import time
+import pandas as pd
+
+# Cache table columns of daily bar attributes (see ATTRIBUTES)
+COLUMNS = ['adj_close', 'close', 'high', 'low', 'open', 'volume']
+
+
+class PriceCache(PriceProvider):
+    '''
+    On-disk store of stocks daily pricing data in front of
+    a price provider (yahoo by default), keyed by (symbol, date)
+
+    - fetch(stock_syms, start_date, end_date)
+    - store(raw_stocks_data_df, start_date, end_date)
+    - hits, misses
+    - clear()
+    '''
+    EVICTION_POLICIES = ('lru', 'fifo')
+
+    def __init__(self, path='price_cache.sqlite', max_rows=1000000, eviction='lru', offline=False, provider=None):
+        '''
+        (str, int, str, bool, PriceProvider) -> NoneType
+
+        path: sqlite database file
+        max_rows: maximum number of daily bars kept in the cache
+        eviction: 'lru' (least recently used symbol) or 'fifo' (oldest cached symbol)
+        offline: never fetch from provider, only answer from the cache
+        provider: source of data not cached yet, yahoo if not provided
+        '''
+        if eviction not in self.EVICTION_POLICIES:
+            raise ValueError("Unknown eviction policy {}".format(eviction))
+        self.path = path
+        self.max_rows = max_rows
+        self.eviction = eviction
+        self.offline = offline
+        self.provider = provider if provider is not None else YahooProvider()
+        self.hits = 0
+        self.misses = 0
+        self.__create_tables()
+
+    def __connect(self):
+        '''
+        () -> sqlite3 Connection
+
+        Open a connection to the cache database
+        '''
+        return sqlite3.connect(self.path)
+
+    def __create_tables(self):
+        '''
+        () -> NoneType
+
+        Create cache tables if not exist
+        - bars: daily pricing data per symbol and date
+        - ranges: date ranges already fetched per symbol
+        - symbols: access times per symbol for eviction
+        '''
+        with self.__connect() as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS bars (
+                symbol TEXT NOT NULL, date TEXT NOT NULL,
+                adj_close REAL, close REAL, high REAL, low REAL, open REAL, volume REAL,
+                PRIMARY KEY (symbol, date)) WITHOUT ROWID''')
+            conn.execute('''CREATE TABLE IF NOT EXISTS ranges (
+                symbol TEXT NOT NULL, start TEXT NOT NULL, end TEXT NOT NULL)''')
+            conn.execute('''CREATE TABLE IF NOT EXISTS symbols (
+                symbol TEXT PRIMARY KEY, created REAL NOT NULL, accessed REAL NOT NULL)''')
+        conn.close()
+
+    @property
+    def stats(self):
+        '''
+        () -> dict
+
+        Cache counters: hits, misses and number of cached bars
+        '''
+        with self.__connect() as conn:
+            rows = conn.execute('SELECT COUNT(*) FROM bars').fetchone()[0]
+        conn.close()
+        return {'hits': self.hits, 'misses': self.misses, 'rows': rows}
+
+    def clear(self):
+        '''
+        () -> NoneType
+
+        Remove all cached data and reset counters
+        '''
+        with self.__connect() as conn:
+            for table in ('bars', 'ranges', 'symbols'):
+                conn.execute('DELETE FROM {}'.format(table))
+        conn.close()
+        self.hits = 0
+        self.misses = 0
+
+    @profiler.profile('cache.fetch')
+    def fetch(self, stock_syms, start_date, end_date):
+        '''
+        (list, str, str) -> pandas DataFrame
+
+        start_date: YYYY-MM-DD
+        end_date: YYYY-MM-DD
+
+        Get stocks daily pricing data within date range according to stock symbols provided,
+        same format as Reader.fetch_yahoo_stock_data_to_df.
+        Only date ranges not cached yet are fetched from provider
+        '''
+        if isinstance(stock_syms, str):
+            stock_syms = [stock_syms]
+        stock_syms = list(stock_syms)
+        start = pd.Timestamp(start_date)
+        end = pd.Timestamp(end_date)
+
+        with self.__connect() as conn:
+            # Group symbols by missing date ranges, so symbols with the same gaps are fetched together
+            gaps = {}
+            for symbol in stock_syms:
+                symbol_gaps = self.__find_gaps(conn, symbol, start, end)
+                if symbol_gaps:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                for gap in symbol_gaps:
+                    gaps.setdefault(gap, []).append(symbol)
+
+            if not self.offline:
+                for (gap_start, gap_end), symbols in gaps.items():
+                    self.__fetch_gap(conn, symbols, gap_start, gap_end)
+
+            self.__touch(conn, stock_syms)
+            self.__evict(conn, stock_syms)
+            df = self.__read_bars(conn, stock_syms, start, end)
+        conn.close()
+
+        if df.empty:
+            raise ValueError("No data available")
+        return df
+
+    @staticmethod
+    def __find_gaps(conn, symbol, start, end):
+        '''
+        (sqlite3 Connection, str, pandas Timestamp, pandas Timestamp) -> list
+
+        Get date ranges (start, end) within start - end not cached yet for symbol
+        '''
+        ranges = conn.execute(
+            'SELECT start, end FROM ranges WHERE symbol = ? AND end >= ? AND start <= ? ORDER BY start',
+            (symbol, start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d'))).fetchall()
+        gaps = []
+        current = start
+        for range_start, range_end in ranges:
+            range_start = pd.Timestamp(range_start)
+            range_end = pd.Timestamp(range_end)
+            if range_start > current:
+                gaps.append((current, range_start - pd.Timedelta(days=1)))
+            current = max(current, range_end + pd.Timedelta(days=1))
+        if current <= end:
+            gaps.append((current, end))
+        return gaps
+
+    def __fetch_gap(self, conn, symbols, start, end):
+        '''
+        (sqlite3 Connection, list, pandas Timestamp, pandas Timestamp) -> NoneType
+
+        Fetch missing date range from provider and store in cache.
+        Date range is only recorded as cached for symbols the provider returns data for,
+        so a failed fetch is retried next time
+        '''
+        try:
+            raw_stocks_data_df = self.provider.fetch(
+                symbols, start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d'))
+        except ValueError:
+            return
+        self.__store(conn, raw_stocks_data_df, symbols, start, end)
+
+    def store(self, raw_stocks_data_df, start_date, end_date):
+        '''
+        (pandas DataFrame, str, str) -> NoneType
+
+        start_date: YYYY-MM-DD
+        end_date: YYYY-MM-DD
+
+        Store stocks daily pricing data in yahoo format (Date index, (Attributes, Symbols) columns)
+        obtained elsewhere, e.g. a local file, and record the date range as cached for its symbols
+        '''
+        symbols = list(raw_stocks_data_df.columns.unique(level='Symbols'))
+        with self.__connect() as conn:
+            self.__store(conn, raw_stocks_data_df, symbols,
+                         pd.Timestamp(start_date), pd.Timestamp(end_date))
+            self.__touch(conn, symbols)
+            self.__evict(conn, symbols)
+        conn.close()
+
+    def __store(self, conn, raw_stocks_data_df, symbols, start, end):
+        '''
+        (sqlite3 Connection, pandas DataFrame, list, pandas Timestamp, pandas Timestamp) -> NoneType
+
+        Store daily bars of symbols and record start - end as cached for symbols with bars.
+        Days from today on may not be published yet (and the bar of today is not final):
+        if end is today or later, the range is only recorded up to the last bar of the symbol
+        before today, so later days are fetched again
+        '''
+        # Single symbol data from yahoo has no Symbols level on columns
+        if not isinstance(raw_stocks_data_df.columns, pd.MultiIndex):
+            raw_stocks_data_df = pd.concat(
+                {symbols[0]: raw_stocks_data_df}, axis=1).swaplevel(0, 1, axis=1)
+            raw_stocks_data_df.columns.names = ['Attributes', 'Symbols']
+        # unpivot data to one row per symbol and date
+        bars = raw_stocks_data_df.stack(level='Symbols').dropna(how='all')
+        bars = bars.reindex(columns=ATTRIBUTES)
+        rows = [(symbol, date.strftime('%Y-%m-%d'), *(None if pd.isnull(v) else float(v) for v in values))
+                for (date, symbol), values in zip(bars.index, bars.itertuples(index=False))]
+        conn.executemany(
+            'INSERT OR REPLACE INTO bars VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        today = pd.Timestamp.today().normalize()
+        last_dates = pd.Series(bars.index.get_level_values(0), index=bars.index.get_level_values(1))
+        last_dates = last_dates[last_dates < today].groupby(level=0).max()
+        ranges = []
+        for symbol in symbols:
+            symbol_end = end if end < today else last_dates.get(symbol)
+            if symbol not in last_dates.index or symbol_end < start:
+                continue
+            ranges.append((symbol, start.strftime('%Y-%m-%d'), symbol_end.strftime('%Y-%m-%d')))
+        conn.executemany('INSERT INTO ranges VALUES (?, ?, ?)', ranges)
+        for symbol, _, _ in ranges:
+            self.__merge_ranges(conn, symbol)
+
+    @staticmethod
+    def __merge_ranges(conn, symbol):
+        '''
+        (sqlite3 Connection, str) -> NoneType
+
+        Merge overlapping or adjacent cached date ranges of symbol
+        '''
+        ranges = conn.execute(
+            'SELECT start, end FROM ranges WHERE symbol = ? ORDER BY start', (symbol,)).fetchall()
+        merged = []
+        for start, end in ranges:
+            if merged and pd.Timestamp(start) <= pd.Timestamp(merged[-1][1]) + pd.Timedelta(days=1):
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        conn.execute('DELETE FROM ranges WHERE symbol = ?', (symbol,))
+        conn.executemany('INSERT INTO ranges VALUES (?, ?, ?)',
+                         [(symbol, start, end) for start, end in merged])
+
+    @staticmethod
+    def __touch(conn, symbols):
+        '''
+        (sqlite3 Connection, list) -> NoneType
+
+        Update access time of symbols
+        '''
+        now = time.time()
+        conn.executemany('INSERT OR IGNORE INTO symbols VALUES (?, ?, ?)',
+                         [(symbol, now, now) for symbol in symbols])
+        conn.executemany('UPDATE symbols SET accessed = ? WHERE symbol = ?',
+                         [(now, symbol) for symbol in symbols])
+
+    def __evict(self, conn, keep):
+        '''
+        (sqlite3 Connection, list) -> NoneType
+
+        Remove whole symbols from cache until number of bars is within max_rows,
+        least recently used (lru) or oldest cached (fifo) first.
+        Symbols in keep are not removed
+        '''
+        rows = conn.execute('SELECT COUNT(*) FROM bars').fetchone()[0]
+        if rows <= self.max_rows:
+            return
+        order = 'accessed' if self.eviction == 'lru' else 'created'
+        candidates = conn.execute(
+            'SELECT symbol FROM symbols ORDER BY {}'.format(order)).fetchall()
+        for (symbol,) in candidates:
+            if rows <= self.max_rows:
+                break
+            if symbol in keep:
+                continue
+            rows -= conn.execute(
+                'DELETE FROM bars WHERE symbol = ?', (symbol,)).rowcount
+            conn.execute('DELETE FROM ranges WHERE symbol = ?', (symbol,))
+            conn.execute('DELETE FROM symbols WHERE symbol = ?', (symbol,))
+
+    @staticmethod
+    def __read_bars(conn, symbols, start, end):
+        '''
+        (sqlite3 Connection, list, pandas Timestamp, pandas Timestamp) -> pandas DataFrame
+
+        Read cached bars and pivot to yahoo format:
+        Date index, (Attributes, Symbols) columns
+        '''
+        query = 'SELECT symbol, date, {} FROM bars WHERE symbol IN ({}) AND date BETWEEN ? AND ?'.format(
+            ', '.join(COLUMNS), ', '.join('?' * len(symbols)))
+        long_df = pd.read_sql_query(
+            query, conn, params=[*symbols, start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')])
+        if long_df.empty:
+            return pd.DataFrame()
+        long_df.columns = ['Symbols', 'Date'] + ATTRIBUTES
+        long_df.Date = pd.to_datetime(long_df.Date, format='%Y-%m-%d')
+        df = long_df.pivot(index='Date', columns='Symbols', values=ATTRIBUTES)
+        df.columns.names = ['Attributes', 'Symbols']
+        return df.sort_index()
@@ -0,0 +1,288 @@
+'''
+Embedded SQL backend: manipulated data written to a local sqlite database file chunk by chunk,
+join with stocks data, suspicious flagging and counts run as SQL queries in the database,
+so memory is bounded by the chunk size instead of the size of traders data
+
+- TradesDatabase(path)
+- SQL_RULES: rules evaluated in SQL (see detector.rules)
+'''
+from .profiler import profiler
+import os
+import sqlite3
+import numpy as np
+import pandas as pd
+
+# Rows of traders data read and written at a time: rows are inserted as python tuples,
+# about 300 bytes per row
+CHUNKSIZE = 100000
+
+# Text and price columns of manipulated data, stored as read
+TRADES_COLUMNS = ['countryCode', 'name', 'traderId', 'stockSymbol', 'stockName', 'price']
+
+# Condition of each rule on trade t joined with daily bar b (High / Low of the day, missing if not a trading date),
+# same results as the rules on data frames: comparisons with missing values are false
+SQL_RULES = {
+    'not_trading_day': 'b.high IS NULL',
+    'price_out_of_range': 't.price > b.high OR t.price < b.low',
+    'price_at_high_low': 't.price = b.high OR t.price = b.low',
+}
+
+
+class TradesDatabase():
+    '''
+    sqlite database of traders data, stocks data and suspicious records of an analysis
+
+    - create()
+    - write_trades(traders_data_df), write_bars(stocks_data_df)
+    - flag_suspicious(rules)
+    - write_suspicious(data), read_suspicious(), read_suspicious_page()
+    - count_suspicious_per_trader(), count_suspicious_per_country_month()
+
+    Tables:
+    - trades: manipulated traders data, trade date as day number (days since 1970-01-01) and month number
+    - bars: High and Low per stock symbol and day
+    - suspicious: suspicious records with High, Low and flags, indexed on (stockSymbol, tradeDay), traderId
+      and (countryCode, tradeDay)
+    '''
+
+    def __init__(self, path='trades.sqlite'):
+        '''
+        (str) -> NoneType
+
+        path: sqlite database file
+        '''
+        self.path = path
+
+    def __connect(self):
+        '''
+        () -> sqlite3 Connection
+
+        Open a connection to the database. Data can be written again from traders data,
+        so writes are not synced to disk and not journaled
+        '''
+        conn = sqlite3.connect(self.path)
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.execute('PRAGMA journal_mode = OFF')
+        return conn
+
+    def create(self):
+        '''
+        () -> NoneType
+
+        Create empty tables, data of a previous analysis is removed
+        '''
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        columns = '''countryCode TEXT, name TEXT, traderId TEXT, stockSymbol TEXT, stockName TEXT, price REAL,
+                tradeDay INTEGER NOT NULL, tradeMonth INTEGER NOT NULL'''
+        with self.__connect() as conn:
+            conn.execute('CREATE TABLE trades (id INTEGER PRIMARY KEY, {})'.format(columns))
+            conn.execute('''CREATE TABLE bars (
+                symbol TEXT NOT NULL, day INTEGER NOT NULL, high REAL, low REAL,
+                PRIMARY KEY (symbol, day)) WITHOUT ROWID''')
+            conn.execute('''CREATE TABLE suspicious (id INTEGER PRIMARY KEY, {},
+                high REAL, low REAL, flags INTEGER NOT NULL)'''.format(columns))
+            conn.execute('CREATE INDEX suspicious_symbol_day ON suspicious (stockSymbol, tradeDay)')
+            conn.execute('CREATE INDEX suspicious_trader ON suspicious (traderId, name)')
+            conn.execute('CREATE INDEX suspicious_country_day ON suspicious (countryCode, tradeDay)')
+        conn.close()
+
+    @staticmethod
+    def __get_rows(data, columns=[]):
+        '''
+        (pandas DataFrame, list) -> iterator of tuples
+
+        Rows of manipulated data to insert: TRADES_COLUMNS, day and month numbers of tradeDate, and columns.
+        Missing values are inserted as NULL
+        '''
+        dates = data.tradeDate.values
+        values = [data[column].astype(object).values.tolist() for column in TRADES_COLUMNS]
+        values.append(dates.astype('datetime64[D]').astype('int64').tolist())
+        values.append(dates.astype('datetime64[M]').astype('int64').tolist())
+        values.extend(data[column].values.tolist() for column in columns)
+        return zip(*values)
+
+    @profiler.profile('database.write_trades')
+    def write_trades(self, traders_data_df):
+        '''
+        (pandas DataFrame) -> NoneType
+
+        Add manipulated traders data (without stocks data) to trades
+        '''
+        with self.__connect() as conn:
+            conn.executemany('''INSERT INTO trades ({}, tradeDay, tradeMonth)
+                VALUES ({})'''.format(', '.join(TRADES_COLUMNS), ', '.join(['?'] * (len(TRADES_COLUMNS) + 2))),
+                             self.__get_rows(traders_data_df))
+        conn.close()
+
+    @profiler.profile('database.write_bars')
+    def write_bars(self, stocks_data_df):
+        '''
+        (pandas DataFrame) -> NoneType
+
+        Add processed stocks data (Symbols, Date, High and Low) to bars, bars already written are kept
+        '''
+        days = pd.to_datetime(stocks_data_df.Date).values.astype('datetime64[D]').astype('int64')
+        with self.__connect() as conn:
+            conn.executemany('INSERT OR IGNORE INTO bars (symbol, day, high, low) VALUES (?, ?, ?, ?)', zip(
+                stocks_data_df.Symbols.astype(str).tolist(), days.tolist(),
+                stocks_data_df.High.values.tolist(), stocks_data_df.Low.values.tolist()))
+        conn.close()
+
+    @profiler.profile('database.flag_suspicious')
+    def flag_suspicious(self, rules):
+        '''
+        (RuleSet) -> NoneType
+
+        Join trades with bars of the trade date and keep suspicious trades in suspicious, in one query.
+        Only rules of SQL_RULES can be evaluated
+        '''
+        unknown = [name for name in rules.names if name not in SQL_RULES]
+        if unknown:
+            raise ValueError("Rules {} not supported by database".format(unknown))
+        flags = ' + '.join('CASE WHEN {} THEN {} ELSE 0 END'.format(SQL_RULES[rule.name], 1 << rule.bit)
+                           for rule in rules.rules)
+        columns = ', '.join(TRADES_COLUMNS + ['tradeDay', 'tradeMonth'])
+        with self.__connect() as conn:
+            conn.execute('''INSERT INTO suspicious ({columns}, high, low, flags)
+                SELECT * FROM (
+                    SELECT {trade_columns}, b.high, b.low, {flags} AS flags
+                    FROM trades t LEFT JOIN bars b ON b.symbol = t.stockSymbol AND b.day = t.tradeDay
+                    ORDER BY t.id)
+                WHERE flags != 0'''.format(columns=columns, flags=flags, trade_columns=', '.join(
+                't.' + column for column in TRADES_COLUMNS + ['tradeDay', 'tradeMonth'])))
+        conn.close()
+
+    @profiler.profile('database.write_suspicious')
+    def write_suspicious(self, data):
+        '''
+        (pandas DataFrame) -> NoneType
+
+        Add suspicious records (with High, Low and flags), e.g. of an appended batch, after records already written
+        '''
+        with self.__connect() as conn:
+            conn.executemany('''INSERT INTO suspicious ({}, tradeDay, tradeMonth, high, low, flags)
+                VALUES ({})'''.format(', '.join(TRADES_COLUMNS), ', '.join(['?'] * (len(TRADES_COLUMNS) + 5))),
+                             self.__get_rows(data, ['High', 'Low', 'flags']))
+        conn.close()
+
+    @staticmethod
+    def __get_filters(stock_symbols=None, countries=None, start_date=None, end_date=None):
+        '''
+        (list, list, str, str) -> Tuple (str, list)
+
+        Conditions on suspicious records and their parameters, same filters as Analysis.select()
+        '''
+        conditions, parameters = [], []
+        if stock_symbols:
+            conditions.append('stockSymbol IN ({})'.format(', '.join(['?'] * len(stock_symbols))))
+            parameters.extend(stock_symbols)
+        if countries:
+            conditions.append('countryCode IN ({})'.format(', '.join(['?'] * len(countries))))
+            parameters.extend(countries)
+        if start_date:
+            conditions.append('tradeDay >= ?')
+            parameters.append(int(np.datetime64(start_date, 'D').astype('int64')))
+        if end_date:
+            conditions.append('tradeDay <= ?')
+            parameters.append(int(np.datetime64(end_date, 'D').astype('int64')))
+        return ''.join(' AND ' + condition for condition in conditions), parameters
+
+    def __query(self, sql, parameters=[]):
+        '''
+        (str, list) -> list of tuples
+        '''
+        with self.__connect() as conn:
+            rows = conn.execute(sql, parameters).fetchall()
+        conn.close()
+        return rows
+
+    @profiler.profile('database.read_suspicious')
+    def read_suspicious(self):
+        '''
+        () -> pandas DataFrame
+
+        Suspicious records in the order of traders data, same columns and types as Analysis.data
+        '''
+        return self.__read_suspicious('ORDER BY id')
+
+    @profiler.profile('database.read_suspicious_page')
+    def read_suspicious_page(self, trader_id=None, name=None, country=None, start_date=None, end_date=None,
+                             offset=0, limit=None):
+        '''
+        (str, str, str, str, str, int, int) -> Tuple (pandas DataFrame, int)
+
+        Suspicious records of a trader (and name) or of a country between start_date and end_date, sorted by
+        trade date: limit records (all if not provided) from offset, and the number of records.
+        Records are found on the trader and country indexes, same as Analysis.trader_trades()
+        '''
+        filters, parameters = self.__get_filters(
+            countries=[country] if country is not None else None, start_date=start_date, end_date=end_date)
+        if trader_id is not None:
+            filters += ' AND traderId = ?'
+            parameters.append(trader_id)
+        if name is not None:
+            filters += ' AND name = ?'
+            parameters.append(name)
+        total = self.__query('SELECT COUNT(*) FROM suspicious WHERE 1{}'.format(filters), parameters)[0][0]
+        # LIMIT -1 is no limit
+        df = self.__read_suspicious('WHERE 1{} ORDER BY tradeDay, id LIMIT ? OFFSET ?'.format(filters),
+                                    parameters + [-1 if limit is None else limit, offset])
+        return df, total
+
+    def __read_suspicious(self, clauses, parameters=[]):
+        '''
+        (str, list) -> pandas DataFrame
+
+        Suspicious records selected by SQL clauses (WHERE, ORDER BY, LIMIT), same columns and types as Analysis.data
+        '''
+        with self.__connect() as conn:
+            df = pd.read_sql_query('''SELECT {}, tradeDay, high AS High, low AS Low, flags FROM suspicious
+                {}'''.format(', '.join(TRADES_COLUMNS), clauses), conn, params=parameters)
+        conn.close()
+        for column in TRADES_COLUMNS[:-1]:
+            df[column] = df[column].astype('category')
+        df['price'] = df.price.astype('float64')
+        df.insert(TRADES_COLUMNS.index('price') + 1, 'tradeDate',
+                  df.pop('tradeDay').values.astype('datetime64[D]').astype('datetime64[ns]'))
+        df['High'] = df.High.astype('float64')
+        df['Low'] = df.Low.astype('float64')
+        df['flags'] = df['flags'].astype('uint16')
+        df['suspicious'] = 1
+        return df
+
+    @profiler.profile('database.count_per_trader')
+    def count_suspicious_per_trader(self, stock_symbols=None, countries=None, start_date=None, end_date=None):
+        '''
+        (list, list, str, str) -> pandas Series
+
+        Count suspicious records by trader (traderId and name), same as the counts of Analysis
+        '''
+        filters, parameters = self.__get_filters(stock_symbols, countries, start_date, end_date)
+        rows = self.__query('''SELECT traderId, name, COUNT(*) FROM suspicious
+            WHERE traderId IS NOT NULL AND name IS NOT NULL{} GROUP BY traderId, name'''.format(filters), parameters)
+        traders, names, counts = zip(*rows) if rows else ([], [], [])
+        index = pd.MultiIndex.from_arrays([np.array(traders, dtype=object), np.array(names, dtype=object)],
+                                          names=['traderId', 'name'])
+        return pd.Series(np.array(counts, dtype='int64'), index=index, name='suspicious').sort_index()
+
+    @profiler.profile('database.count_per_country_month')
+    def count_suspicious_per_country_month(self, stock_symbols=None, countries=None, start_date=None, end_date=None):
+        '''
+        (list, list, str, str) -> pandas DataFrame
+
+        Count suspicious records by country (rows) and month (columns), same as the counts of Analysis:
+        only countries with suspicious trades, all months between the first and last month
+        '''
+        filters, parameters = self.__get_filters(stock_symbols, countries, start_date, end_date)
+        rows = self.__query('''SELECT countryCode, tradeMonth, COUNT(*) FROM suspicious
+            WHERE countryCode IS NOT NULL{} GROUP BY countryCode, tradeMonth'''.format(filters), parameters)
+        codes, months, counts = (np.array(values) for values in zip(*rows)) if rows else (
+            np.array([], dtype=object), np.array([], dtype='int64'), np.array([], dtype='int64'))
+        index = pd.Index(np.unique(codes).astype(object), name='countryCode')
+        first = months.min() if len(months) else 0
+        span = months.max() - first + 1 if len(months) else 0
+        data = np.zeros((len(index), span), dtype='int64')
+        data[index.get_indexer(codes), months - first] = counts
+        return pd.DataFrame(data, index=index, columns=pd.period_range(
+            pd.Period(ordinal=int(first), freq='M'), periods=span, freq='M', name='month'))
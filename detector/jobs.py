@@ -0,0 +1,193 @@
+'''
+Background jobs: function calls run in a pool of worker threads, tracked by job id
+
+- JobManager.submit(name, function, *args, on_done=None, **kwargs)
+- JobManager.get(job_id)
+- JobManager.list()
+- JobManager.cancel(job_id)
+'''
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import itertools
+import threading
+import uuid
+
+# Job status
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+
+class Job():
+    '''
+    A function call run in background, see JobManager
+    '''
+
+    def __init__(self, seq, name):
+        '''
+        (int, str) -> NoneType
+
+        seq: order of submission, later jobs have greater seq
+        '''
+        self.id = uuid.uuid4().hex
+        self.seq = seq
+        self.name = name
+        self.status = PENDING
+        self.error = None
+        self.cancel_requested = False
+        self.submitted_at = datetime.now(timezone.utc)
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED, CANCELLED)
+
+    def to_dict(self):
+        '''
+        () -> dict
+
+        Job id, name, status, error and times (ISO 8601) as JSON serialisable dict
+        '''
+        return {
+            'id': self.id,
+            'name': self.name,
+            'status': self.status,
+            'error': self.error,
+            'cancel_requested': self.cancel_requested,
+            'submitted_at': self.submitted_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class JobManager():
+    '''
+    Run jobs in a pool of worker threads, keep status of the last max_jobs jobs
+    '''
+
+    def __init__(self, max_workers=1, max_jobs=100):
+        '''
+        (int, int) -> NoneType
+        '''
+        self.max_jobs = max_jobs
+        self.__executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='job')
+        self.__jobs = OrderedDict()
+        self.__seq = itertools.count(1)
+        self.__lock = threading.Lock()
+
+    def submit(self, name, function, *args, on_done=None, **kwargs):
+        '''
+        (str, callable, ..., callable, ...) -> Job
+
+        Run function(*args, **kwargs) in background.
+        on_done(job, result) is called in the worker thread when the function returns,
+        unless the job was cancelled. The job is done (and can not be cancelled) before on_done is called,
+        failed if on_done raises. The result is not kept by the job
+        '''
+        with self.__lock:
+            job = Job(next(self.__seq), name)
+            self.__jobs[job.id] = job
+            self.__trim()
+        job.future = self.__executor.submit(
+            self.__run, job, function, args, kwargs, on_done)
+        return job
+
+    def __run(self, job, function, args, kwargs, on_done):
+        '''
+        (Job, callable, tuple, dict, callable) -> NoneType
+
+        Run job in worker thread, record its status and error
+        '''
+        with self.__lock:
+            if job.cancel_requested:
+                job.status = CANCELLED
+                job.finished_at = datetime.now(timezone.utc)
+                return
+            job.status = RUNNING
+            job.started_at = datetime.now(timezone.utc)
+        try:
+            result = function(*args, **kwargs)
+        except Exception as error:
+            with self.__lock:
+                job.status = FAILED
+                job.error = '{}: {}'.format(type(error).__name__, error)
+                job.finished_at = datetime.now(timezone.utc)
+            return
+        with self.__lock:
+            job.finished_at = datetime.now(timezone.utc)
+            if job.cancel_requested:
+                # running jobs can not be interrupted, their result is discarded
+                job.status = CANCELLED
+                return
+            # finished: cancel requests are rejected from now on, so the result is used
+            job.status = DONE
+        if on_done:
+            try:
+                on_done(job, result)
+            except Exception as error:
+                with self.__lock:
+                    job.status = FAILED
+                    job.error = '{}: {}'.format(type(error).__name__, error)
+
+    def __trim(self):
+        '''
+        () -> NoneType
+
+        Forget the oldest finished jobs beyond max_jobs
+        '''
+        for job_id in [job.id for job in self.__jobs.values() if job.finished][:max(0, len(self.__jobs) - self.max_jobs)]:
+            del self.__jobs[job_id]
+
+    def get(self, job_id):
+        '''
+        (str) -> Job
+
+        Job of job_id, None if unknown
+        '''
+        return self.__jobs.get(job_id)
+
+    def list(self):
+        '''
+        () -> list of Job
+
+        Jobs, most recent first
+        '''
+        with self.__lock:
+            return list(reversed(self.__jobs.values()))
+
+    def cancel(self, job_id):
+        '''
+        (str) -> bool
+
+        Cancel a job: pending jobs do not run, running jobs complete but their result is discarded.
+        Return False if the job is unknown or already finished
+        '''
+        with self.__lock:
+            job = self.__jobs.get(job_id)
+            if job is None or job.finished:
+                return False
+            job.cancel_requested = True
+            if job.status == PENDING and job.future is not None and job.future.cancel():
+                job.status = CANCELLED
+                job.finished_at = datetime.now(timezone.utc)
+        return True
+
+    def wait(self, job_id, timeout=None):
+        '''
+        (str, float) -> Job
+
+        Wait until a job is finished (or timeout seconds), return the job
+        '''
+        job = self.__jobs.get(job_id)
+        if job is not None and job.future is not None:
+            try:
+                job.future.result(timeout)
+            except Exception:
+                pass
+        return job
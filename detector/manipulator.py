@@ -1,4 +1,10 @@
+from .price_index import PriceIndex
+from .profiler import profiler
+from .providers import YahooProvider
 from .reader import Reader
+from .schema import (RULE_DTYPES, TRADERS_COLUMNS, TRADERS_DTYPES, TRADE_DATETIME_FORMAT, concat_frames,
+                     empty_trade_keys, find_duplicate_trades)
+import numpy as np
 import pandas as pd
 
 pd.options.mode.chained_assignment = None
@@ -9,34 +15,187 @@ class Manipulator():
     Data manipulator - clean up and merge data
     '''
 
-    def __init__(self, traders_data_file, stock_symbols=[]):
+    def __init__(self, traders_data_file, stock_symbols=[], price_cache=None, chunksize=None, engine=None, rules=None):
         '''
-        (str, list) -> NoneType
+        (str or list or pandas DataFrame, list, PriceProvider, int, str, RuleSet) -> NoneType
 
-        initialise with traders data
+        initialise with traders data, from csv files, Parquet / Arrow IPC file or partitioned directory
+        (see Writer.write_dataset, only stock symbols selected are read) or data frame with the same columns.
+        csv files: file, directory, glob pattern or list of those, compressed or not (see Reader.get_csv_files).
+        Several files are read concurrently. Trades read twice from files (same tradeId, in one or several files
+        having tradeId) are dropped, the first read is kept
+        price_cache: optional local cache of stocks data (PriceCache) or other price provider (see detector.providers),
+        fetch from yahoo directly if not provided
+        chunksize: stream traders data from csv file in chunks of chunksize rows instead of loading the whole file
+        (csv files only)
+        engine: csv parser engine to load the whole file, 'c' (default) or 'pyarrow'
+        rules: rules evaluated on manipulated data (see detector.rules), the columns they need
+        are read from traders data and added from stocks data
         '''
         self.stock_symbols = stock_symbols
-        # Get traders data
-        self.traders_data_df = self.__get_traders_data_from_csv(
-            traders_data_file)
+        self.price_cache = price_cache
+        self.price_provider = price_cache if price_cache is not None else YahooProvider()
+        self.traders_data_file = traders_data_file
+        self.chunksize = chunksize
+        self.engine = engine
+        # Stocks data indexed by stock symbol and date, fetched once for all passes over the chunks
+        self.__price_index = None
+        # Columns needed by rules, besides the base columns
+        self.traders_columns = rules.traders_columns if rules is not None else []
+        self.stocks_columns = rules.stocks_columns if rules is not None else []
+        self.__columns = TRADERS_COLUMNS + self.traders_columns
+        self.__dtypes = dict(TRADERS_DTYPES, **{column: RULE_DTYPES[column] for column in self.traders_columns})
+        if isinstance(traders_data_file, pd.DataFrame):
+            # Traders data already loaded, e.g. a new batch of trades
+            self.traders_data_df = self.__get_traders_data_from_df(
+                traders_data_file)
+        elif isinstance(traders_data_file, str) and Reader.get_dataset_format(traders_data_file):
+            # Columnar files: read columns needed, of stock symbols selected only
+            self.traders_data_df = self.__get_traders_data_from_dataset(
+                traders_data_file)
+        elif chunksize:
+            # Streaming: only keep date range and stocks list, chunks are read again on manipulate
+            self.traders_data_df = None
+            self.__csv_files = Reader.get_csv_files(traders_data_file)
+            self.__scan_traders_data_from_csv(self.__csv_files)
+        else:
+            # Get traders data
+            self.traders_data_df = self.__get_traders_data_from_csv(
+                Reader.get_csv_files(traders_data_file))
 
-    def __get_traders_data_from_csv(self, traders_data_file):
+    def __get_traders_data_from_csv(self, traders_data_files):
         '''
-        (str) -> pandas DataFrame
+        (list) -> pandas DataFrame
 
-        Get data from csv file and transform
+        Get data from csv files and transform
         '''
-        # Read data from csv file
-        raw_traders_data_df = Reader.load_csv_to_df(traders_data_file)
+        columns, dtypes, optional = self.__get_csv_columns(self.__columns, self.__dtypes)
+        # Read columns needed from csv files with types declared
+        raw_traders_data_df = Reader.load_csv_files_to_df(
+            traders_data_files, columns, dtypes, self.engine, optional)
+        raw_traders_data_df, _ = self.__drop_duplicate_trades(raw_traders_data_df)
         # Return transformed data
-        return self.__process_traders_data(raw_traders_data_df, self.stock_symbols)
+        return self.__process_traders_data(raw_traders_data_df, self.stock_symbols, self.traders_columns)
+
+    @staticmethod
+    def __get_csv_columns(columns, dtypes):
+        '''
+        (list, dict) -> Tuple (list, dict, list)
+
+        Columns to read from csv files, their types and optional columns among them:
+        tradeId is read to drop duplicates if the files have it
+        '''
+        if 'tradeId' not in columns:
+            return columns + ['tradeId'], dict(dtypes, tradeId=RULE_DTYPES['tradeId']), ['tradeId']
+        return columns, dtypes, []
 
     @staticmethod
-    def __process_traders_data(raw_traders_data_df, stock_symbols):
+    def __drop_duplicate_trades(raw_traders_data_df, seen=None):
+        '''
+        (pandas DataFrame, pandas DataFrame) -> Tuple (pandas DataFrame, pandas DataFrame)
+
+        Drop trades with a tradeId already read, e.g. the same trade in several files: hash-based pass,
+        before the data is transformed. seen: tradeIds of previous chunks
+        (see schema.find_duplicate_trades), returned with tradeIds of this data
+        '''
+        with profiler.stage('manipulator.drop_duplicate_trades', len(raw_traders_data_df)) as record:
+            if 'tradeId' in raw_traders_data_df:
+                duplicates, seen = find_duplicate_trades(raw_traders_data_df.tradeId, seen)
+                if duplicates.any():
+                    raw_traders_data_df = raw_traders_data_df[~duplicates]
+            record['rows_out'] = len(raw_traders_data_df)
+        return raw_traders_data_df, seen
+
+    def __get_traders_data_from_dataset(self, traders_data_file):
+        '''
+        (str) -> pandas DataFrame
+
+        Get data from Parquet / Arrow IPC files and transform
+        '''
+        # tradeId is read to drop duplicates if the files have it
+        raw_traders_data_df = Reader.load_dataset_to_df(
+            traders_data_file, list(dict.fromkeys(self.__columns + ['tradeId'])), self.stock_symbols)
+        raw_traders_data_df, _ = self.__drop_duplicate_trades(raw_traders_data_df)
+        return self.__get_traders_data_from_df(raw_traders_data_df)
+
+    def __get_traders_data_from_df(self, raw_traders_data_df):
+        '''
+        (pandas DataFrame) -> pandas DataFrame
+
+        Validate and transform traders data from data frame
+        '''
+        missing = [
+            column for column in self.__columns if column not in raw_traders_data_df]
+        if missing:
+            raise ValueError("Missing columns {}".format(missing))
+        return self.__process_traders_data(
+            raw_traders_data_df[self.__columns], self.stock_symbols, self.traders_columns)
+
+    def __iter_traders_data_from_csv(self, traders_data_files):
+        '''
+        (list) -> generator of pandas DataFrame
+
+        Get data from csv files in chunks and transform each chunk
+        '''
+        columns, dtypes, optional = self.__get_csv_columns(self.__columns, self.__dtypes)
+        seen = empty_trade_keys()
+        for raw_traders_data_df in Reader.iter_csv_files_chunks(
+                traders_data_files, self.chunksize, columns, dtypes, optional):
+            raw_traders_data_df, seen = self.__drop_duplicate_trades(raw_traders_data_df, seen)
+            traders_data_df = self.__filter_traders_data(
+                raw_traders_data_df, self.stock_symbols)
+            # skip chunks without valid data
+            if not traders_data_df.empty:
+                yield self.__transform_traders_data(traders_data_df, self.traders_columns)
+
+    def __scan_traders_data_from_csv(self, traders_data_files):
+        '''
+        (list) -> NoneType
+
+        Get date range and stocks list from csv files chunk by chunk,
+        reading only the columns needed to filter out bad data (and tradeId to drop duplicates)
+        '''
+        columns, dtypes, optional = self.__get_csv_columns(
+            ['stockSymbol', 'traderId', 'tradeDatetime'], TRADERS_DTYPES)
+        start_date, end_date, stocks = None, None, set()
+        seen = empty_trade_keys()
+        for raw_traders_data_df in Reader.iter_csv_files_chunks(
+                traders_data_files, self.chunksize, columns, dtypes, optional):
+            raw_traders_data_df, seen = self.__drop_duplicate_trades(raw_traders_data_df, seen)
+            traders_data_df = self.__filter_traders_data(
+                raw_traders_data_df, self.stock_symbols)
+            if traders_data_df.empty:
+                continue
+            trade_datetime = pd.to_datetime(
+                traders_data_df.tradeDatetime, format=TRADE_DATETIME_FORMAT)
+            chunk_start = trade_datetime.min().normalize()
+            chunk_end = trade_datetime.max().normalize()
+            start_date = chunk_start if start_date is None else min(
+                start_date, chunk_start)
+            end_date = chunk_end if end_date is None else max(
+                end_date, chunk_end)
+            stocks.update(traders_data_df.stockSymbol.unique())
+        self.__scanned = {'start_date': start_date,
+                          'end_date': end_date, 'stocks': sorted(stocks)}
+
+    @property
+    def is_empty(self):
+        '''
+        () -> bool
+
+        Check if there is no valid traders data
+        '''
+        if self.traders_data_df is None:
+            return self.__scanned['start_date'] is None
+        return self.traders_data_df.empty
+
+    @staticmethod
+    @profiler.profile('manipulator.filter_traders')
+    def __filter_traders_data(raw_traders_data_df, stock_symbols):
         '''
         (pandas DataFrame, list) -> pandas DataFrame
 
-        Transform traders data from CSV file
+        Filter out bad data and stocks not selected from traders data
         '''
         # ----------------------------------------------------------------
         # Filter out bad data
@@ -52,26 +211,69 @@ class Manipulator():
         if stock_symbols:
             traders_data_df = traders_data_df[traders_data_df.stockSymbol.isin(
                 stock_symbols)]
+        return traders_data_df
+
+    @classmethod
+    def __process_traders_data(cls, raw_traders_data_df, stock_symbols, columns=[]):
+        '''
+        (pandas DataFrame, list, list) -> pandas DataFrame
+
+        Transform traders data from CSV file, keep columns besides the base columns
+        '''
+        traders_data_df = cls.__filter_traders_data(
+            raw_traders_data_df, stock_symbols)
+        return cls.__transform_traders_data(traders_data_df, columns)
+
+    @staticmethod
+    @profiler.profile('manipulator.transform_traders')
+    def __transform_traders_data(traders_data_df, columns=[]):
+        '''
+        (pandas DataFrame, list) -> pandas DataFrame
+
+        Transform filtered traders data, keep columns besides the base columns (e.g. volume, tradeId for rules)
+        '''
         # ----------------------------------------------------------------
         # Transform data
         # ----------------------------------------------------------------
-        # Format countryCode and stockSymbol columns as category for better performance
-        traders_data_df.loc[:, 'countryCode'] = traders_data_df.countryCode.astype(
-            'category')
-        traders_data_df.loc[:, 'stockSymbol'] = traders_data_df.stockSymbol.astype(
-            'category')
+        # Format text columns as category: each distinct value is stored once, rows hold small integer codes
+        # (already category if read with schema), keep categories of filtered data only
+        for column in ['countryCode', 'traderId', 'stockSymbol', 'stockName']:
+            traders_data_df[column] = traders_data_df[column].astype(
+                'category').cat.remove_unused_categories()
         # Create new tradeDate column with datetime type
-        # truncate to date
-        traders_data_df.loc[:, 'tradeDate'] = pd.to_datetime(
-            traders_data_df.tradeDatetime).dt.date
-        # Convert to datetime type
+        # parse once with fixed format and truncate to date
         traders_data_df.loc[:, 'tradeDate'] = pd.to_datetime(
-            traders_data_df.tradeDate, format='%Y-%m-%d')
-        # Combine firstName and lastName
-        traders_data_df.loc[:, 'name'] = traders_data_df.firstName + \
-            ' ' + traders_data_df.lastName
+            traders_data_df.tradeDatetime, format=TRADE_DATETIME_FORMAT).dt.normalize()
+        # Combine firstName and lastName, once per distinct pair
+        traders_data_df['name'] = Manipulator.__combine_names(
+            traders_data_df.firstName, traders_data_df.lastName)
 
-        return traders_data_df[['countryCode', 'name', 'traderId', 'stockSymbol', 'stockName', 'price', 'tradeDate']]
+        return traders_data_df[['countryCode', 'name', 'traderId', 'stockSymbol', 'stockName', 'price', 'tradeDate'] +
+                               list(columns)]
+
+    @staticmethod
+    def __combine_names(first_names, last_names):
+        '''
+        (pandas Series, pandas Series) -> pandas Categorical
+
+        firstName + ' ' + lastName as category, missing if either is missing.
+        Names are built for distinct (firstName, lastName) pairs only, not for each row
+        '''
+        first_names = pd.Categorical(first_names)
+        last_names = pd.Categorical(last_names)
+        first_codes = first_names.codes.astype('int64')
+        last_codes = last_names.codes.astype('int64')
+        valid = (first_codes >= 0) & (last_codes >= 0)
+        # distinct pairs of codes, and pair of each row
+        pair_codes, pairs = pd.factorize(
+            first_codes[valid] * len(last_names.categories) + last_codes[valid])
+        pair_names = first_names.categories.astype(str)[pairs // len(last_names.categories)] + \
+            ' ' + last_names.categories.astype(str)[pairs % len(last_names.categories)]
+        # different pairs can make the same name
+        categories = pd.Index(np.unique(pair_names.values))
+        codes = np.full(len(valid), -1, dtype='int64')
+        codes[valid] = categories.get_indexer(pair_names)[pair_codes]
+        return pd.Categorical.from_codes(codes, categories)
 
     def __get_stocks_list(self):
         '''
@@ -79,6 +281,8 @@ class Manipulator():
 
         Get an unique list of stock symbols from traders data
         '''
+        if self.traders_data_df is None:
+            return self.__scanned['stocks']
         return self.traders_data_df.stockSymbol.unique()
 
     @property
@@ -88,6 +292,8 @@ class Manipulator():
 
         Get the earliest trade date from traders data
         '''
+        if self.traders_data_df is None:
+            return self.__scanned['start_date'].strftime('%Y-%m-%d')
         return self.traders_data_df.tradeDate.min().strftime('%Y-%m-%d')
 
     @property
@@ -97,31 +303,36 @@ class Manipulator():
 
         Get the latest trade date from traders data
         '''
+        if self.traders_data_df is None:
+            return self.__scanned['end_date'].strftime('%Y-%m-%d')
         return self.traders_data_df.tradeDate.max().strftime('%Y-%m-%d')
 
-    def __fetch_stocks_data_from_yahoo(self):
+    def __fetch_stocks_data(self):
         '''
         () -> pandas DataFrame
 
-        Get stocks daily pricing data from yahoo
+        Get stocks daily pricing data from price provider
         for stocks exist in traders data
         and limit the date range according to traders data
         '''
         stocks_list = self.__get_stocks_list()
         start_date = self.trading_start_date
         end_date = self.trading_end_date
-        # Get stocks information from yahoo, according to the list of stocks symbol, start date and end date
-        raw_stock_data = Reader.fetch_yahoo_stock_data_to_df(
+        # Get stocks information according to the list of stocks symbol, start date and end date
+        # from yahoo, local cache or other provider
+        raw_stock_data = self.price_provider.fetch(
             stocks_list, start_date, end_date)
 
-        return self.__process_stocks_data(raw_stock_data)
+        return self.process_stocks_data(raw_stock_data)
 
     @staticmethod
-    def __process_stocks_data(raw_stocks_data_df):
+    @profiler.profile('manipulator.process_stocks')
+    def process_stocks_data(raw_stocks_data_df):
         '''
         (pandas DataFrame) -> pandas DataFrame
 
-        Transform raw stocks data from yahoo
+        Transform raw stocks data in yahoo format (see detector.providers) to rows of Symbols, Date, High and Low,
+        and Close and Volume if provided
         '''
         # unpivot data
         stocks_data_df = raw_stocks_data_df.stack(level='Symbols')
@@ -135,31 +346,130 @@ class Manipulator():
         stocks_data_df.loc[:, 'Symbols'] = stocks_data_df.Symbols.astype(
             'category')
         # Keep columns needed
-        return stocks_data_df[['Symbols', 'Date', 'High', 'Low']]
+        return stocks_data_df[[column for column in ['Symbols', 'Date', 'High', 'Low', 'Close', 'Volume']
+                               if column in stocks_data_df]]
 
     def manipulate(self):
         '''
         () -> pandas DataFrame
 
-        Produce a clean set of of merged traders data and Yahoo stocks data (return pandas dataframe)
+        Produce a clean set of traders data with High and Low prices of the day from Yahoo stocks data (return pandas dataframe)
+        High and Low are missing if the trade date is not a trading date of the stock
         '''
         # raise error if there is no valid traders data or stocks data after data transform
-        if not self.traders_data_df.empty:
-            stocks_data_df = self.__fetch_stocks_data_from_yahoo()
-            if stocks_data_df.empty:
-                raise ValueError("No valid data")
+        if not self.is_empty:
+            price_index = self.__get_price_index()
 
-            return self.__join_traders_and_stocks_data(self.traders_data_df, stocks_data_df)
+            if self.traders_data_df is None:
+                return concat_frames(self.__join_traders_chunks_and_stocks_data(price_index))
+            return self.__join_traders_and_stocks_data(self.traders_data_df, price_index, self.stocks_columns)
         else:
             raise ValueError("No valid data")
 
+    def manipulate_chunks(self):
+        '''
+        () -> generator of pandas DataFrame
+
+        Same as manipulate(), but produce data chunk by chunk when streaming,
+        stocks data is fetched and indexed once for all chunks (and all calls)
+        '''
+        if self.traders_data_df is not None:
+            yield self.manipulate()
+            return
+        if self.is_empty:
+            raise ValueError("No valid data")
+        if self.__price_index is None:
+            self.__price_index = self.__get_price_index()
+        yield from self.__join_traders_chunks_and_stocks_data(self.__price_index)
+
+    def iter_traders_data(self):
+        '''
+        () -> generator of pandas DataFrame
+
+        Cleaned and transformed traders data without stocks data, chunk by chunk when streaming
+        (e.g. to write it to a database, see detector.database)
+        '''
+        if self.is_empty:
+            raise ValueError("No valid data")
+        if self.traders_data_df is not None:
+            yield self.traders_data_df
+            return
+        yield from self.__iter_traders_data_from_csv(self.__csv_files)
+
+    def get_stocks_data(self):
+        '''
+        () -> pandas DataFrame
+
+        Processed stocks data (see process_stocks_data) of the stocks and date range of traders data
+        '''
+        if self.is_empty:
+            raise ValueError("No valid data")
+        stocks_data_df = self.__fetch_stocks_data()
+        if stocks_data_df.empty:
+            raise ValueError("No valid data")
+        return stocks_data_df
+
+    def partition_by_symbol(self):
+        '''
+        () -> generator of Tuple (pandas DataFrame, pandas DataFrame)
+
+        Split traders data and stocks data by stock symbol, for parallel processing.
+        Stocks data is fetched once for all partitions, join each partition with join_stocks_data()
+        '''
+        if self.is_empty or self.traders_data_df is None:
+            raise ValueError("No valid data")
+        stocks_data_df = self.__fetch_stocks_data()
+        if stocks_data_df.empty:
+            raise ValueError("No valid data")
+        stocks_by_symbol = {symbol: part for symbol, part in stocks_data_df.groupby(
+            stocks_data_df.Symbols.astype(str))}
+        for symbol, traders_data_df in self.traders_data_df.groupby('stockSymbol', observed=True):
+            yield traders_data_df, stocks_by_symbol.get(symbol, stocks_data_df.iloc[0:0])
+
+    @classmethod
+    def join_stocks_data(cls, traders_data_df, stocks_data_df, columns=[]):
+        '''
+        (pandas DataFrame, pandas DataFrame, list) -> pandas DataFrame
+
+        Add High and Low prices (and daily columns, see price_index.DAILY_COLUMNS) of the trade date
+        from processed stocks data to traders data, same as manipulate() for a partition from partition_by_symbol()
+        '''
+        return cls.__join_traders_and_stocks_data(traders_data_df, PriceIndex(stocks_data_df), columns)
+
+    def __get_price_index(self):
+        '''
+        () -> PriceIndex
+
+        Get stocks data from yahoo, indexed by stock symbol and date
+        '''
+        stocks_data_df = self.__fetch_stocks_data()
+        if stocks_data_df.empty:
+            raise ValueError("No valid data")
+        with profiler.stage('manipulator.index_stocks', len(stocks_data_df)) as record:
+            price_index = PriceIndex(stocks_data_df)
+            record['rows_out'] = len(price_index)
+        return price_index
+
+    def __join_traders_chunks_and_stocks_data(self, price_index):
+        '''
+        (PriceIndex) -> generator of pandas DataFrame
+
+        Read traders data from csv files again chunk by chunk and join each chunk with stocks data
+        '''
+        for traders_data_df in self.__iter_traders_data_from_csv(self.__csv_files):
+            yield self.__join_traders_and_stocks_data(traders_data_df, price_index, self.stocks_columns)
+
     @staticmethod
-    def __join_traders_and_stocks_data(traders_data_df, stocks_data_df):
+    @profiler.profile('manipulator.join')
+    def __join_traders_and_stocks_data(traders_data_df, price_index, columns=[]):
         '''
-        (pandas DataFrame, pandas DataFrame) -> pandas DataFrame
+        (pandas DataFrame, PriceIndex, list) -> pandas DataFrame
 
-        Merge traders and stocks data
+        Add High and Low prices (and daily columns) of the trade date to traders data,
+        looked up by stock symbol and trade date. Columns are added in place, traders data is not copied
         '''
-        joined_df = pd.merge(traders_data_df, stocks_data_df, left_on=[
-                             'stockSymbol', 'tradeDate'], right_on=['Symbols', 'Date'], how='left')
-        return joined_df
+        values = price_index.lookup_columns(
+            traders_data_df.stockSymbol, traders_data_df.tradeDate, ['High', 'Low'] + list(columns))
+        for column, column_values in values.items():
+            traders_data_df[column] = column_values
+        return traders_data_df
@@ -0,0 +1,178 @@
+import numpy as np
+import pandas as pd
+
+# Daily values of the index besides High and Low, added to traders data on demand (see detector.rules):
+# - Volume: market volume of the stock in the day
+# - NextMove: change of close price from the day to the next trading day (0.05 is +5%)
+DAILY_COLUMNS = ['Volume', 'NextMove']
+
+
+class PriceIndex():
+    '''
+    Stocks daily High / Low prices indexed by (symbol, date) for vectorised lookup,
+    instead of merging traders data with stocks data
+
+    - lookup(symbols, dates)
+    - lookup_codes(codes, days)
+    - lookup_columns(symbols, dates, columns)
+    - update_codes(codes, days, high, low)
+    - is_suspicious(symbols, dates, prices)
+    '''
+
+    def __init__(self, stocks_data_df):
+        '''
+        (pandas DataFrame) -> NoneType
+
+        stocks_data_df: processed stocks data with Symbols, Date, High and Low columns,
+        and optionally Close and Volume (for DAILY_COLUMNS, missing if not provided)
+
+        Each symbol gets a calendar of slots, one per day from its first to its last trading date,
+        holding the position of the day's High / Low (int32, -1 if not a trading date),
+        so a lookup is a direct array access instead of a search
+        '''
+        symbols = pd.Series(stocks_data_df.Symbols).astype(str).values
+        # Sorted unique symbols, position in this index is the symbol code
+        self.symbols = pd.Index(np.unique(symbols))
+        codes = self.symbols.get_indexer(symbols)
+        days = self.__to_days(stocks_data_df.Date)
+        self.high = np.asarray(stocks_data_df.High, dtype='float64')
+        self.low = np.asarray(stocks_data_df.Low, dtype='float64')
+        self.columns = {'High': self.high, 'Low': self.low,
+                        'Volume': self.__get_column(stocks_data_df, 'Volume'),
+                        'NextMove': self.__get_next_move(codes, days, self.__get_column(stocks_data_df, 'Close'))}
+
+        # Calendar of each symbol: first day, number of days and offset in slots
+        n_symbols = len(self.symbols)
+        self.first_day = np.full(n_symbols, np.iinfo('int64').max)
+        np.minimum.at(self.first_day, codes, days)
+        last_day = np.full(n_symbols, np.iinfo('int64').min)
+        np.maximum.at(last_day, codes, days)
+        self.span = last_day - self.first_day + 1
+        self.offset = np.concatenate([[0], np.cumsum(self.span)[:-1]])
+        self.slots = np.full(int(self.span.sum()), -1, dtype='int32')
+        self.slots[self.offset[codes] + days - self.first_day[codes]
+                   ] = np.arange(len(days))
+
+    def __len__(self):
+        return len(self.high)
+
+    @staticmethod
+    def __get_column(stocks_data_df, column):
+        if column not in stocks_data_df:
+            return np.full(len(stocks_data_df), np.nan)
+        return np.asarray(stocks_data_df[column], dtype='float64')
+
+    @staticmethod
+    def __get_next_move(codes, days, close):
+        '''
+        (numpy array, numpy array, numpy array) -> numpy array
+
+        Change of close price to the close of the next trading day of the same symbol, NaN on the last day
+        '''
+        order = np.lexsort((days, codes))
+        same = codes[order][1:] == codes[order][:-1]
+        next_close = np.full(len(close), np.nan)
+        next_close[order[:-1][same]] = close[order[1:][same]]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return next_close / close - 1
+
+    @staticmethod
+    def __to_days(dates):
+        '''
+        (array like) -> numpy array
+
+        Convert dates to day numbers (days since 1970-01-01)
+        '''
+        values = np.asarray(dates)
+        if values.dtype.kind != 'M':
+            values = pd.to_datetime(dates).values
+        return values.astype('datetime64[D]').astype('int64')
+
+    def __get_codes(self, symbols):
+        '''
+        (array like) -> numpy array
+
+        Get symbol codes of symbols, -1 if symbol not in index.
+        Categories are looked up once for categorical symbols
+        '''
+        if isinstance(getattr(symbols, 'dtype', None), pd.CategoricalDtype):
+            categorical = pd.Categorical(symbols)
+            category_codes = self.symbols.get_indexer(
+                categorical.categories.astype(str))
+            # append -1 so missing values (code -1) map to -1
+            return np.append(category_codes, -1)[categorical.codes]
+        return self.symbols.get_indexer(pd.Index(symbols).astype(str))
+
+    def lookup(self, symbols, dates):
+        '''
+        (array like, array like) -> Tuple of numpy arrays (found, high, low)
+
+        Get High and Low prices of the day for each (symbol, date),
+        found is False and prices are NaN if there is no trading data of the day
+        '''
+        return self.lookup_codes(self.__get_codes(symbols), self.__to_days(dates))
+
+    def lookup_codes(self, codes, days):
+        '''
+        (numpy array, numpy array) -> Tuple of numpy arrays (found, high, low)
+
+        Same as lookup(), by symbol codes (position in symbols, -1 if not in index) and day numbers
+        (days since 1970-01-01), for callers keeping their own codes, e.g. small batches of a live feed
+        '''
+        found, positions = self.__get_positions(codes, days)
+        return found, self.__take(self.high, found, positions), self.__take(self.low, found, positions)
+
+    def lookup_columns(self, symbols, dates, columns=['High', 'Low']):
+        '''
+        (array like, array like, list) -> dict of numpy arrays
+
+        Get values of columns (High, Low or DAILY_COLUMNS) of the day for each (symbol, date),
+        positions are looked up once for all columns. NaN if there is no trading data of the day
+        '''
+        found, positions = self.__get_positions(self.__get_codes(symbols), self.__to_days(dates))
+        return {column: self.__take(self.columns[column], found, positions) for column in columns}
+
+    def update_codes(self, codes, days, high, low):
+        '''
+        (numpy array, numpy array, numpy array, numpy array) -> numpy array of bool
+
+        Replace High and Low of (symbol code, day) in place, e.g. intraday High / Low of today from a live feed.
+        Return found: False for (symbol code, day) without trading data in the index, those are not updated
+        (a new index is needed to add them)
+        '''
+        found, positions = self.__get_positions(codes, days)
+        self.high[positions[found]] = high[found]
+        self.low[positions[found]] = low[found]
+        return found
+
+    def __get_positions(self, codes, days):
+        '''
+        (numpy array, numpy array) -> Tuple of numpy arrays (found, positions)
+
+        Positions of (symbol code, day) in stocks data, found is False if there is no trading data of the day
+        '''
+        if not len(self.symbols):
+            return np.zeros(len(days), dtype=bool), np.zeros(len(days), dtype='int32')
+        # day in the calendar of the symbol
+        day = days - self.first_day[codes]
+        valid = (codes >= 0) & (day >= 0) & (day < self.span[codes])
+        positions = self.slots[np.where(valid, self.offset[codes] + day, 0)]
+        return valid & (positions >= 0), positions
+
+    @staticmethod
+    def __take(values, found, positions):
+        if not len(values):
+            return np.full(len(found), np.nan)
+        return np.where(found, values[positions], np.nan)
+
+    def is_suspicious(self, symbols, dates, prices):
+        '''
+        (array like, array like, array like) -> numpy array of bool
+
+        Check trades are suspicious:
+        1. Not a trading date for the stock
+        2. Price is outside of the trading price range in the day
+        '''
+        found, high, low = self.lookup(symbols, dates)
+        prices = np.asarray(prices, dtype='float64')
+        return ~found | (prices > high) | (prices < low)
@@ -0,0 +1,205 @@
+from contextlib import contextmanager
+from functools import wraps
+import collections
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+import pandas as pd
+
+
+class Profiler():
+    '''
+    Instrumentation of pipeline stages (Reader -> Manipulator -> Analysis):
+    wall time, cpu time, rows in / out and memory of each call
+
+    - stage(name, rows_in) context manager
+    - profile(name) decorator
+    - report(): totals per stage (pandas DataFrame)
+    - records: most recent calls
+    - to_prometheus(): totals per stage in Prometheus text format
+    - reset()
+
+    Memory is measured as the process max RSS after each stage (cheap, always on),
+    and as the peak of memory allocated during the stage if trace_memory is on (tracemalloc, slower).
+    Stages run in worker processes are not recorded.
+    '''
+    COLUMNS = ['calls', 'wall_seconds', 'cpu_seconds', 'rows_in',
+               'rows_out', 'peak_memory_bytes', 'max_rss_bytes']
+
+    def __init__(self, enabled=True, trace_memory=False, max_records=1000):
+        '''
+        (bool, bool, int) -> NoneType
+
+        enabled: record stages
+        trace_memory: measure peak memory allocated in each stage with tracemalloc
+        max_records: number of most recent calls kept in records
+        '''
+        self.enabled = enabled
+        self.trace_memory = trace_memory
+        self.records = collections.deque(maxlen=max_records)
+        self.__totals = {}
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+
+    def reset(self):
+        '''
+        () -> NoneType
+
+        Remove all recorded stages
+        '''
+        with self.__lock:
+            self.records.clear()
+            self.__totals = {}
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        '''
+        (str, int) -> context manager of dict
+
+        Record a stage, rows_out can be set on the yielded record
+        '''
+        record = {'stage': name, 'rows_in': rows_in, 'rows_out': None}
+        if not self.enabled:
+            yield record
+            return
+        tracing = self.trace_memory and self.__start_tracing()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record['wall_seconds'] = time.perf_counter() - wall
+            record['cpu_seconds'] = time.process_time() - cpu
+            record['peak_memory_bytes'] = self.__stop_tracing() if tracing else None
+            record['max_rss_bytes'] = self.max_rss()
+            self.__add(record)
+
+    def profile(self, name):
+        '''
+        (str) -> decorator
+
+        Record each call of the decorated function as a stage,
+        rows in is the size of the first data frame argument, rows out the size of the result
+        '''
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                rows_in = next((len(arg) for arg in args if isinstance(
+                    arg, (pd.DataFrame, pd.Series))), None)
+                with self.stage(name, rows_in) as record:
+                    result = func(*args, **kwargs)
+                    if isinstance(result, (pd.DataFrame, pd.Series)):
+                        record['rows_out'] = len(result)
+                    return result
+            return wrapper
+        return decorator
+
+    def __start_tracing(self):
+        '''
+        () -> bool
+
+        Start measuring peak memory of a stage, nested stages keep the peak of outer stages
+        '''
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        stack = self.__local.__dict__.setdefault('peaks', [])
+        if stack:
+            # keep peak of outer stage so far before resetting
+            stack[-1] = max(stack[-1], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        stack.append(0)
+        return True
+
+    def __stop_tracing(self):
+        '''
+        () -> int
+
+        Peak memory allocated since the stage started
+        '''
+        stack = self.__local.peaks
+        peak = max(stack.pop(), tracemalloc.get_traced_memory()[1])
+        if stack:
+            stack[-1] = max(stack[-1], peak)
+        else:
+            tracemalloc.stop()
+        return peak
+
+    @staticmethod
+    def max_rss():
+        '''
+        () -> int
+
+        Max resident set size of the process in bytes
+        '''
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on linux, bytes on macOS
+        return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+    def __add(self, record):
+        '''
+        (dict) -> NoneType
+
+        Keep record and add to totals of the stage
+        '''
+        with self.__lock:
+            self.records.append(record)
+            totals = self.__totals.setdefault(
+                record['stage'], dict.fromkeys(self.COLUMNS, 0))
+            totals['calls'] += 1
+            for column in ['wall_seconds', 'cpu_seconds', 'rows_in', 'rows_out']:
+                totals[column] += record[column] or 0
+            for column in ['peak_memory_bytes', 'max_rss_bytes']:
+                totals[column] = max(totals[column], record[column] or 0)
+
+    def report(self):
+        '''
+        () -> pandas DataFrame
+
+        Totals per stage: calls, wall and cpu time, rows in and out,
+        max of peak memory and process max RSS
+        '''
+        with self.__lock:
+            totals = {stage: dict(values)
+                      for stage, values in self.__totals.items()}
+        report = pd.DataFrame.from_dict(
+            totals, orient='index', columns=self.COLUMNS)
+        report.index.name = 'stage'
+        return report
+
+    def to_prometheus(self, prefix='detector'):
+        '''
+        (str) -> str
+
+        Totals per stage in Prometheus text exposition format
+        '''
+        metrics = [
+            ('stage_calls_total', 'calls', 'counter', 'Number of calls of pipeline stage'),
+            ('stage_wall_seconds_total', 'wall_seconds',
+             'counter', 'Wall time spent in pipeline stage'),
+            ('stage_cpu_seconds_total', 'cpu_seconds',
+             'counter', 'CPU time spent in pipeline stage'),
+            ('stage_rows_in_total', 'rows_in', 'counter',
+             'Rows into pipeline stage'),
+            ('stage_rows_out_total', 'rows_out', 'counter',
+             'Rows out of pipeline stage'),
+            ('stage_peak_memory_bytes', 'peak_memory_bytes', 'gauge',
+             'Max peak memory allocated in pipeline stage (trace_memory only)'),
+        ]
+        report = self.report()
+        lines = []
+        for metric, column, metric_type, description in metrics:
+            name = '{}_{}'.format(prefix, metric)
+            lines.append('# HELP {} {}'.format(name, description))
+            lines.append('# TYPE {} {}'.format(name, metric_type))
+            for stage, value in report[column].items():
+                lines.append('{}{{stage="{}"}} {}'.format(name, stage, value))
+        name = '{}_process_max_rss_bytes'.format(prefix)
+        lines.append('# HELP {} Max resident set size of the process'.format(name))
+        lines.append('# TYPE {} gauge'.format(name))
+        lines.append('{} {}'.format(name, self.max_rss()))
+        return '\n'.join(lines) + '\n'
+
+
+# Profiler of the detector package pipeline
+profiler = Profiler()
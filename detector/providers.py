@@ -0,0 +1,212 @@
+from .reader import Reader
+from concurrent.futures import ThreadPoolExecutor
+import io
+import os
+import pandas as pd
+
+# Daily bar attributes as returned by yahoo
+ATTRIBUTES = ['Adj Close', 'Close', 'High', 'Low', 'Open', 'Volume']
+
+
+class PriceProvider():
+    '''
+    Source of stocks daily pricing data
+
+    - fetch(stock_syms, start_date, end_date)
+    '''
+
+    def fetch(self, stock_syms, start_date, end_date):
+        '''
+        (list, str, str) -> pandas DataFrame
+
+        start_date: YYYY-MM-DD
+        end_date: YYYY-MM-DD
+
+        Get stocks daily pricing data within date range according to stock symbols provided,
+        yahoo format: Date index, (Attributes, Symbols) columns.
+        Raise ValueError if there is no data
+        '''
+        raise NotImplementedError
+
+
+class YahooProvider(PriceProvider):
+    '''
+    Stocks daily pricing data from yahoo, all symbols in one request
+    '''
+
+    def fetch(self, stock_syms, start_date, end_date):
+        return Reader.fetch_yahoo_stock_data_to_df(stock_syms, start_date, end_date)
+
+
+class SymbolPriceProvider(PriceProvider):
+    '''
+    Provider getting data of each stock symbol separately, max_workers symbols at a time
+
+    - fetch_symbol(symbol, start_date, end_date)
+    '''
+    max_workers = 1
+
+    def fetch(self, stock_syms, start_date, end_date):
+        if isinstance(stock_syms, str):
+            stock_syms = [stock_syms]
+        stock_syms = list(stock_syms)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(
+                lambda symbol: self.__fetch_symbol(symbol, start_date, end_date), stock_syms))
+        frames = {symbol: df for symbol, df in zip(
+            stock_syms, results) if df is not None and not df.empty}
+        if not frames:
+            raise ValueError("No data available")
+        return self.to_yahoo_format(frames)
+
+    def __fetch_symbol(self, symbol, start_date, end_date):
+        '''
+        (str, str, str) -> pandas DataFrame
+
+        Get data of symbol within date range, None if it fails (symbol has no data, same as yahoo)
+        '''
+        try:
+            df = self.fetch_symbol(symbol, start_date, end_date)
+        except Exception as error:
+            print("Fail to fetch data for stock {} between {} - {}: {}".format(
+                symbol, start_date, end_date, error))
+            return None
+        if df is None or df.empty:
+            return None
+        df = df.set_index(pd.to_datetime(df['Date'])).drop(columns='Date').sort_index()
+        return df.loc[start_date:end_date].reindex(columns=ATTRIBUTES)
+
+    def fetch_symbol(self, symbol, start_date, end_date):
+        '''
+        (str, str, str) -> pandas DataFrame
+
+        Get daily data of symbol, Date column and attributes columns (see ATTRIBUTES, missing ones are empty),
+        at least within date range. None or empty if the symbol is unknown
+        '''
+        raise NotImplementedError
+
+    @staticmethod
+    def to_yahoo_format(frames):
+        '''
+        (dict) -> pandas DataFrame
+
+        Combine data of each symbol (Date index, attributes columns) to yahoo format
+        '''
+        df = pd.concat(frames, axis=1, names=['Symbols', 'Attributes'])
+        df = df.swaplevel(0, 1, axis=1).sort_index(axis=1)
+        df.index.name = 'Date'
+        return df.sort_index()
+
+
+class LocalProvider(SymbolPriceProvider):
+    '''
+    Stocks daily pricing data from a local directory, one file per stock symbol:
+    <SYMBOL>.parquet or <SYMBOL>.csv with Date and attributes columns (see ATTRIBUTES)
+
+    - store(raw_stocks_data_df)
+    '''
+    FORMATS = ('parquet', 'csv')
+
+    def __init__(self, directory, file_format='csv', max_workers=1):
+        '''
+        (str, str, int) -> NoneType
+
+        directory: directory of files
+        file_format: format of files written by store(), 'csv' or 'parquet' (needs pyarrow).
+        Both formats are read
+        max_workers: number of files read at a time
+        '''
+        if file_format not in self.FORMATS:
+            raise ValueError("Unknown file format {}".format(file_format))
+        self.directory = directory
+        self.file_format = file_format
+        self.max_workers = max_workers
+
+    def fetch_symbol(self, symbol, start_date, end_date):
+        for file_format in self.FORMATS:
+            path = os.path.join(self.directory, '{}.{}'.format(symbol, file_format))
+            if os.path.exists(path):
+                if file_format == 'parquet':
+                    return pd.read_parquet(path)
+                return pd.read_csv(path)
+        return None
+
+    def store(self, raw_stocks_data_df):
+        '''
+        (pandas DataFrame) -> NoneType
+
+        Write stocks data in yahoo format to one file per stock symbol, replacing existing files
+        '''
+        os.makedirs(self.directory, exist_ok=True)
+        for symbol in raw_stocks_data_df.columns.unique(level='Symbols'):
+            df = raw_stocks_data_df.xs(symbol, axis=1, level='Symbols').dropna(
+                how='all').reindex(columns=ATTRIBUTES)
+            df.index.name = 'Date'
+            path = os.path.join(self.directory, '{}.{}'.format(
+                symbol, self.file_format))
+            if self.file_format == 'parquet':
+                df.reset_index().to_parquet(path, index=False)
+            else:
+                df.to_csv(path)
+
+
+class HTTPProvider(SymbolPriceProvider):
+    '''
+    Stocks daily pricing data from an HTTP service, one request per stock symbol,
+    max_workers requests at a time over a pool of keep-alive connections.
+    Failed requests (connection errors, 429 and 5xx) are retried with exponential backoff.
+    Response: csv or json records with Date and attributes fields (see ATTRIBUTES), 404 if symbol is unknown
+    '''
+    RETRY_STATUS = (429, 500, 502, 503, 504)
+
+    def __init__(self, url, max_workers=8, retries=3, backoff=0.5, timeout=30, response_format='csv'):
+        '''
+        (str, int, int, float, float, str) -> NoneType
+
+        url: template with {symbol}, {start} and {end} (YYYY-MM-DD),
+        e.g. http://bars.local/daily/{symbol}?start={start}&end={end}
+        backoff: retries wait backoff * 2 ** (retry - 1) seconds
+        timeout: seconds
+        response_format: 'csv' or 'json'
+        '''
+        # imported when used, only needed for HTTP providers
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        if response_format not in ('csv', 'json'):
+            raise ValueError("Unknown response format {}".format(response_format))
+        self.url = url
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.response_format = response_format
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers, max_retries=Retry(
+            total=retries, backoff_factor=backoff, status_forcelist=self.RETRY_STATUS,
+            allowed_methods=['GET'], raise_on_status=False))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def fetch_symbol(self, symbol, start_date, end_date):
+        response = self.session.get(self.url.format(
+            symbol=symbol, start=start_date, end=end_date), timeout=self.timeout)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        if self.response_format == 'json':
+            return pd.DataFrame(response.json())
+        return pd.read_csv(io.StringIO(response.text))
+
+
+def get_price_provider(source):
+    '''
+    (str) -> PriceProvider
+
+    Price provider from source: yahoo if not provided,
+    HTTPProvider if source is a url template, LocalProvider if source is a directory
+    '''
+    if not source or source == 'yahoo':
+        return YahooProvider()
+    if source.startswith(('http://', 'https://')):
+        return HTTPProvider(source)
+    return LocalProvider(source)
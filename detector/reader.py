@@ -1,5 +1,16 @@
+from .profiler import profiler
+from .schema import concat_frames
+from concurrent.futures import ThreadPoolExecutor
+import glob
+import os
 import pandas as pd
-from pandas_datareader import data
+
+# Columnar file formats by file extension
+DATASET_FORMATS = {'.parquet': 'parquet', '.arrow': 'ipc',
+                   '.feather': 'ipc', '.ipc': 'ipc'}
+
+# csv file extensions, compression is inferred from the extension by pandas (.zst needs zstandard)
+CSV_EXTENSIONS = ('.csv', '.csv.gz', '.csv.bz2', '.csv.xz', '.csv.zst', '.csv.zip')
 
 
 class Reader():
@@ -7,22 +18,273 @@ class Reader():
     Data reader to get data from data sources
     '''
     @classmethod
-    def load_csv_to_df(cls, filename):
+    @profiler.profile('reader.load_csv')
+    def load_csv_to_df(cls, filename, usecols=None, dtype=None, engine=None):
         '''
-        (str) -> pandas DataFrame
+        (str, list, dict, str) -> pandas DataFrame
 
         Get data from csv file to pandas dataframe
+        usecols: columns to read, all columns if not provided
+        dtype: types of columns, inferred if not provided
+        engine: csv parser engine, 'c' (default) or 'pyarrow' (multi-threaded)
         '''
         df = pd.DataFrame()
         try:
-            df = pd.read_csv(filename)
-        except:
+            df = pd.read_csv(filename, usecols=usecols,
+                             dtype=dtype, engine=engine)
+        except Exception as error:
+            print("Fail to read data from {}: {}".format(filename, error))
+        if df.empty:
+            raise ValueError("No data available")
+        if engine == 'pyarrow':
+            df = cls.__empty_strings_to_null(df)
+        return df
+
+    @staticmethod
+    def get_csv_files(path):
+        '''
+        (str or list) -> list
+
+        csv files of path: file, directory (csv files, compressed or not, in the directory and its
+        subdirectories), glob pattern (e.g. trades/*.csv.gz) or list of those.
+        Files of a directory or pattern are sorted by path
+        '''
+        if isinstance(path, (list, tuple)):
+            return [filename for item in path for filename in Reader.get_csv_files(item)]
+        if os.path.isdir(path):
+            return sorted(os.path.join(root, file) for root, _, files in os.walk(path)
+                          for file in files if file.endswith(CSV_EXTENSIONS))
+        if glob.has_magic(path):
+            return sorted(glob.glob(path, recursive=True))
+        return [path]
+
+    @classmethod
+    @profiler.profile('reader.load_csv_files')
+    def load_csv_files_to_df(cls, filenames, usecols=None, dtype=None, engine=None, optional=[], workers=None):
+        '''
+        (list, list, dict, str, list, int) -> pandas DataFrame
+
+        Get data from csv files to one pandas dataframe, in the order of filenames.
+        Files are read concurrently by workers threads (number of cpus if not provided):
+        parsing and decompression release the GIL. Files without data are skipped
+        optional: columns of usecols only read from files having them (missing values otherwise)
+        '''
+        def load(filename):
+            try:
+                return cls.load_csv_to_df(filename, cls.__get_usecols(filename, usecols, optional), dtype, engine)
+            except ValueError:
+                return None
+
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            frames = [df for df in executor.map(load, filenames) if df is not None]
+        if not frames:
+            raise ValueError("No data available")
+        return frames[0] if len(frames) == 1 else concat_frames(frames)
+
+    @staticmethod
+    def __get_usecols(filename, usecols, optional):
+        '''
+        (str, list, list) -> list
+
+        Columns of usecols to read from file, without optional columns missing in its header
+        '''
+        if not optional or usecols is None:
+            return usecols
+        try:
+            header = set(pd.read_csv(filename, nrows=0).columns)
+        except Exception:
+            # reading the file fails the same way
+            return usecols
+        return [column for column in usecols if column in header or column not in optional]
+
+    @staticmethod
+    def __empty_strings_to_null(df):
+        '''
+        (pandas DataFrame) -> pandas DataFrame
+
+        pyarrow engine reads empty text fields as empty strings instead of missing values,
+        convert them to missing values as the c engine does
+        '''
+        for column in df.columns:
+            if isinstance(df[column].dtype, pd.CategoricalDtype):
+                if '' in df[column].cat.categories:
+                    df[column] = df[column].cat.remove_categories([''])
+            elif df[column].dtype == object:
+                df[column] = df[column].mask(df[column] == '')
+        return df
+
+    @classmethod
+    def iter_csv_chunks(cls, filename, chunksize, usecols=None, dtype=None):
+        '''
+        (str, int, list, dict) -> generator of pandas DataFrame
+
+        Get data from csv file in pandas dataframes of at most chunksize rows,
+        only one chunk is held in memory at a time
+        usecols: columns to read, all columns if not provided
+        dtype: types of columns, inferred if not provided
+        '''
+        try:
+            reader = pd.read_csv(filename, chunksize=chunksize,
+                                 usecols=usecols, dtype=dtype)
+        except Exception:
             print("Fail to read data from {}".format(filename))
+            raise ValueError("No data available")
+        empty = True
+        with reader:
+            while True:
+                with profiler.stage('reader.read_csv_chunk') as record:
+                    df = next(reader, None)
+                    record['rows_out'] = 0 if df is None else len(df)
+                if df is None:
+                    break
+                if not df.empty:
+                    empty = False
+                    yield df
+        if empty:
+            raise ValueError("No data available")
+
+    @classmethod
+    def iter_csv_files_chunks(cls, filenames, chunksize, usecols=None, dtype=None, optional=[]):
+        '''
+        (list, int, list, dict, list) -> generator of pandas DataFrame
+
+        Same as iter_csv_chunks() for csv files read one after the other, files without data are skipped
+        optional: columns of usecols only read from files having them
+        '''
+        empty = True
+        for filename in filenames:
+            try:
+                for df in cls.iter_csv_chunks(filename, chunksize, cls.__get_usecols(filename, usecols, optional),
+                                              dtype):
+                    empty = False
+                    yield df
+            except ValueError:
+                continue
+        if empty:
+            raise ValueError("No data available")
+
+    @staticmethod
+    def get_dataset_format(path):
+        '''
+        (str) -> str
+
+        Columnar format of file or partitioned directory from file extension:
+        'parquet', 'ipc' (Arrow IPC / Feather), None if not columnar (e.g. csv)
+        '''
+        if os.path.isdir(path):
+            for _, _, files in os.walk(path):
+                for file in sorted(files):
+                    file_format = DATASET_FORMATS.get(
+                        os.path.splitext(file)[1])
+                    if file_format:
+                        return file_format
+            return None
+        return DATASET_FORMATS.get(os.path.splitext(path)[1])
+
+    @classmethod
+    @profiler.profile('reader.load_dataset')
+    def load_dataset_to_df(cls, path, columns=None, stock_symbols=None, start_date=None, end_date=None):
+        '''
+        (str, list, list, str, str) -> pandas DataFrame
+
+        Get data from Parquet or Arrow IPC file, or directory partitioned by stockSymbol and tradeMonth
+        (see Writer.write_dataset), to pandas dataframe. Needs pyarrow.
+        columns: columns to read, all columns if not provided
+        stock_symbols: keep rows of stock symbols only, all if not provided
+        start_date, end_date: keep rows with trade date in range (YYYY-MM-DD), no limit if not provided
+
+        Filters are pushed down to the files: partitions and row groups out of the filters are not read.
+        Files are memory-mapped
+        '''
+        # optional dependency, only needed for columnar files
+        import pyarrow.dataset as ds
+        from pyarrow import fs
+
+        file_format = cls.get_dataset_format(path)
+        if file_format is None:
+            raise ValueError("No data available")
+        dataset = ds.dataset(os.path.abspath(path), format=file_format, partitioning='hive',
+                             filesystem=fs.LocalFileSystem(use_mmap=True))
+        names = dataset.schema.names
+        conditions = []
+        if stock_symbols:
+            conditions.append(ds.field('stockSymbol').isin(list(stock_symbols)))
+        if start_date or end_date:
+            if 'tradeMonth' in names:
+                # prune partitions by month, YYYY-MM strings
+                if start_date:
+                    conditions.append(ds.field('tradeMonth') >= start_date[:7])
+                if end_date:
+                    conditions.append(ds.field('tradeMonth') <= end_date[:7])
+            conditions.extend(cls.__get_date_conditions(
+                dataset.schema, start_date, end_date))
+        condition = None
+        for item in conditions:
+            condition = item if condition is None else condition & item
+        if columns is not None:
+            columns = [column for column in columns if column in names]
+        table = dataset.to_table(columns=columns, filter=condition)
+        df = table.to_pandas()
         if df.empty:
             raise ValueError("No data available")
         return df
 
+    @staticmethod
+    @profiler.profile('reader.load_frame')
+    def load_frame(path):
+        '''
+        (str) -> pandas DataFrame
+
+        Get data frame written by Writer.write_frame. The file is memory-mapped: numeric and date columns
+        (and category columns without missing values) are loaded without copy, one block per column.
+        pandas copies columns of the same type into one block on some operations, those columns are then
+        held by each process instead of shared with the file. Needs pyarrow.
+        '''
+        # optional dependency, only needed for columnar files
+        import pyarrow as pa
+        from .writer import INDEX_COLUMN
+
+        with pa.memory_map(path) as source:
+            table = pa.ipc.open_file(source).read_all()
+        # one block per column, so columns are not copied into 2D blocks
+        df = table.to_pandas(split_blocks=True)
+        if INDEX_COLUMN in df:
+            df.index = pd.Index(df[INDEX_COLUMN].values, copy=False)
+            del df[INDEX_COLUMN]
+        return df
+
+    @staticmethod
+    def __get_date_conditions(schema, start_date, end_date):
+        '''
+        (pyarrow Schema, str, str) -> list of pyarrow Expression
+
+        Conditions of trade date in range on tradeDate (date) or tradeDatetime (date or text) column
+        '''
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        column = 'tradeDate' if 'tradeDate' in schema.names else 'tradeDatetime'
+        if column not in schema.names:
+            return []
+        conditions = []
+        if pa.types.is_timestamp(schema.field(column).type):
+            unit = schema.field(column).type.unit
+            if start_date:
+                conditions.append(ds.field(column) >= pa.scalar(
+                    pd.Timestamp(start_date), pa.timestamp(unit)))
+            if end_date:
+                conditions.append(ds.field(column) < pa.scalar(
+                    pd.Timestamp(end_date) + pd.Timedelta(days=1), pa.timestamp(unit)))
+        else:
+            # text as TRADE_DATETIME_FORMAT, ordered as dates
+            if start_date:
+                conditions.append(ds.field(column) >= start_date)
+            if end_date:
+                conditions.append(ds.field(column) < end_date + '~')
+        return conditions
+
     @classmethod
+    @profiler.profile('reader.fetch_yahoo')
     def fetch_yahoo_stock_data_to_df(cls, stock_syms, start_date, end_date):
         '''
         (list, str, str) -> pandas DataFrame
@@ -32,13 +294,17 @@ class Reader():
 
         Get stocks daily pricing data within date range according to stock symbols provided
         '''
+        # imported on first fetch: pandas_datareader and its dependencies are slow to import,
+        # and not needed if stocks data comes from a cache or another provider
+        from pandas_datareader import data
+
         df = pd.DataFrame()
         try:
             df = data.DataReader(stock_syms, start=start_date,
                                  end=end_date, data_source='yahoo')
-        except:
-            print("Fail to fetch data from yahoo for stock {} between {} - {}".format(
-                stock_syms, start_date, end_date))
+        except Exception as error:
+            print("Fail to fetch data from yahoo for stock {} between {} - {}: {}".format(
+                stock_syms, start_date, end_date, error))
         if df.empty:
             raise ValueError("No data available")
         return df
@@ -0,0 +1,218 @@
+'''
+Abuse rules: conditions on manipulated data (traders data with stocks data of the trade date),
+declared once and evaluated together in one vectorised pass. Each rule sets its bit in the flags
+bitmask of a record, a record is suspicious if any bit is set
+
+- RULES: all rules by name
+- DEFAULT_RULES: rules of the original analysis, not a trading date and price out of the day range
+- RuleSet(rules, volume_ratio, move, cluster_size).evaluate(data)
+- get_rule_names(flags)
+'''
+from .schema import empty_trade_keys, find_duplicate_trades
+import numpy as np
+import pandas as pd
+
+# Type of flags bitmasks, one bit per rule
+FLAGS_DTYPE = 'uint16'
+
+
+class Rule():
+    '''
+    A condition on manipulated data, flagged with bit in the flags bitmask
+    '''
+
+    def __init__(self, name, bit, description, function, traders_columns=[], stocks_columns=[]):
+        '''
+        (str, int, str, callable, list, list) -> NoneType
+
+        function(data, rule_set) -> numpy array of bool, True if the record is flagged
+        traders_columns: columns of traders data needed besides the base columns (see schema.RULE_DTYPES)
+        stocks_columns: daily columns of stocks data needed besides High and Low (see price_index.DAILY_COLUMNS)
+        '''
+        self.name = name
+        self.bit = bit
+        self.description = description
+        self.function = function
+        self.traders_columns = traders_columns
+        self.stocks_columns = stocks_columns
+
+
+def not_trading_day(data, rule_set):
+    '''
+    Not a trading date for the stock - missing High / Low values of the day
+    '''
+    return np.isnan(data.High.values)
+
+
+def price_out_of_range(data, rule_set):
+    '''
+    Price is outside of the trading price range in the day
+    '''
+    price = data.price.values
+    return (price > data.High.values) | (price < data.Low.values)
+
+
+def price_at_high_low(data, rule_set):
+    '''
+    Price is exactly the High or the Low of the day
+    '''
+    price = data.price.values
+    return (price == data.High.values) | (price == data.Low.values)
+
+
+def large_volume(data, rule_set):
+    '''
+    Volume of the trade is above volume_ratio times the market volume of the stock in the day
+    '''
+    return data.volume.values > rule_set.volume_ratio * data.Volume.values
+
+
+def duplicate_trade(data, rule_set):
+    '''
+    tradeId already seen: in a previous record of data, or in data evaluated before by the same rule set.
+    Records without tradeId are not duplicates. Duplicates found before on all data (e.g. partitioned
+    by stock symbol afterwards) are rule_set.duplicates if not None
+    '''
+    if rule_set.duplicates is not None:
+        return rule_set.duplicates
+    flagged, rule_set.trade_keys = find_duplicate_trades(data.tradeId, rule_set.trade_keys)
+    return flagged
+
+
+def get_trades_before_move(data, move):
+    '''
+    (pandas DataFrame, float) -> Tuple (numpy array, pandas DataFrame)
+
+    Positions of the records of a trader on the day before a close price move of move or more (up or down),
+    and their traderId, stockSymbol and day (days since 1970-01-01)
+    '''
+    with np.errstate(invalid='ignore'):
+        rows = np.flatnonzero((np.abs(data.NextMove.values) >= move) & data.traderId.notna().values)
+    keys = pd.DataFrame({
+        'traderId': np.asarray(data.traderId.values[rows], dtype=object),
+        'stockSymbol': np.asarray(data.stockSymbol.values[rows], dtype=object),
+        'day': data.tradeDate.values[rows].astype('datetime64[D]').astype('int64')})
+    return rows, keys
+
+
+def cluster_before_move(data, rule_set):
+    '''
+    Close price of the stock moves by move or more (up or down) on the next trading day,
+    and the trader made cluster_size trades or more of the stock in the day: counted in data,
+    or in all data counted by rule_set.count_clusters() if any (e.g. all chunks of traders data)
+    '''
+    flagged = np.zeros(len(data), dtype=bool)
+    rows, keys = get_trades_before_move(data, rule_set.move)
+    if not len(rows):
+        return flagged
+    counts = rule_set.cluster_counts if rule_set.cluster_counts is not None else keys.value_counts()
+    flagged[rows] = counts.reindex(pd.MultiIndex.from_frame(keys)).fillna(0).values >= rule_set.cluster_size
+    return flagged
+
+
+RULES = {rule.name: rule for rule in [
+    Rule('not_trading_day', 0, 'not a trading date of the stock', not_trading_day),
+    Rule('price_out_of_range', 1, 'price out of the High / Low range of the day', price_out_of_range),
+    Rule('price_at_high_low', 2, 'price at the High or Low of the day', price_at_high_low),
+    Rule('large_volume', 3, 'volume above a share of the market volume of the day', large_volume,
+         traders_columns=['volume'], stocks_columns=['Volume']),
+    Rule('duplicate_trade', 4, 'tradeId already seen', duplicate_trade,
+         traders_columns=['tradeId']),
+    Rule('cluster_before_move', 5, 'cluster of trades of the trader the day before a large price move',
+         cluster_before_move, stocks_columns=['NextMove']),
+]}
+
+DEFAULT_RULES = ['not_trading_day', 'price_out_of_range']
+
+
+class RuleSet():
+    '''
+    Rules evaluated together, and their parameters
+
+    - evaluate(data)
+    - count_clusters(data)
+    - traders_columns, stocks_columns
+    '''
+
+    def __init__(self, rules=None, volume_ratio=0.1, move=0.05, cluster_size=3):
+        '''
+        (list, float, float, int) -> NoneType
+
+        rules: names of rules (see RULES), 'all' for all rules, DEFAULT_RULES if not provided
+        volume_ratio: large_volume flags trades above volume_ratio times the market volume of the day
+        move: cluster_before_move flags trades before a close price change of move or more (0.05 is 5%)
+        cluster_size: cluster_before_move flags traders with cluster_size trades or more of the stock in the day
+        '''
+        if rules is None:
+            rules = DEFAULT_RULES
+        elif rules == 'all':
+            rules = list(RULES)
+        unknown = [name for name in rules if name not in RULES]
+        if unknown or not rules:
+            raise ValueError("Unknown rules {}".format(unknown))
+        self.rules = sorted((RULES[name] for name in set(rules)), key=lambda rule: rule.bit)
+        self.volume_ratio = volume_ratio
+        self.move = move
+        self.cluster_size = cluster_size
+        # tradeIds of data evaluated and their hashes, for duplicate_trade
+        self.trade_keys = empty_trade_keys()
+        # Records of the data evaluated flagged by duplicate_trade, if found before (see duplicate_trade)
+        self.duplicates = None
+        # Trades before a move per (traderId, stockSymbol, day) of data counted by count_clusters(),
+        # for cluster_before_move (clusters are counted in the data evaluated if None)
+        self.cluster_counts = None
+
+    @property
+    def names(self):
+        return [rule.name for rule in self.rules]
+
+    @property
+    def traders_columns(self):
+        '''
+        () -> list
+
+        Columns of traders data needed by the rules, besides the base columns
+        '''
+        return sorted(set(column for rule in self.rules for column in rule.traders_columns))
+
+    @property
+    def stocks_columns(self):
+        '''
+        () -> list
+
+        Daily columns of stocks data needed by the rules, besides High and Low
+        '''
+        return sorted(set(column for rule in self.rules for column in rule.stocks_columns))
+
+    def count_clusters(self, data):
+        '''
+        (pandas DataFrame) -> NoneType
+
+        Add the trades before a move of manipulated data to cluster_counts: data evaluated in parts
+        (e.g. chunks) is counted first, so cluster_before_move flags the same records as on the whole data
+        '''
+        _, keys = get_trades_before_move(data, self.move)
+        counts = keys.value_counts()
+        self.cluster_counts = counts if self.cluster_counts is None else self.cluster_counts.add(
+            counts, fill_value=0)
+
+    def evaluate(self, data):
+        '''
+        (pandas DataFrame) -> numpy array
+
+        Flags bitmask of each record of manipulated data, bit of each rule set if flagged.
+        Rules read columns of data without copying data, flags are combined in place
+        '''
+        flags = np.zeros(len(data), dtype=FLAGS_DTYPE)
+        for rule in self.rules:
+            flags |= rule.function(data, self).astype(FLAGS_DTYPE) << np.uint16(rule.bit)
+        return flags
+
+
+def get_rule_names(flags):
+    '''
+    (int) -> list
+
+    Names of the rules set in flags bitmask
+    '''
+    return [name for name, rule in RULES.items() if int(flags) >> rule.bit & 1]
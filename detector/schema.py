@@ -0,0 +1,106 @@
+'''
+Schema of traders data csv files
+
+- TRADERS_DTYPES: columns needed for analysis and their types
+- TRADERS_COLUMNS: columns read from csv files
+- TRADE_DATETIME_FORMAT: format of tradeDatetime column
+- RULE_DTYPES: columns read only when a rule needs them (see detector.rules) and their types
+- concat_frames(frames): concatenate data frames keeping category columns
+- find_duplicate_trades(trade_ids, seen): trades with a tradeId already seen
+- empty_trade_keys(): no tradeIds seen yet, seen of find_duplicate_trades
+'''
+import numpy as np
+import pandas as pd
+
+# Types of columns needed for analysis, categories are built when reading the file
+# (text columns as category: each distinct value is stored once)
+TRADERS_DTYPES = {
+    'countryCode': 'category',
+    'firstName': 'category',
+    'lastName': 'category',
+    'traderId': 'category',
+    'stockSymbol': 'category',
+    'stockName': 'category',
+    'price': 'float64',
+}
+
+# tradeDatetime has no declared type, it is parsed once with TRADE_DATETIME_FORMAT after reading
+# (or natively as timestamp by the pyarrow engine)
+TRADERS_COLUMNS = list(TRADERS_DTYPES) + ['tradeDatetime']
+
+TRADE_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Columns of traders data read only when a rule needs them, not kept otherwise
+# (tradeId is unique per trade, a category would not save memory)
+RULE_DTYPES = {
+    'tradeId': 'object',
+    'volume': 'float64',
+}
+
+
+def concat_frames(frames):
+    '''
+    (list of pandas DataFrame) -> pandas DataFrame
+
+    Concatenate data frames, columns that are category in all data frames
+    stay category, of all values (pandas falls back to object if categories differ)
+    '''
+    frames = list(frames)
+    dtypes = {}
+    for column in frames[0].columns:
+        columns = [frame[column] for frame in frames if column in frame]
+        if len(columns) == len(frames) and all(isinstance(values.dtype, pd.CategoricalDtype) for values in columns):
+            dtypes[column] = pd.CategoricalDtype(np.unique(np.concatenate(
+                [values.cat.categories.values for values in columns])))
+    if dtypes:
+        frames = [frame.astype(dtypes, copy=False) for frame in frames]
+    return pd.concat(frames, ignore_index=True)
+
+
+def empty_trade_keys():
+    '''
+    () -> pandas DataFrame
+
+    No tradeIds seen yet: 'key' (hash of tradeId) and 'tradeId' columns, see find_duplicate_trades
+    '''
+    return pd.DataFrame({'key': np.empty(0, dtype='uint64'), 'tradeId': np.empty(0, dtype=object)})
+
+
+def find_duplicate_trades(trade_ids, seen=None):
+    '''
+    (pandas Series, pandas DataFrame) -> Tuple (numpy array of bool, pandas DataFrame)
+
+    Find trades with a tradeId already seen: in a previous record, or in seen (distinct tradeIds
+    of data read before, e.g. previous chunks, with their hashes, sorted by hash: see empty_trade_keys).
+    Records without tradeId are not duplicates. tradeIds are hashed once and looked up by hash,
+    only tradeIds of the same hash are compared as text (distinct tradeIds may have the same hash).
+    Return duplicates and tradeIds seen including trade_ids (None if seen is None)
+    '''
+    values = trade_ids.values
+    valid = np.asarray(pd.notna(values))
+    ids = np.asarray(values[valid], dtype=object)
+    keys = pd.util.hash_array(values[valid], categorize=False)
+    duplicate = np.zeros(len(keys), dtype=bool)
+    candidates = pd.Series(keys).duplicated(keep=False).values
+    if candidates.any():
+        duplicate[candidates] = pd.Series(ids[candidates]).duplicated().values
+    if seen is not None:
+        seen_keys, seen_ids = seen.key.values, seen.tradeId.values
+        if len(seen):
+            first = np.minimum(np.searchsorted(seen_keys, keys), len(seen_keys) - 1)
+            matched = np.flatnonzero(seen_keys[first] == keys)
+            last = np.searchsorted(seen_keys, keys[matched], side='right')
+            single = last - first[matched] == 1
+            duplicate[matched[single]] |= seen_ids[first[matched[single]]] == ids[matched[single]]
+            # several tradeIds seen with the same hash
+            for position, end in zip(matched[~single], last[~single]):
+                duplicate[position] |= ids[position] in seen_ids[first[position]:end]
+        # new tradeIds inserted in order of hash, after tradeIds seen with the same hash
+        new = np.flatnonzero(~duplicate)
+        new = new[np.argsort(keys[new], kind='stable')]
+        positions = np.searchsorted(seen_keys, keys[new], side='right')
+        seen = pd.DataFrame({'key': np.insert(seen_keys, positions, keys[new]),
+                             'tradeId': np.insert(seen_ids, positions, ids[new])}, copy=False)
+    duplicates = np.zeros(len(values), dtype=bool)
+    duplicates[valid] = duplicate
+    return duplicates, seen
@@ -0,0 +1,552 @@
+'''
+Streaming detection of suspicious trades from live trade feeds
+
+python -m detector stream < trades.jsonl
+python -m detector stream --input-format csv --port 9000
+
+Trades arrive as lines of JSON objects, or csv rows after a header line, with the columns of traders data.
+Suspicious trades are emitted as alerts (JSON lines) as soon as they are flagged
+'''
+import asyncio
+import csv
+import json
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import date, datetime
+import numpy as np
+import pandas as pd
+from .manipulator import Manipulator
+from .price_index import PriceIndex
+from .profiler import profiler
+from .providers import YahooProvider
+from .schema import TRADE_DATETIME_FORMAT
+
+# Ordinal of 1970-01-01, day numbers are days since 1970-01-01 as in PriceIndex
+EPOCH_ORDINAL = datetime(1970, 1, 1).toordinal()
+# Columns of processed stocks data in the price table
+PRICE_COLUMNS = ['Symbols', 'Date', 'High', 'Low']
+# Seconds before days without stocks data (today, not published yet or failed fetch) are fetched again
+REFRESH_INTERVAL = 300
+
+
+class StreamDetector():
+    '''
+    Flag suspicious trades as they arrive, same rules as Analysis:
+    1. Not a trading date for the stock
+    2. Price is outside of the trading price range in the day
+
+    - run(lines, on_alert, input_format)
+    - detect(records)
+    - update_prices(stocks_data_df)
+    - count_suspicious_per_trader()
+    - count_suspicious_by_country_per_month()
+    - stats()
+    '''
+
+    def __init__(self, stock_symbols=[], price_cache=None, batch_size=1000, batch_timeout=0,
+                 refresh_interval=REFRESH_INTERVAL):
+        '''
+        (list, PriceCache, int, float, float) -> NoneType
+
+        stock_symbols: only trades of stock symbols selected, all stocks if not provided
+        price_cache: local cache of stocks data or other price provider (see detector.providers), yahoo if not provided.
+        Daily High / Low of each stock are fetched once per date range and kept in an in-memory price table
+        batch_size: maximum number of trades flagged together
+        batch_timeout: seconds to wait for more trades before flagging a batch (0: flag the trades already received,
+        so batches only grow when trades arrive faster than they are flagged)
+        refresh_interval: seconds before days without stocks data are fetched again: today (High / Low of the day
+        so far), days not published yet, or days of a failed fetch
+        '''
+        self.stock_symbols = stock_symbols
+        self.price_provider = price_cache if price_cache is not None else YahooProvider()
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.refresh_interval = refresh_interval
+        # In-memory price table, its index and the symbol codes of the index, replaced together in one
+        # assignment: stocks data is fetched in threads while trades are flagged
+        self.__prices = (pd.DataFrame(columns=PRICE_COLUMNS), None, {})
+        self.__prices_lock = threading.Lock()
+        # Fetches of stocks data run one at a time
+        self.__fetch_lock = threading.Lock()
+        # Date range fetched of each stock symbol (first and last day), up to the last day with stocks data
+        # before today, and days fetched without stocks data (first and last day, and time to fetch them again)
+        self.__fetched = {}
+        self.__pending = {}
+        # Running counters, read by the dashboard from other threads
+        self.__lock = threading.Lock()
+        self.__countries = set()
+        self.__trader_counts = Counter()
+        self.__country_month_counts = Counter()
+        self.start_date = None
+        self.end_date = None
+        self.trades = 0
+        self.suspicious = 0
+        self.errors = 0
+        self.batches = 0
+        # Seconds from arrival of each trade to its alert (or to flagged as not suspicious)
+        self.__latencies = deque(maxlen=100000)
+
+    async def run(self, lines, on_alert=None, input_format='json'):
+        '''
+        (async iterable, callable, str) -> NoneType
+
+        Read trades until the end of the stream and flag them in micro-batches,
+        call on_alert(alert) for each suspicious trade.
+        lines: str or bytes lines (JSON objects or csv rows, first csv row is the header) or dict records
+        '''
+        # bounded queue: the reader waits while a full batch is flagged
+        queue = asyncio.Queue(maxsize=self.batch_size)
+        consumer = asyncio.create_task(self.__consume(queue, on_alert))
+        try:
+            async for record in self.__read_records(lines, input_format):
+                await queue.put(record)
+        finally:
+            await queue.put(None)
+            await consumer
+
+    async def __read_records(self, lines, input_format):
+        '''
+        (async iterable, str) -> async generator of Tuple (dict, float)
+
+        Decode lines to records, with arrival time of each record. Lines that can not be decoded are counted as errors
+        '''
+        header = None
+        async for line in lines:
+            arrival = time.perf_counter()
+            if isinstance(line, dict):
+                yield line, arrival
+                continue
+            if isinstance(line, bytes):
+                line = line.decode('utf-8', 'replace')
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                if input_format == 'csv':
+                    values = next(csv.reader([line]))
+                    if header is None:
+                        header = values
+                        continue
+                    record = dict(zip(header, values))
+                else:
+                    record = json.loads(line)
+                    if not isinstance(record, dict):
+                        raise ValueError("Not a trade {}".format(line))
+            except ValueError:
+                self.errors += 1
+                continue
+            yield record, arrival
+
+    async def __consume(self, queue, on_alert):
+        '''
+        (asyncio.Queue, callable) -> NoneType
+
+        Take trades received (and arriving within batch_timeout) as a batch, up to batch_size, and flag them.
+        Missing stocks data is fetched in a thread, so the stream keeps being read
+        '''
+        loop = asyncio.get_running_loop()
+        done = False
+        while not done:
+            batch = [await queue.get()]
+            deadline = loop.time() + self.batch_timeout
+            while len(batch) < self.batch_size and batch[-1] is not None:
+                if not queue.empty():
+                    batch.append(queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            if batch[-1] is None:
+                done = True
+                batch.pop()
+            if not batch:
+                continue
+            trades = self.__parse_records([record for record, _ in batch])
+            missing = self.__get_missing_prices(trades)
+            if missing:
+                await loop.run_in_executor(None, self.__fetch_prices, missing)
+            alerts = self.__flag(trades)
+            if on_alert:
+                for alert in alerts:
+                    on_alert(alert)
+            now = time.perf_counter()
+            self.__latencies.extend(now - arrival for _, arrival in batch)
+
+    def detect(self, records):
+        '''
+        (list of dict) -> list of dict
+
+        Flag a batch of trades (dict of traders data columns, values as in csv file or JSON),
+        fetch stocks data if not in the price table, update counters. Return alerts of suspicious trades
+        '''
+        trades = self.__parse_records(records)
+        missing = self.__get_missing_prices(trades)
+        if missing:
+            self.__fetch_prices(missing)
+        return self.__flag(trades)
+
+    def __parse_records(self, records):
+        '''
+        (list of dict) -> list of dict
+
+        Validate trades, same filter as batch traders data: stockSymbol, traderId and tradeDatetime are required,
+        stock symbols selected only. Add name, tradeDate and day number. Invalid trades are counted as errors
+        '''
+        trades = []
+        for record in records:
+            try:
+                trade = self.__parse_record(record)
+            except (ValueError, TypeError):
+                self.errors += 1
+                continue
+            if trade is not None:
+                trades.append(trade)
+        return trades
+
+    def __parse_record(self, record):
+        '''
+        (dict) -> dict
+
+        Parse one trade, None if trade is not valid or stock is not selected
+        '''
+        symbol = self.__get_text(record, 'stockSymbol')
+        trader_id = self.__get_text(record, 'traderId')
+        trade_datetime = self.__get_text(record, 'tradeDatetime')
+        if symbol is None or trader_id is None or trade_datetime is None:
+            return None
+        if self.stock_symbols and symbol not in self.stock_symbols:
+            return None
+        trade_date = self.__parse_datetime(trade_datetime)
+        price = record.get('price')
+        first_name = self.__get_text(record, 'firstName')
+        last_name = self.__get_text(record, 'lastName')
+        return {
+            'countryCode': self.__get_text(record, 'countryCode'),
+            'name': first_name + ' ' + last_name if first_name is not None and last_name is not None else None,
+            'traderId': trader_id,
+            'stockSymbol': symbol,
+            'stockName': self.__get_text(record, 'stockName'),
+            'price': float(price) if price not in (None, '') else np.nan,
+            'tradeDatetime': trade_datetime,
+            'tradeDate': trade_datetime[:10],
+            'day': trade_date.toordinal() - EPOCH_ORDINAL,
+        }
+
+    @staticmethod
+    def __parse_datetime(value):
+        '''
+        (str) -> datetime
+
+        Parse tradeDatetime, format checked same as TRADE_DATETIME_FORMAT (faster than strptime)
+        '''
+        if len(value) != 19 or value[10] != ' ':
+            raise ValueError("time data {!r} does not match format {!r}".format(
+                value, TRADE_DATETIME_FORMAT))
+        return datetime.fromisoformat(value)
+
+    @staticmethod
+    def __get_text(record, column):
+        '''
+        (dict, str) -> str
+
+        Text value of column, None if missing or empty (read as missing from csv files)
+        '''
+        value = record.get(column)
+        return str(value) if value not in (None, '') else None
+
+    def __get_missing_prices(self, trades):
+        '''
+        (list of dict) -> dict
+
+        First and last day of trades of each stock symbol out of the date range fetched,
+        days fetched without stocks data are missing again after refresh_interval
+        '''
+        now = time.monotonic()
+        missing = {}
+        for trade in trades:
+            symbol, day = trade['stockSymbol'], trade['day']
+            if not self.__is_missing(symbol, day, now):
+                continue
+            first, last = missing.get(symbol, (day, day))
+            missing[symbol] = (min(first, day), max(last, day))
+        return missing
+
+    def __is_missing(self, symbol, day, now):
+        '''
+        (str, int, float) -> bool
+
+        Day of symbol out of the date range fetched, and not fetched without stocks data within refresh_interval
+        '''
+        fetched = self.__fetched.get(symbol)
+        if fetched is not None and fetched[0] <= day <= fetched[1]:
+            return False
+        pending = self.__pending.get(symbol)
+        return pending is None or not pending[0] <= day <= pending[1] or now >= pending[2]
+
+    def __fetch_prices(self, missing):
+        '''
+        (dict) -> NoneType
+
+        Fetch stocks data of missing stock symbols from price provider, whole months from their first to last day
+        (up to today, and including the date range already fetched, so it stays one range per symbol),
+        and add it to the price table.
+        Only days up to the last day with stocks data (before today) are fetched for good, later days
+        (and all days if the fetch fails) are fetched again after refresh_interval.
+        Fetches run one at a time, date ranges fetched meanwhile by another batch are not fetched again
+        '''
+        with self.__fetch_lock:
+            now = time.monotonic()
+            missing = {symbol: (first, last) for symbol, (first, last) in missing.items()
+                       if self.__is_missing(symbol, first, now) or self.__is_missing(symbol, last, now)}
+            if not missing:
+                return
+            today = date.today().toordinal() - EPOCH_ORDINAL
+            ranges = {}
+            for symbol, (first, last) in missing.items():
+                first = np.datetime64(first, 'D').astype('datetime64[M]').astype('datetime64[D]').astype('int64')
+                last = max(last, min(today, (np.datetime64(last, 'D').astype('datetime64[M]') + 1).astype(
+                    'datetime64[D]').astype('int64') - 1))
+                fetched = self.__fetched.get(symbol, (first, last))
+                ranges[symbol] = (min(first, fetched[0]), max(last, fetched[1]))
+            start = min(first for first, _ in ranges.values())
+            end = max(last for _, last in ranges.values())
+            last_days = {}
+            try:
+                stocks_data_df = Manipulator.process_stocks_data(self.price_provider.fetch(
+                    sorted(ranges), self.__to_date(start), self.__to_date(end)))
+                self.update_prices(stocks_data_df)
+                last_days = pd.to_datetime(stocks_data_df.Date).values.astype('datetime64[D]').astype('int64')
+                last_days = pd.Series(last_days).groupby(stocks_data_df.Symbols.astype(str).values).max().to_dict()
+            except ValueError:
+                # no stocks data: trades in range are flagged as not on trading dates until fetched again
+                pass
+            expires = time.monotonic() + self.refresh_interval
+            for symbol, (first, last) in ranges.items():
+                # today's High / Low can still change
+                fetched = min(last_days.get(symbol, first - 1), last, today - 1)
+                if fetched >= first:
+                    self.__fetched[symbol] = (first, fetched)
+                if fetched < last:
+                    self.__pending[symbol] = (max(first, fetched + 1), last, expires)
+                else:
+                    self.__pending.pop(symbol, None)
+
+    @staticmethod
+    def __to_date(day):
+        '''
+        (int) -> str: YYYY-MM-DD
+        '''
+        return str(np.datetime64(int(day), 'D'))
+
+    def update_prices(self, stocks_data_df):
+        '''
+        (pandas DataFrame) -> NoneType
+
+        Add or replace High / Low of the day in the price table,
+        e.g. intraday High / Low of today from a live feed.
+        High / Low of days already in the price table are replaced in place, the price table and its index
+        are only built again to add days or stock symbols
+        stocks_data_df: processed stocks data with Symbols, Date, High and Low columns
+        '''
+        stocks_data_df = stocks_data_df[PRICE_COLUMNS].astype({'Symbols': str})
+        stocks_data_df['Date'] = pd.to_datetime(stocks_data_df.Date)
+        with self.__prices_lock:
+            stocks_data, price_index, _ = self.__prices
+            if price_index is not None:
+                found = price_index.update_codes(
+                    price_index.symbols.get_indexer(stocks_data_df.Symbols),
+                    stocks_data_df.Date.values.astype('datetime64[D]').astype('int64'),
+                    stocks_data_df.High.values.astype('float64'), stocks_data_df.Low.values.astype('float64'))
+                if found.all():
+                    return
+                # rows of the price table are the rows of its index, with High / Low replaced since built
+                stocks_data = stocks_data.assign(High=price_index.high, Low=price_index.low)
+                stocks_data_df = stocks_data_df[~found]
+            stocks_data_df = pd.concat([stocks_data, stocks_data_df], ignore_index=True).drop_duplicates(
+                ['Symbols', 'Date'], keep='last')
+            price_index = PriceIndex(stocks_data_df) if len(stocks_data_df) else None
+            symbol_codes = {symbol: code for code, symbol in enumerate(price_index.symbols)} if price_index else {}
+            # trades flagged meanwhile see the previous or the new price table, never a mix of both
+            self.__prices = (stocks_data_df, price_index, symbol_codes)
+
+    def __flag(self, trades):
+        '''
+        (list of dict) -> list of dict
+
+        Flag trades against the price table, update counters.
+        Return alerts: suspicious trades with High, Low and reason
+        '''
+        if not trades:
+            return []
+        _, price_index, symbol_codes = self.__prices
+        with profiler.stage('stream.detect', len(trades)) as record:
+            prices = np.array([trade['price'] for trade in trades], dtype='float64')
+            if price_index is None:
+                found = np.zeros(len(trades), dtype=bool)
+                high = low = np.full(len(trades), np.nan)
+            else:
+                found, high, low = price_index.lookup_codes(
+                    np.array([symbol_codes.get(trade['stockSymbol'], -1) for trade in trades], dtype='int64'),
+                    np.array([trade['day'] for trade in trades], dtype='int64'))
+            suspicious = ~found | (prices > high) | (prices < low)
+            alerts = []
+            for i in np.flatnonzero(suspicious):
+                alert = {column: value for column, value in trades[i].items() if column != 'day'}
+                alert['price'] = None if np.isnan(prices[i]) else alert['price']
+                alert['High'] = float(high[i]) if found[i] else None
+                alert['Low'] = float(low[i]) if found[i] else None
+                alert['reason'] = 'not a trading date' if not found[i] else (
+                    'price above high' if prices[i] > high[i] else 'price below low')
+                alerts.append(alert)
+            record['rows_out'] = len(alerts)
+        self.__count(trades, alerts)
+        return alerts
+
+    def __count(self, trades, alerts):
+        '''
+        (list of dict, list of dict) -> NoneType
+
+        Update running counters with a flagged batch
+        '''
+        with self.__lock:
+            for trade in trades:
+                if trade['countryCode'] is not None:
+                    self.__countries.add(trade['countryCode'])
+            dates = [trade['tradeDate'] for trade in trades]
+            self.start_date = min(dates + ([self.start_date] if self.start_date else []))
+            self.end_date = max(dates + ([self.end_date] if self.end_date else []))
+            for alert in alerts:
+                if alert['name'] is not None:
+                    self.__trader_counts[(alert['traderId'], alert['name'])] += 1
+                if alert['countryCode'] is not None:
+                    self.__country_month_counts[(alert['countryCode'], alert['tradeDate'][:7])] += 1
+            self.trades += len(trades)
+            self.suspicious += len(alerts)
+            self.batches += 1
+
+    def count_suspicious_per_trader(self):
+        '''
+        () -> pandas DataFrame
+
+        Suspicious trades flagged so far by traders in descending order, same format as Analysis
+        '''
+        with self.__lock:
+            counts = list(self.__trader_counts.items())
+        data = pd.DataFrame([(trader_id, name, count) for (trader_id, name), count in counts],
+                            columns=['traderId', 'name', 'suspicious'])
+        data = data.sort_values(['suspicious', 'traderId', 'name'], ascending=[
+                                False, True, True], ignore_index=True)
+        data.index += 1
+        data.index.name = "rank"
+        return data
+
+    def count_suspicious_by_country_per_month(self):
+        '''
+        () -> pandas DataFrame
+
+        Suspicious trades flagged so far by country per month, same format as Analysis:
+        all countries seen, all months between the first and last month with suspicious trades
+        '''
+        with self.__lock:
+            counts = list(self.__country_month_counts.items())
+            countries = sorted(self.__countries)
+        months = sorted({month for (_, month), _ in counts})
+        if months:
+            months = list(pd.period_range(months[0], months[-1], freq='M').strftime('%Y-%m'))
+        data = pd.DataFrame(0, index=countries, columns=months, dtype='int64')
+        for (country, month), count in counts:
+            data.at[country, month] = count
+        data.columns = pd.Index(months, dtype=object, name="month")
+        data.index = pd.CategoricalIndex(
+            data.index, categories=countries, name="country code")
+        data['total'] = data.sum(axis=1).astype('int64')
+        return data.sort_values('total', ascending=False)
+
+    def stats(self):
+        '''
+        () -> dict
+
+        Trades flagged, suspicious, errors and batches,
+        latency from arrival to flagged of recent trades in milliseconds (50th, 99th percentile and max)
+        '''
+        latencies = np.array(self.__latencies) * 1000
+        stats = {'trades': self.trades, 'suspicious': self.suspicious,
+                 'errors': self.errors, 'batches': self.batches}
+        for name, value in [('p50', 50), ('p99', 99), ('max', 100)]:
+            stats['latency_{}_ms'.format(name)] = float(
+                np.percentile(latencies, value)) if len(latencies) else None
+        return stats
+
+
+async def read_lines(reader):
+    '''
+    (asyncio.StreamReader) -> async generator of bytes
+
+    Lines of a stream until its end
+    '''
+    while True:
+        line = await reader.readline()
+        if not line:
+            return
+        yield line
+
+
+async def read_queue(queue):
+    '''
+    (asyncio.Queue) -> async generator
+
+    Items of a local queue (stand-in for a message queue) until None is put
+    '''
+    while True:
+        item = await queue.get()
+        if item is None:
+            return
+        yield item
+
+
+async def read_stdin():
+    '''
+    () -> async generator of bytes
+
+    Lines of standard input, read without blocking the event loop
+    '''
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    try:
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    except ValueError:
+        # regular file redirected to stdin, not a pipe: read in a thread
+        while True:
+            line = await loop.run_in_executor(None, sys.stdin.buffer.readline)
+            if not line:
+                return
+            yield line
+        return
+    async for line in read_lines(reader):
+        yield line
+
+
+async def serve(detector, host='127.0.0.1', port=9000, on_alert=None, input_format='json'):
+    '''
+    (StreamDetector, str, int, callable, str) -> asyncio.Server
+
+    Accept trade feeds over TCP, one stream of lines per connection.
+    Alerts are sent back to the connection as JSON lines, and to on_alert
+    '''
+    async def handle(reader, writer):
+        def emit(alert):
+            writer.write(json.dumps(alert).encode('utf-8') + b'\n')
+            if on_alert:
+                on_alert(alert)
+        try:
+            await detector.run(read_lines(reader), emit, input_format)
+            await writer.drain()
+        finally:
+            writer.close()
+    return await asyncio.start_server(handle, host, port)
@@ -0,0 +1,107 @@
+from .schema import TRADE_DATETIME_FORMAT
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+# Columnar file formats and their file extensions
+FILE_EXTENSIONS = {'parquet': 'parquet', 'ipc': 'arrow'}
+# Column of the index of data frames written by Writer.write_frame, if not the default index
+INDEX_COLUMN = '__index__'
+
+
+class Writer():
+    '''
+    Data writer to Parquet or Arrow IPC files, read back with Reader.load_dataset_to_df
+    '''
+    @staticmethod
+    def __check_format(file_format):
+        if file_format not in FILE_EXTENSIONS:
+            raise ValueError("Unknown file format {}".format(file_format))
+
+    @classmethod
+    def write_dataset(cls, df, path, file_format='parquet', row_group_size=100000):
+        '''
+        (pandas DataFrame, str, str, int) -> NoneType
+
+        Write traders data (raw with tradeDatetime, or manipulated with tradeDate) to directory path
+        partitioned by stockSymbol and trade month: path/stockSymbol=AMZN/tradeMonth=2020-07/part-0.parquet.
+        Rows are sorted by trade date in each partition, so row groups cover date ranges.
+        Existing data in path is replaced. Needs pyarrow.
+        file_format: 'parquet' or 'ipc' (Arrow IPC, can be memory-mapped)
+        '''
+        # optional dependency, only needed for columnar files
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        cls.__check_format(file_format)
+        if 'tradeDate' in df:
+            trade_date = df.tradeDate
+        else:
+            trade_date = pd.to_datetime(
+                df.tradeDatetime, format=TRADE_DATETIME_FORMAT)
+        df = df.assign(tradeMonth=trade_date.dt.strftime('%Y-%m'), __date=trade_date)
+        df = df.sort_values(['stockSymbol', 'tradeMonth', '__date'], kind='stable').drop(
+            columns='__date')
+        # string partition keys, so missing symbols are written to a default partition and read back as missing
+        df['stockSymbol'] = df.stockSymbol.astype(object)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        ds.write_dataset(table, path, format=file_format, partitioning=['stockSymbol', 'tradeMonth'],
+                         partitioning_flavor='hive', max_rows_per_group=row_group_size,
+                         min_rows_per_group=min(row_group_size, 10000),
+                         basename_template='part-{{i}}.{}'.format(FILE_EXTENSIONS[file_format]))
+
+    @classmethod
+    def write_report(cls, report, path, file_format='parquet'):
+        '''
+        (pandas DataFrame, str, str) -> NoneType
+
+        Write a report of Analysis to a Parquet or Arrow IPC file, index as columns (e.g. rank, country code)
+        and column names as text (e.g. months YYYY-MM). Needs pyarrow.
+        '''
+        cls.__check_format(file_format)
+        df = report.rename_axis(columns=None).reset_index()
+        df.columns = [str(column) for column in df.columns]
+        if file_format == 'parquet':
+            df.to_parquet(path, index=False)
+        else:
+            df.to_feather(path)
+
+    @staticmethod
+    def write_frame(df, path):
+        '''
+        (pandas DataFrame, str) -> NoneType
+
+        Write data frame (and its index, if not the default index) to an uncompressed Arrow IPC file,
+        read back with Reader.load_frame. Columns are written as pandas holds them in memory,
+        so numeric and date columns are memory-mapped back without conversion:
+        missing values as NaN / NaT (not Arrow nulls), category as dictionary of its codes. Needs pyarrow.
+        '''
+        # optional dependency, only needed for columnar files
+        import pyarrow as pa
+
+        columns = dict(df.items())
+        if not df.index.equals(pd.RangeIndex(len(df))):
+            columns[INDEX_COLUMN] = df.index.to_series()
+        arrays = []
+        for values in columns.values():
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                codes = values.cat.codes.values
+                categories = values.cat.categories
+                arrays.append(pa.DictionaryArray.from_arrays(
+                    pa.array(codes, mask=codes < 0),
+                    pa.array(categories.values, type=pa.string() if categories.dtype == object else None)))
+            elif values.dtype.kind == 'M':
+                # NaT kept as its int64 value
+                arrays.append(pa.array(values.values.view('int64')).view(
+                    pa.timestamp(np.datetime_data(values.dtype)[0])))
+            elif values.dtype.kind in 'iufb':
+                arrays.append(pa.array(values.values))
+            else:
+                arrays.append(pa.array(values.values, from_pandas=True))
+        table = pa.Table.from_arrays(arrays, names=[str(name) for name in columns])
+        with pa.OSFile(path, 'wb') as file:
+            with pa.ipc.new_file(file, table.schema) as writer:
+                writer.write_table(table)
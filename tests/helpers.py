@@ -0,0 +1,36 @@
+import pandas as pd
+
+# Attributes of yahoo daily data
+YAHOO_ATTRIBUTES = ['Adj Close', 'Close', 'High', 'Low', 'Open', 'Volume']
+
+
+def yahoo_stocks_data(stock_syms, index, values):
+    '''
+    (list, pandas DatetimeIndex, dict) -> pandas DataFrame
+
+    For mock: yahoo format daily data of stock_syms on the days of index,
+    values: value of each attribute, the same for all stock symbols, None for the number of the day (from 0)
+    '''
+    columns = pd.MultiIndex.from_product(
+        [list(values), sorted(stock_syms)], names=['Attributes', 'Symbols'])
+    data = [[float(i) if value is None else value for value in values.values() for _ in stock_syms]
+            for i in range(len(index))]
+    return pd.DataFrame(data, index=index, columns=columns)
+
+
+def sample_stocks_data(stock_syms, start_date, end_date):
+    '''
+    For mock: yahoo format daily data of stock_syms on business days between start_date and end_date,
+    price range 1500 - 2500
+    '''
+    return yahoo_stocks_data(stock_syms, pd.bdate_range(start_date, end_date, name='Date'),
+                             {'High': 2500.0, 'Low': 1500.0})
+
+
+def sample_daily_data(stock_syms, start_date, end_date):
+    '''
+    For mock: yahoo format daily data of stock_syms on all days between start_date and end_date,
+    all attributes are the number of the day
+    '''
+    return yahoo_stocks_data(stock_syms, pd.date_range(start_date, end_date, name='Date'),
+                             dict.fromkeys(YAHOO_ATTRIBUTES))
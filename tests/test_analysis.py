@@ -1,6 +1,10 @@
+import importlib.util
+import os
+import tempfile
 import unittest
 from unittest.mock import patch, PropertyMock
 from detector.analysis import Analysis
+from tests.helpers import sample_stocks_data
 import pandas as pd
 
 
@@ -35,6 +39,252 @@ class TestAnalysis(unittest.TestCase):
         self.assertEqual(
             df.to_dict(), self.expected_suspicious_country_data.to_dict())
 
+    def test_count_suspicious_with_filters(self):
+        '''
+        Count suspicious trades of country BT, and trades on 2020-07-01 only
+        '''
+        df = self.analysis.count_suspicious_per_trader(countries=['BT'])
+        self.assertEqual(df.to_dict('records'), [
+                         {'traderId': 'TzqyQTQjZGeLZuJqlLaQ', 'name': 'Allison Davis', 'suspicious': 2}])
+        df = self.analysis.count_suspicious_per_trader(
+            stock_symbols=['AMZN'], start_date='2020-07-01', end_date='2020-07-01')
+        self.assertEqual(list(df.name), ['Brandi Robbins'])
+        df = self.analysis.count_suspicious_by_country_per_month(
+            countries=['BT', 'CV'])
+        self.assertEqual(df.to_dict(), {'2020-07': {'BT': 2, 'CV': 0}, 'total': {'BT': 2, 'CV': 0}})
+        df = self.analysis.count_suspicious_per_trader(stock_symbols=['FB'])
+        self.assertTrue(df.empty)
+
+    def test_top_suspicious_traders(self):
+        '''
+        Top traders in the last days up to end date, ties ranked by traderId
+        '''
+        df = self.analysis.top_suspicious_traders(2, end_date='2020-07-03')
+        self.assertEqual(df.to_dict('records'), [
+            {'traderId': 'TzqyQTQjZGeLZuJqlLaQ', 'name': 'Allison Davis', 'suspicious': 2},
+            {'traderId': 'JTzVqzzIkFlrYUQbhnOR', 'name': 'Brandi Robbins', 'suspicious': 1}])
+        self.assertEqual(df.index.name, 'rank')
+        df = self.analysis.top_suspicious_traders(10, 1, '2020-07-03')
+        self.assertEqual(list(df.name), ['Brittany Herring'])
+        df = self.analysis.top_suspicious_traders(10, 2, '2020-07-03')
+        self.assertEqual(list(df.suspicious), [2, 1])
+        self.assertTrue(self.analysis.top_suspicious_traders(
+            10, 7, '2020-06-30').empty)
+        self.assertRaises(ValueError, self.analysis.top_suspicious_traders, 0)
+
+    def test_select(self):
+        '''
+        Select suspicious records of AMZN from 2020-07-02, in original order
+        '''
+        df = self.analysis.select(['AMZN', 'TSLA'], start_date='2020-07-02')
+        self.assertEqual(list(df.index), [1, 2, 3])
+        self.assertTrue(self.analysis.select(['TSLA']).empty)
+        df = self.analysis.count_suspicious_by_country_per_month(stock_symbols=[
+                                                                 'TSLA'])
+        self.assertTrue(df.empty)
+
+    def test_trader_trades(self):
+        '''
+        Suspicious trades of Allison Davis and of country NZ sorted by trade date, by page
+        '''
+        df, total = self.analysis.trader_trades('TzqyQTQjZGeLZuJqlLaQ')
+        self.assertEqual((list(df.index), total), ([1, 2], 2))
+        df, total = self.analysis.trader_trades('TzqyQTQjZGeLZuJqlLaQ', 'Allison Davis', offset=1, limit=1)
+        self.assertEqual((list(df.price), total), ([2103.0], 2))
+        df, total = self.analysis.trader_trades('TzqyQTQjZGeLZuJqlLaQ', start_date='2020-07-03')
+        self.assertEqual((len(df), total), (0, 0))
+        self.assertEqual(self.analysis.trader_trades('TzqyQTQjZGeLZuJqlLaQ', 'Brandi Robbins')[1], 0)
+        self.assertEqual(self.analysis.trader_trades('unknown')[1], 0)
+        df, total = self.analysis.country_trades('NZ')
+        self.assertEqual((list(df.name), list(df['flags']), total), (['Brittany Herring'], [1], 1))
+        self.assertRaises(ValueError, self.analysis.country_trades, 'NZ', offset=-1)
+
+    @patch('detector.analysis.Manipulator')
+    def test_streaming_analysis(self, mockManipulatorClass):
+        '''
+        Analysis on manipulated data in 2 chunks gives the same results
+        '''
+        data = self.sample_manipulated_data
+        mockManipulator = mockManipulatorClass.return_value
+        mockManipulator.manipulate_chunks.return_value = iter(
+            [data.iloc[:2], data.iloc[2:]])
+        analysis = Analysis('sample.csv', ["AMZN"], chunksize=2)
+        self.assertFalse(mockManipulator.manipulate.called)
+        self.assertEqual(analysis.count_suspicious_per_trader().to_dict(),
+                         self.expected_suspicious_traders_data.to_dict())
+        self.assertEqual(analysis.count_suspicious_by_country_per_month().to_dict(),
+                         self.expected_suspicious_country_data.to_dict())
+
+    @patch('detector.analysis.Manipulator')
+    def test_database_analysis(self, mockManipulatorClass):
+        '''
+        Analysis in a database, traders data written in 2 chunks, gives the same results
+        and the same suspicious records, also with filters
+        '''
+        data = self.sample_manipulated_data
+        mockManipulator = mockManipulatorClass.return_value
+        mockManipulator.iter_traders_data.return_value = iter([data.iloc[:2], data.iloc[2:]])
+        mockManipulator.get_stocks_data.return_value = data[['Symbols', 'Date', 'High', 'Low']].dropna()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            analysis = Analysis('sample.csv', ["AMZN"], database=os.path.join(tmp_dir, 'trades.sqlite'))
+            self.assertFalse(mockManipulator.manipulate.called)
+            self.assertEqual(analysis.count_suspicious_per_trader().to_dict(),
+                             self.expected_suspicious_traders_data.to_dict())
+            self.assertEqual(analysis.count_suspicious_by_country_per_month().to_dict(),
+                             self.expected_suspicious_country_data.to_dict())
+            for filters in [{'countries': ['BT', 'CV']}, {'stock_symbols': ['FB']},
+                            {'stock_symbols': ['AMZN'], 'start_date': '2020-07-01', 'end_date': '2020-07-01'}]:
+                self.assertTrue(analysis.count_suspicious_per_trader(**filters).equals(
+                    self.analysis.count_suspicious_per_trader(**filters)))
+                self.assertTrue(analysis.count_suspicious_by_country_per_month(**filters).equals(
+                    self.analysis.count_suspicious_by_country_per_month(**filters)))
+            columns = ['countryCode', 'name', 'traderId', 'stockSymbol', 'price', 'tradeDate', 'High', 'Low',
+                       'flags', 'suspicious']
+            self.assertTrue(analysis.data[columns].astype(object).equals(
+                self.analysis.data[columns].reset_index(drop=True).astype(object)))
+            df, total = analysis.trader_trades('TzqyQTQjZGeLZuJqlLaQ', 'Allison Davis', offset=1, limit=1)
+            self.assertEqual((list(df.price), total), ([2103.0], 2))
+            df, total = analysis.country_trades('UZ', start_date='2020-07-01', end_date='2020-07-01')
+            self.assertEqual((list(df.name), total), (['Brandi Robbins'], 1))
+
+    @patch('detector.analysis.Manipulator')
+    def test_append(self, mockManipulatorClass):
+        '''
+        Append a batch of 2 trades in August, 1 suspicious for Brandi Robbins (UZ)
+        '''
+        self.analysis.start_date, self.analysis.end_date = '2020-07-01', '2020-07-03'
+        batch = self.sample_manipulated_data.iloc[[0, 4]]
+        batch.tradeDate = batch.Date = pd.to_datetime('2020-08-03')
+        mockManipulator = mockManipulatorClass.return_value
+        mockManipulator.trading_start_date = '2020-08-03'
+        mockManipulator.trading_end_date = '2020-08-03'
+        mockManipulator.manipulate.return_value = batch
+
+        version = self.analysis.version
+        suspicious = self.analysis.append(batch)
+        self.assertEqual(len(suspicious), 1)
+        self.assertEqual(self.analysis.version, version + 1)
+        self.assertEqual(self.analysis.start_date, '2020-07-01')
+        self.assertEqual(self.analysis.end_date, '2020-08-03')
+        self.assertEqual(len(self.analysis.data), 5)
+        self.assertEqual(len(self.analysis.manipulated), 7)
+
+        df = self.analysis.count_suspicious_per_trader()
+        self.assertEqual(dict(zip(df.traderId, df.suspicious)), {
+            'TzqyQTQjZGeLZuJqlLaQ': 2, 'JTzVqzzIkFlrYUQbhnOR': 2, 'pjjFIyeNTWRUWCuKoQSU': 1})
+        df = self.analysis.count_suspicious_by_country_per_month()
+        self.assertEqual(list(df.columns), ['2020-07', '2020-08', 'total'])
+        self.assertEqual(df.loc['UZ'].to_dict(), {
+                         '2020-07': 1, '2020-08': 1, 'total': 2})
+        self.assertEqual(df.loc['CV'].to_dict(), {
+                         '2020-07': 0, '2020-08': 0, 'total': 0})
+
+    def test_append_batches(self):
+        '''
+        traders_data.csv analysed in batches (new and known traders, countries and months)
+        gives the same reports and drill-down of trades as the whole data
+        '''
+        # trades without tradeDatetime in the first batch, so every batch has valid trades
+        data = pd.read_csv('traders_data.csv').sort_values('tradeDatetime', na_position='first', ignore_index=True)
+        with patch('detector.manipulator.Reader.fetch_yahoo_stock_data_to_df') as mock_fetch_yahoo_stock_data_to_df:
+            mock_fetch_yahoo_stock_data_to_df.side_effect = sample_stocks_data
+            expected = Analysis(data)
+            analysis = Analysis(data.iloc[:150])
+            # batches are merged into the drill-down index, records are not grouped again
+            with patch.object(Analysis, '_Analysis__group_positions') as group_positions:
+                for start in range(150, len(data), 150):
+                    analysis.append(data.iloc[start:start + 150])
+                analysis.trader_trades('TzqyQTQjZGeLZuJqlLaQ')
+                group_positions.assert_not_called()
+        self.assertTrue(analysis.count_suspicious_per_trader().equals(expected.count_suspicious_per_trader()))
+        self.assertTrue(analysis.count_suspicious_by_country_per_month().equals(
+            expected.count_suspicious_by_country_per_month()))
+        def records(df):
+            return df[['traderId', 'countryCode', 'tradeDate', 'price']].astype(str).values.tolist()
+        for trader_id in data.traderId.dropna().unique():
+            self.assertEqual(records(analysis.trader_trades(trader_id)[0]),
+                             records(expected.trader_trades(trader_id)[0]))
+        for country in data.countryCode.dropna().unique():
+            df, total = analysis.country_trades(country, start_date='2020-07-02', offset=1, limit=3)
+            expected_df, expected_total = expected.country_trades(country, start_date='2020-07-02', offset=1, limit=3)
+            self.assertEqual((records(df), total), (records(expected_df), expected_total))
+
+    @unittest.skipUnless(importlib.util.find_spec('pyarrow'), 'pyarrow not installed')
+    def test_save_load(self):
+        '''
+        Loaded analysis gives the same results, without reading traders data
+        '''
+        self.analysis.start_date, self.analysis.end_date = '2020-07-01', '2020-07-03'
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            self.analysis.save(tmp_dir)
+            analysis = Analysis.load(tmp_dir)
+            self.assertEqual((analysis.start_date, analysis.end_date, analysis.version, analysis.updated_at),
+                             ('2020-07-01', '2020-07-03', self.analysis.version, self.analysis.updated_at))
+            self.assertTrue(analysis.data.equals(self.analysis.data))
+            self.assertTrue(analysis.manipulated.equals(self.analysis.manipulated))
+            self.assertEqual(analysis.count_suspicious_per_trader().to_dict(),
+                             self.expected_suspicious_traders_data.to_dict())
+            self.assertEqual(analysis.count_suspicious_by_country_per_month().to_dict(),
+                             self.expected_suspicious_country_data.to_dict())
+            self.assertEqual(analysis.count_suspicious_by_country_per_month(countries=['BT', 'CV']).to_dict(),
+                             {'2020-07': {'BT': 2, 'CV': 0}, 'total': {'BT': 2, 'CV': 0}})
+            self.assertTrue(analysis.top_suspicious_traders(2).equals(
+                self.analysis.top_suspicious_traders(2, end_date='2020-07-03')))
+            self.assertRaises(ValueError, Analysis.load, tmp_dir + '-missing')
+
+    def test_parallel_analysis(self):
+        '''
+        Analysis on traders_data.csv with 2 worker processes gives the same results as serial
+        '''
+        with patch('detector.manipulator.Reader.fetch_yahoo_stock_data_to_df') as mock_fetch_yahoo_stock_data_to_df:
+            mock_fetch_yahoo_stock_data_to_df.side_effect = sample_stocks_data
+            serial = Analysis('traders_data.csv')
+            parallel = Analysis('traders_data.csv', workers=2)
+        self.assertTrue(serial.data.equals(parallel.data))
+        self.assertTrue(serial.count_suspicious_per_trader().equals(
+            parallel.count_suspicious_per_trader()))
+        self.assertTrue(serial.count_suspicious_by_country_per_month().equals(
+            parallel.count_suspicious_by_country_per_month()))
+
+    def test_parallel_duplicate_trades(self):
+        '''
+        A tradeId traded again in another stock symbol (partition) of a data frame is a duplicate
+        with worker processes too
+        '''
+        data = pd.read_csv('traders_data.csv')
+        trades = data.index[data.tradeId.notna() & data.traderId.notna()]
+        first = trades[0]
+        second = next(i for i in trades if data.stockSymbol[i] != data.stockSymbol[first])
+        data.loc[second, 'tradeId'] = data.tradeId[first]
+        with patch('detector.manipulator.Reader.fetch_yahoo_stock_data_to_df') as mock_fetch_yahoo_stock_data_to_df:
+            mock_fetch_yahoo_stock_data_to_df.side_effect = sample_stocks_data
+            serial = Analysis(data, rules=['duplicate_trade'])
+            parallel = Analysis(data, rules=['duplicate_trade'], workers=2)
+        self.assertEqual(serial.count_suspicious_per_rule().suspicious.tolist(), [1])
+        self.assertTrue(serial.data.equals(parallel.data))
+        pd.testing.assert_frame_equal(serial.rules.trade_keys, parallel.rules.trade_keys)
+
+    def test_duplicate_trades_in_files(self):
+        '''
+        Trades read twice are dropped the same way from one file and from the same rows split in 2 files,
+        in all modes
+        '''
+        data = pd.read_csv('traders_data.csv')
+        with patch('detector.manipulator.Reader.fetch_yahoo_stock_data_to_df') as mock_fetch_yahoo_stock_data_to_df:
+            mock_fetch_yahoo_stock_data_to_df.side_effect = sample_stocks_data
+            expected = Analysis('traders_data.csv')
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                pd.concat([data, data.iloc[:20]]).to_csv(os.path.join(tmp_dir, 'all.csv'), index=False)
+                data.iloc[:20].to_csv(os.path.join(tmp_dir, 'split-1.csv'), index=False)
+                data.to_csv(os.path.join(tmp_dir, 'split-2.csv'), index=False)
+                for filename in ['all.csv', 'split-*.csv']:
+                    for mode in [{}, {'chunksize': 50}, {'workers': 2}]:
+                        analysis = Analysis(os.path.join(tmp_dir, filename), **mode)
+                        self.assertTrue(analysis.count_suspicious_per_trader().equals(
+                            expected.count_suspicious_per_trader()))
+                        self.assertTrue(analysis.count_suspicious_by_country_per_month().equals(
+                            expected.count_suspicious_by_country_per_month()))
+
     @property
     def sample_manipulated_data(self):
         '''
@@ -0,0 +1,136 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+from detector.analysis import Analysis
+from tests.helpers import sample_stocks_data
+
+# Settings are read when app is imported: without traders data, the first analysis job fails at once
+TMP_DIR = tempfile.TemporaryDirectory()
+os.environ['TRADERS_DATA_FILE'] = os.path.join(TMP_DIR.name, 'missing.csv')
+os.environ['PRICE_CACHE_FILE'] = os.path.join(TMP_DIR.name, 'price_cache.sqlite')
+import app  # noqa: E402
+
+
+class TestApp(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        '''
+        Analysis of traders_data.csv served by the jobs of the tests
+        '''
+        with patch('detector.manipulator.Reader.fetch_yahoo_stock_data_to_df') as mock_fetch_yahoo_stock_data_to_df:
+            mock_fetch_yahoo_stock_data_to_df.side_effect = sample_stocks_data
+            cls.analysis = Analysis('traders_data.csv')
+
+    def setUp(self):
+        '''
+        Before each test, wait for the jobs of previous tests, and serve no analysis
+        '''
+        for job in app.jobs.list():
+            app.jobs.wait(job.id)
+        app.current = (None, None)
+        app.page_cache.clear()
+        self.client = app.app.test_client()
+
+    def run_job(self, build_analysis):
+        '''
+        Submit an analysis job with build_analysis, wait until finished, return the job as JSON
+        '''
+        with patch('app.build_analysis', build_analysis):
+            response = self.client.post('/jobs')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.headers['Location'], '/jobs/{}'.format(response.json['id']))
+        app.jobs.wait(response.json['id'])
+        return self.client.get(response.headers['Location']).json
+
+    def test_unavailable_before_first_analysis(self):
+        '''
+        503 with Retry-After while the first analysis runs, and with the error if it failed
+        '''
+        started, release = threading.Event(), threading.Event()
+
+        def build_analysis():
+            started.set()
+            release.wait(5)
+            raise ValueError("No data available")
+        with patch('app.build_analysis', build_analysis):
+            job_id = self.client.post('/reload').json['id']
+        started.wait(5)
+        response = self.client.get('/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '5')
+        self.assertEqual(response.json['error'], 'analysis in progress')
+        release.set()
+        app.jobs.wait(job_id)
+        response = self.client.get('/api/traders')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json['error'], 'analysis failed: ValueError: No data available')
+
+    def test_job_lifecycle(self):
+        '''
+        Completed job is served and is the current job, a finished job can not be cancelled
+        '''
+        job = self.run_job(lambda: self.analysis)
+        self.assertEqual(job['status'], 'done')
+        jobs = self.client.get('/jobs').json
+        self.assertEqual(jobs['current'], job['id'])
+        self.assertEqual(jobs['jobs'][0]['id'], job['id'])
+        response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Suspicious Traders Ranking', response.get_data(as_text=True))
+        self.assertEqual(self.client.delete('/jobs/{}'.format(job['id'])).status_code, 409)
+        self.assertEqual(self.client.get('/jobs/unknown').status_code, 404)
+
+    def test_failed_job_keeps_analysis(self):
+        '''
+        The analysis served stays when a new job fails
+        '''
+        served = self.run_job(lambda: self.analysis)
+
+        def build_analysis():
+            raise ValueError("No data available")
+        job = self.run_job(build_analysis)
+        self.assertEqual(job['status'], 'failed')
+        self.assertEqual(job['error'], 'ValueError: No data available')
+        self.assertEqual(self.client.get('/jobs').json['current'], served['id'])
+        self.assertEqual(self.client.get('/').status_code, 200)
+
+    def test_cancel_running_job(self):
+        '''
+        The result of a job cancelled while running is not served
+        '''
+        started, release = threading.Event(), threading.Event()
+
+        def build_analysis():
+            started.set()
+            release.wait(5)
+            return self.analysis
+        with patch('app.build_analysis', build_analysis):
+            job_id = self.client.post('/reload').json['id']
+        started.wait(5)
+        response = self.client.delete('/jobs/{}'.format(job_id))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json['cancel_requested'])
+        release.set()
+        self.assertEqual(app.jobs.wait(job_id).status, 'cancelled')
+        self.assertIsNone(self.client.get('/jobs').json['current'])
+        self.assertEqual(self.client.get('/').status_code, 503)
+
+    def test_page_cache_size(self):
+        '''
+        Pages of distinct filters are cached up to PAGE_CACHE_SIZE, least recently used pages are dropped
+        '''
+        self.run_job(lambda: self.analysis)
+        with patch('app.PAGE_CACHE_SIZE', 3):
+            for day in range(1, 6):
+                self.assertEqual(self.client.get('/?start=2020-01-0{}'.format(day)).status_code, 200)
+            self.assertEqual(len(app.page_cache), 3)
+            self.assertEqual([key[-2] for key in app.page_cache], ['2020-01-03', '2020-01-04', '2020-01-05'])
+            self.client.get('/?start=2020-01-03')
+            self.client.get('/?start=2020-01-06')
+            self.assertEqual([key[-2] for key in app.page_cache], ['2020-01-05', '2020-01-03', '2020-01-06'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from detector.cache import PriceCache
+from tests.helpers import sample_daily_data
+import pandas as pd
+
+
+class TestPriceCache(unittest.TestCase):
+    def setUp(self):
+        '''
+        Before each test, create an empty cache in a temporary directory
+        '''
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'cache.sqlite')
+        self.cache = PriceCache(self.path)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_fetch_miss_then_hit(self):
+        '''
+        First fetch goes to yahoo, same fetch again is served from cache
+        '''
+        with patch('detector.providers.Reader.fetch_yahoo_stock_data_to_df') as mocked_fetch:
+            mocked_fetch.return_value = sample_daily_data(
+                ['AMZN'], '2020-07-01', '2020-07-03')
+            df = self.cache.fetch(['AMZN'], '2020-07-01', '2020-07-03')
+            df_cached = self.cache.fetch(['AMZN'], '2020-07-01', '2020-07-03')
+            self.assertEqual(mocked_fetch.call_count, 1)
+        self.assertEqual(self.cache.misses, 1)
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(df.shape, (3, 6))
+        self.assertEqual(df.to_dict(), df_cached.to_dict())
+        self.assertEqual(df.columns.names, ['Attributes', 'Symbols'])
+
+    def test_fetch_only_missing_range(self):
+        '''
+        Fetch an extended date range, only the missing days are fetched from yahoo
+        '''
+        with patch('detector.providers.Reader.fetch_yahoo_stock_data_to_df') as mocked_fetch:
+            mocked_fetch.return_value = sample_daily_data(
+                ['AMZN'], '2020-07-01', '2020-07-02')
+            self.cache.fetch(['AMZN'], '2020-07-01', '2020-07-02')
+            mocked_fetch.return_value = sample_daily_data(
+                ['AMZN'], '2020-07-03', '2020-07-03')
+            df = self.cache.fetch(['AMZN'], '2020-07-01', '2020-07-03')
+            mocked_fetch.assert_called_with(
+                ['AMZN'], '2020-07-03', '2020-07-03')
+        self.assertEqual(len(df), 3)
+
+    def test_fetch_failure_not_cached(self):
+        '''
+        Date range failed to fetch is not recorded and raises error if nothing cached
+        '''
+        with patch('detector.providers.Reader.fetch_yahoo_stock_data_to_df') as mocked_fetch:
+            mocked_fetch.side_effect = ValueError("No data available")
+            self.assertRaises(ValueError, self.cache.fetch,
+                              ['AMZN'], '2020-07-01', '2020-07-03')
+            self.assertRaises(ValueError, self.cache.fetch,
+                              ['AMZN'], '2020-07-01', '2020-07-03')
+            self.assertEqual(mocked_fetch.call_count, 2)
+
+    def test_fetch_days_without_bars_again(self):
+        '''
+        Symbols without data and days from the last bar before today on are fetched again
+        '''
+        today = pd.Timestamp.today().normalize()
+        start = (today - pd.Timedelta(days=5)).strftime('%Y-%m-%d')
+        last = (today - pd.Timedelta(days=2)).strftime('%Y-%m-%d')
+        with patch('detector.providers.Reader.fetch_yahoo_stock_data_to_df') as mocked_fetch:
+            mocked_fetch.return_value = sample_daily_data(['AMZN'], start, last)
+            self.cache.fetch(['AMZN', 'FB'], start, today.strftime('%Y-%m-%d'))
+            self.cache.fetch(['AMZN'], start, today.strftime('%Y-%m-%d'))
+            mocked_fetch.assert_called_with(
+                ['AMZN'], (today - pd.Timedelta(days=1)).strftime('%Y-%m-%d'), today.strftime('%Y-%m-%d'))
+            self.assertRaises(ValueError, self.cache.fetch, ['FB'], start, last)
+            mocked_fetch.assert_called_with(['FB'], start, last)
+            self.cache.fetch(['AMZN'], start, last)
+            self.assertEqual(mocked_fetch.call_count, 3)
+
+    def test_offline(self):
+        '''
+        Offline cache never fetches from yahoo
+        '''
+        with patch('detector.providers.Reader.fetch_yahoo_stock_data_to_df') as mocked_fetch:
+            mocked_fetch.return_value = sample_daily_data(
+                ['AMZN'], '2020-07-01', '2020-07-03')
+            self.cache.fetch(['AMZN'], '2020-07-01', '2020-07-03')
+            offline_cache = PriceCache(self.path, offline=True)
+            df = offline_cache.fetch(['AMZN'], '2020-07-01', '2020-07-05')
+            self.assertEqual(mocked_fetch.call_count, 1)
+        self.assertEqual(len(df), 3)
+
+    def test_store(self):
+        '''
+        Stored data is served from cache without fetching from yahoo
+        '''
+        self.cache.store(sample_daily_data(
+            ['AMZN', 'FB'], '2020-07-01', '2020-07-03'), '2020-07-01', '2020-07-05')
+        with patch('detector.providers.Reader.fetch_yahoo_stock_data_to_df') as mocked_fetch:
+            df = self.cache.fetch(['FB'], '2020-07-01', '2020-07-05')
+            self.assertEqual(mocked_fetch.call_count, 0)
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(df.shape, (3, 6))
+
+    def test_eviction(self):
+        '''
+        Least recently used symbol is removed when cache is full
+        '''
+        cache = PriceCache(self.path, max_rows=4)
+        with patch('detector.providers.Reader.fetch_yahoo_stock_data_to_df') as mocked_fetch:
+            mocked_fetch.return_value = sample_daily_data(
+                ['AMZN'], '2020-07-01', '2020-07-03')
+            cache.fetch(['AMZN'], '2020-07-01', '2020-07-03')
+            mocked_fetch.return_value = sample_daily_data(
+                ['FB'], '2020-07-01', '2020-07-03')
+            cache.fetch(['FB'], '2020-07-01', '2020-07-03')
+        self.assertEqual(cache.stats['rows'], 3)
+        self.assertRaises(ValueError, PriceCache(self.path, offline=True).fetch,
+                          ['AMZN'], '2020-07-01', '2020-07-03')
+
+    def test_unknown_eviction_policy(self):
+        self.assertRaises(ValueError, PriceCache, self.path, eviction='random')
@@ -0,0 +1,102 @@
+import os
+import tempfile
+import unittest
+from detector.database import TradesDatabase
+from detector.rules import RuleSet
+import pandas as pd
+
+
+class TestTradesDatabase(unittest.TestCase):
+    def setUp(self):
+        '''
+        Before each test, write sample trades and bars to a new database
+        '''
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.database = TradesDatabase(os.path.join(self.tmp_dir.name, 'trades.sqlite'))
+        self.database.create()
+        self.database.write_trades(self.sample_traders_data)
+        self.database.write_bars(self.sample_stocks_data)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_flag_suspicious(self):
+        '''
+        Suspicious trades: not on a trading date (bit 0) or price out of the range of the day (bit 1),
+        and price at the High or Low (bit 2) if the rule is enabled
+        '''
+        self.database.flag_suspicious(RuleSet())
+        data = self.database.read_suspicious()
+        self.assertEqual(data.price.tolist(), [1857.6, 2500.0, 2351.1])
+        self.assertEqual(data['flags'].tolist(), [2, 2, 1])
+        self.assertEqual(data.High.isnull().tolist(), [False, False, True])
+        self.assertEqual(data.tradeDate.dt.strftime('%Y-%m-%d').tolist(), ['2020-07-01', '2020-07-02', '2020-07-03'])
+        self.database.create()
+        self.database.write_trades(self.sample_traders_data)
+        self.database.write_bars(self.sample_stocks_data)
+        self.database.flag_suspicious(RuleSet(['price_at_high_low']))
+        self.assertEqual(self.database.read_suspicious()['flags'].tolist(), [4])
+
+    def test_flag_suspicious_unsupported_rule(self):
+        '''
+        Raise ValueError for rules not evaluated in SQL
+        '''
+        self.assertRaises(ValueError, self.database.flag_suspicious, RuleSet(['duplicate_trade']))
+
+    def test_count_suspicious(self):
+        '''
+        Count suspicious trades per trader (with a name) and per country and month, with filters
+        '''
+        self.database.flag_suspicious(RuleSet())
+        counts = self.database.count_suspicious_per_trader()
+        self.assertEqual(counts.to_dict(), {('A', 'Brandi Robbins'): 1, ('B', 'Allison Davis'): 1})
+        counts = self.database.count_suspicious_per_country_month()
+        self.assertEqual(counts.index.tolist(), ['BT', 'NZ', 'UZ'])
+        self.assertEqual(counts.columns.strftime('%Y-%m').tolist(), ['2020-07'])
+        counts = self.database.count_suspicious_per_country_month(countries=['BT'], start_date='2020-07-02')
+        self.assertEqual(counts.to_dict('list'), {pd.Period('2020-07', 'M'): [1]})
+        self.assertTrue(self.database.count_suspicious_per_trader(stock_symbols=['FB']).empty)
+
+    def test_read_suspicious_page(self):
+        '''
+        Suspicious trades of a trader or a country by page, and their number
+        '''
+        self.database.flag_suspicious(RuleSet())
+        data, total = self.database.read_suspicious_page(trader_id='B', name='Allison Davis')
+        self.assertEqual((data.price.tolist(), total), ([2500.0], 1))
+        data, total = self.database.read_suspicious_page(country='NZ', start_date='2020-07-02', offset=1)
+        self.assertEqual((len(data), total), (0, 1))
+        data, total = self.database.read_suspicious_page(trader_id='A', limit=1)
+        self.assertEqual((data['flags'].tolist(), data.tradeDate.dt.strftime('%Y-%m-%d').tolist(), total),
+                         ([2], ['2020-07-01'], 1))
+        self.assertEqual(self.database.read_suspicious_page(trader_id='D')[1], 0)
+
+    @property
+    def sample_traders_data(self):
+        '''
+        For mock: 4 rows of manipulated traders data on AMZN, trader C without name
+        '''
+        columns = ['countryCode', 'name', 'traderId', 'stockSymbol', 'stockName', 'price', 'tradeDate']
+        data = [['UZ', 'Brandi Robbins', 'A', 'AMZN', 'Amazon', 1857.6, '2020-07-01'],
+                ['BT', 'Allison Davis', 'B', 'AMZN', 'Amazon', 2500.0, '2020-07-02'],
+                ['NZ', None, 'C', 'AMZN', 'Amazon', 2351.1, '2020-07-03'],
+                ['CV', 'April Floyd', 'D', 'AMZN', 'Amazon', 2754.0, '2020-07-01']]
+        df = pd.DataFrame(data, columns=columns)
+        df.tradeDate = pd.to_datetime(df.tradeDate)
+        for column in ['countryCode', 'name', 'traderId', 'stockSymbol', 'stockName']:
+            df[column] = df[column].astype('category')
+        return df
+
+    @property
+    def sample_stocks_data(self):
+        '''
+        For mock: processed stocks data of AMZN on 2020-07-01 and 2020-07-02
+        '''
+        df = pd.DataFrame({'Symbols': ['AMZN', 'AMZN'], 'Date': pd.to_datetime(['2020-07-01', '2020-07-02']),
+                           'High': [2895.0, 2955.5], 'Low': [2754.0, 2871.1]})
+        df.Symbols = df.Symbols.astype('category')
+        return df
+
+
+if __name__ == '__main__':
+    unittest.main()
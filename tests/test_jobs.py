@@ -0,0 +1,92 @@
+import threading
+import unittest
+from detector.jobs import JobManager
+
+
+class TestJobManager(unittest.TestCase):
+    def setUp(self):
+        '''
+        Before each test, create a job manager with one worker
+        '''
+        self.jobs = JobManager(max_workers=1, max_jobs=3)
+        self.results = []
+
+    def on_done(self, job, result):
+        self.results.append((job.seq, result))
+
+    def test_submit(self):
+        '''
+        Job runs in background, result is passed to on_done
+        '''
+        job = self.jobs.submit('sum', sum, [1, 2, 3], on_done=self.on_done)
+        self.jobs.wait(job.id)
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(self.results, [(1, 6)])
+        self.assertEqual(job.to_dict()['status'], 'done')
+        self.assertIsNotNone(job.to_dict()['finished_at'])
+
+    def test_failed(self):
+        '''
+        Errors are recorded on the job
+        '''
+        job = self.jobs.submit('fail', int, 'x', on_done=self.on_done)
+        self.jobs.wait(job.id)
+        self.assertEqual(job.status, 'failed')
+        self.assertTrue(job.error.startswith('ValueError'))
+        self.assertEqual(self.results, [])
+
+    def test_cancel(self):
+        '''
+        Pending job does not run, running job result is discarded, finished job can not be cancelled
+        '''
+        started, release = threading.Event(), threading.Event()
+
+        def blocked():
+            started.set()
+            release.wait(5)
+            return 'blocked'
+        running = self.jobs.submit('blocked', blocked, on_done=self.on_done)
+        pending = self.jobs.submit('sum', sum, [1], on_done=self.on_done)
+        started.wait(5)
+        self.assertEqual(running.status, 'running')
+        self.assertTrue(self.jobs.cancel(pending.id))
+        self.assertEqual(pending.status, 'cancelled')
+        self.assertTrue(self.jobs.cancel(running.id))
+        release.set()
+        self.jobs.wait(running.id)
+        self.assertEqual(running.status, 'cancelled')
+        self.assertEqual(self.results, [])
+        self.assertFalse(self.jobs.cancel(running.id))
+        self.assertFalse(self.jobs.cancel('unknown'))
+
+    def test_cancel_while_done(self):
+        '''
+        Job is done before on_done is called: cancel is rejected and the result is used
+        '''
+        started, release = threading.Event(), threading.Event()
+
+        def on_done(job, result):
+            started.set()
+            release.wait(5)
+            self.on_done(job, result)
+        job = self.jobs.submit('sum', sum, [1, 2], on_done=on_done)
+        started.wait(5)
+        self.assertEqual(job.status, 'done')
+        self.assertFalse(self.jobs.cancel(job.id))
+        release.set()
+        self.jobs.wait(job.id)
+        self.assertEqual((job.status, job.cancel_requested), ('done', False))
+        self.assertEqual(self.results, [(1, 3)])
+
+    def test_list(self):
+        '''
+        Most recent jobs first, oldest finished jobs are forgotten beyond max_jobs
+        '''
+        for i in range(5):
+            self.jobs.wait(self.jobs.submit(str(i), sum, [i]).id)
+        self.assertEqual([job.name for job in self.jobs.list()], ['4', '3', '2'])
+        self.assertIsNone(self.jobs.get('unknown'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,9 @@
+import os
+import tempfile
 import unittest
 from unittest.mock import patch
 from detector.manipulator import Manipulator
+from detector.schema import TRADERS_COLUMNS, TRADERS_DTYPES
 import pandas as pd
 
 
@@ -13,7 +16,7 @@ class TestManipulator(unittest.TestCase):
             mock_load_csv_to_df.return_value = self.sample_traders_data
             self.manipulator = Manipulator('sample.csv', ["AMZN"])
             mock_load_csv_to_df.assert_called_with(
-                'sample.csv')
+                'sample.csv', TRADERS_COLUMNS + ['tradeId'], dict(TRADERS_DTYPES, tradeId='object'), None)
 
     def test_trading_start_date(self):
         '''
@@ -31,13 +34,97 @@ class TestManipulator(unittest.TestCase):
 
     def test_manipulate(self):
         '''
-        After manipulate, the new data set should remove the 2 rows of bad data from traders and merge with stocks data
-        New size should be 5 rows and 11 columns
+        After manipulate, the new data set should remove the 2 rows of bad data from traders and add High and Low from stocks data
+        New size should be 5 rows and 9 columns, no High and Low for the trade on 2020-07-03 (not a trading date)
         '''
         with patch('detector.reader.Reader.fetch_yahoo_stock_data_to_df') as mock_fetch_yahoo_stock_data_to_df:
             mock_fetch_yahoo_stock_data_to_df.return_value = self.sample_stocks_data
             df = self.manipulator.manipulate()
-            self.assertEqual(df.shape, (5, 11))
+            self.assertEqual(df.shape, (5, 9))
+            self.assertEqual(df.High.isnull().tolist(), [
+                             False, False, False, True, False])
+            self.assertEqual(df.Low.tolist()[:2], [2754.0, 2871.10009765625])
+
+    def test_manipulate_categories(self):
+        '''
+        Text columns are categories, trader names combined from first and last names
+        '''
+        with patch('detector.reader.Reader.fetch_yahoo_stock_data_to_df') as mock_fetch_yahoo_stock_data_to_df:
+            mock_fetch_yahoo_stock_data_to_df.return_value = self.sample_stocks_data
+            df = self.manipulator.manipulate()
+            for column in ['countryCode', 'name', 'traderId', 'stockSymbol', 'stockName']:
+                self.assertEqual(df[column].dtype, 'category')
+            self.assertEqual(df.name.cat.categories.tolist(),
+                             sorted(set(df.name.dropna())))
+            self.assertEqual(df.price.dtype, 'float64')
+
+    def test_manipulator_from_df(self):
+        '''
+        Traders data from a data frame is transformed the same as from csv file
+        '''
+        manipulator = Manipulator(self.sample_traders_data, ["AMZN"])
+        self.assertEqual(manipulator.trading_start_date, '2020-07-01')
+        self.assertEqual(manipulator.trading_end_date, '2020-07-03')
+        self.assertEqual(manipulator.traders_data_df.shape, (5, 7))
+
+    def test_manipulator_from_df_missing_columns(self):
+        '''
+        Traders data frame without price column is invalid
+        '''
+        self.assertRaises(ValueError, Manipulator,
+                          self.sample_traders_data.drop(columns='price'))
+
+    def test_partition_by_symbol(self):
+        '''
+        Sample data has only AMZN: 1 partition, joined the same as manipulate()
+        '''
+        with patch('detector.reader.Reader.fetch_yahoo_stock_data_to_df') as mock_fetch_yahoo_stock_data_to_df:
+            mock_fetch_yahoo_stock_data_to_df.return_value = self.sample_stocks_data
+            partitions = list(self.manipulator.partition_by_symbol())
+            self.assertEqual(len(partitions), 1)
+            df = Manipulator.join_stocks_data(*partitions[0])
+            self.assertTrue(df.equals(self.manipulator.manipulate()))
+
+    def test_manipulate_chunks(self):
+        '''
+        Streaming sample data from csv file in chunks of 3 rows
+        gives the same date range and merged data as loading the whole file
+        '''
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'sample.csv')
+            self.sample_traders_data.to_csv(filename, index=False)
+            manipulator = Manipulator(filename, ["AMZN"], chunksize=3)
+            self.assertEqual(manipulator.trading_start_date, '2020-07-01')
+            self.assertEqual(manipulator.trading_end_date, '2020-07-03')
+            with patch('detector.reader.Reader.fetch_yahoo_stock_data_to_df') as mock_fetch_yahoo_stock_data_to_df:
+                mock_fetch_yahoo_stock_data_to_df.return_value = self.sample_stocks_data
+                chunks = list(manipulator.manipulate_chunks())
+                self.assertEqual([len(df) for df in chunks], [3, 2])
+                df = manipulator.manipulate()
+                self.assertEqual(df.shape, (5, 9))
+                self.assertEqual(mock_fetch_yahoo_stock_data_to_df.call_count, 2)
+
+    def test_manipulator_from_files(self):
+        '''
+        Sample data split in a csv file and a compressed csv file, both with the row of tradeId U9-4261680I:
+        read from a directory, glob pattern or list of files, the row is read once,
+        in full or in chunks of 2 rows
+        '''
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            first = os.path.join(tmp_dir, 'sample1.csv')
+            second = os.path.join(tmp_dir, 'sample2.csv.gz')
+            self.sample_traders_data.iloc[:4].to_csv(first, index=False)
+            self.sample_traders_data.iloc[3:].to_csv(second, index=False)
+            for filename in [tmp_dir, os.path.join(tmp_dir, 'sample*'), [first, second]]:
+                for chunksize in [None, 2]:
+                    manipulator = Manipulator(filename, ["AMZN"], chunksize=chunksize)
+                    self.assertEqual(manipulator.trading_start_date, '2020-07-01')
+                    self.assertEqual(manipulator.trading_end_date, '2020-07-03')
+                    with patch('detector.reader.Reader.fetch_yahoo_stock_data_to_df') as mock_fetch_yahoo_stock_data_to_df:
+                        mock_fetch_yahoo_stock_data_to_df.return_value = self.sample_stocks_data
+                        df = manipulator.manipulate()
+                        self.assertEqual(df.shape, (5, 9))
+                        self.assertEqual(df.price.tolist(), self.manipulator.manipulate().price.tolist())
 
     @property
     def sample_traders_data(self):
@@ -0,0 +1,89 @@
+import unittest
+from detector.price_index import PriceIndex
+import numpy as np
+import pandas as pd
+
+
+class TestPriceIndex(unittest.TestCase):
+    def setUp(self):
+        '''
+        Before each test, index sample stocks data
+        '''
+        self.price_index = PriceIndex(self.sample_stocks_data)
+
+    def test_lookup(self):
+        '''
+        Look up High and Low of trades, no trading data for
+        AMZN on 2020-07-03 and for unknown symbol TSLA
+        '''
+        found, high, low = self.price_index.lookup(
+            ['AMZN', 'FB', 'AMZN', 'TSLA'], pd.to_datetime(['2020-07-02', '2020-07-01', '2020-07-03', '2020-07-01']))
+        self.assertEqual(found.tolist(), [True, True, False, False])
+        self.assertEqual(high[:2].tolist(), [2955.5, 240.0])
+        self.assertEqual(low[:2].tolist(), [2871.1, 230.0])
+        self.assertTrue(np.isnan(high[2:]).all())
+
+    def test_lookup_categorical(self):
+        '''
+        Look up categorical symbols with missing values
+        '''
+        symbols = pd.Series(['FB', None, 'AMZN'], dtype='category')
+        found, high, _ = self.price_index.lookup(
+            symbols, pd.to_datetime(['2020-07-01', '2020-07-01', '2020-07-01']))
+        self.assertEqual(found.tolist(), [True, False, True])
+        self.assertEqual(high[[0, 2]].tolist(), [240.0, 2895.0])
+
+    def test_is_suspicious(self):
+        '''
+        Suspicious if price is out of the range of the day or not a trading date
+        '''
+        suspicious = self.price_index.is_suspicious(
+            ['AMZN', 'AMZN', 'AMZN', 'FB'], pd.to_datetime(
+                ['2020-07-01', '2020-07-01', '2020-07-04', '2020-07-01']),
+            [2800.0, 1857.6, 2800.0, 235.0])
+        self.assertEqual(suspicious.tolist(), [False, True, True, False])
+
+    def test_lookup_columns(self):
+        '''
+        Look up daily columns: market volume and change of close price to the next trading day,
+        missing if stocks data has no Volume / Close or on the last day
+        '''
+        stocks_data = self.sample_stocks_data
+        stocks_data['Close'] = [235.0, 2900.0, 2800.0]
+        stocks_data['Volume'] = [1000.0, 2000.0, 3000.0]
+        columns = PriceIndex(stocks_data).lookup_columns(
+            ['AMZN', 'AMZN', 'FB'], pd.to_datetime(['2020-07-01', '2020-07-02', '2020-07-02']),
+            ['High', 'Volume', 'NextMove'])
+        self.assertEqual(columns['High'][:2].tolist(), [2895.0, 2955.5])
+        self.assertEqual(columns['Volume'][:2].tolist(), [3000.0, 2000.0])
+        self.assertAlmostEqual(columns['NextMove'][0], 2900.0 / 2800.0 - 1)
+        self.assertTrue(np.isnan(columns['NextMove'][1:]).all())
+        volume = self.price_index.lookup_columns(['FB'], pd.to_datetime(['2020-07-01']), ['Volume'])['Volume']
+        self.assertTrue(np.isnan(volume).all())
+
+    def test_update_codes(self):
+        '''
+        High and Low of days with trading data are replaced in place, other days are not found
+        '''
+        codes = self.price_index.symbols.get_indexer(['AMZN', 'AMZN', 'TSLA'])
+        days = pd.to_datetime(['2020-07-02', '2020-07-03', '2020-07-02']).values.astype('datetime64[D]').astype('int64')
+        found = self.price_index.update_codes(
+            codes, days, np.array([3000.0, 3100.0, 10.0]), np.array([2000.0, 2100.0, 5.0]))
+        self.assertEqual(found.tolist(), [True, False, False])
+        found, high, low = self.price_index.lookup(['AMZN', 'AMZN'], pd.to_datetime(['2020-07-02', '2020-07-03']))
+        self.assertEqual(found.tolist(), [True, False])
+        self.assertEqual((high[0], low[0]), (3000.0, 2000.0))
+
+    @property
+    def sample_stocks_data(self):
+        '''
+        For mock: processed stocks data, AMZN on 2020-07-01 and 2020-07-02, FB on 2020-07-01
+        '''
+        columns = ['Symbols', 'Date', 'High', 'Low']
+        data = [['FB', '2020-07-01', 240.0, 230.0],
+                ['AMZN', '2020-07-02', 2955.5, 2871.1],
+                ['AMZN', '2020-07-01', 2895.0, 2754.0]]
+        df = pd.DataFrame(data, columns=columns)
+        df.Symbols = df.Symbols.astype('category')
+        df.Date = pd.to_datetime(df.Date)
+        return df
@@ -0,0 +1,83 @@
+import unittest
+from detector.profiler import Profiler
+import pandas as pd
+
+
+class TestProfiler(unittest.TestCase):
+    def setUp(self):
+        '''
+        Before each test, create a profiler with memory tracing
+        '''
+        self.profiler = Profiler(trace_memory=True)
+
+    def test_stage(self):
+        '''
+        Stage records time, rows in and out and peak memory
+        '''
+        with self.profiler.stage('load', 10) as record:
+            data = list(range(100000))
+            record['rows_out'] = 5
+        del data
+        record = self.profiler.records[-1]
+        self.assertEqual(record['stage'], 'load')
+        self.assertEqual((record['rows_in'], record['rows_out']), (10, 5))
+        self.assertGreaterEqual(record['wall_seconds'], 0)
+        self.assertGreaterEqual(record['cpu_seconds'], 0)
+        self.assertGreater(record['peak_memory_bytes'], 800000)
+        self.assertGreater(record['max_rss_bytes'], 0)
+
+    def test_nested_stage_memory(self):
+        '''
+        Peak memory of an outer stage includes the peak of inner stages
+        '''
+        with self.profiler.stage('outer'):
+            with self.profiler.stage('inner'):
+                data = list(range(100000))
+            del data
+        inner, outer = self.profiler.records
+        self.assertGreaterEqual(
+            outer['peak_memory_bytes'], inner['peak_memory_bytes'])
+
+    def test_profile_report(self):
+        '''
+        Decorated function calls are added up per stage, rows from data frames
+        '''
+        @self.profiler.profile('head')
+        def head(df, n):
+            return df.head(n)
+        df = pd.DataFrame({'a': range(10)})
+        head(df, 3)
+        head(df, 4)
+        report = self.profiler.report()
+        self.assertEqual(report.index.tolist(), ['head'])
+        self.assertEqual(report.loc['head', ['calls', 'rows_in', 'rows_out']].tolist(), [
+                         2, 20, 7])
+
+    def test_disabled(self):
+        '''
+        Nothing is recorded if profiler is disabled
+        '''
+        self.profiler.enabled = False
+        with self.profiler.stage('load'):
+            pass
+        self.assertEqual(len(self.profiler.records), 0)
+        self.assertTrue(self.profiler.report().empty)
+
+    def test_to_prometheus(self):
+        '''
+        Totals per stage in Prometheus text format
+        '''
+        with self.profiler.stage('load', 10) as record:
+            record['rows_out'] = 5
+        text = self.profiler.to_prometheus()
+        self.assertIn('# TYPE detector_stage_calls_total counter', text)
+        self.assertIn('detector_stage_calls_total{stage="load"} 1', text)
+        self.assertIn('detector_stage_rows_in_total{stage="load"} 10', text)
+        self.assertIn('detector_stage_rows_out_total{stage="load"} 5', text)
+        self.assertIn('detector_process_max_rss_bytes ', text)
+        self.profiler.reset()
+        self.assertNotIn('stage="load"', self.profiler.to_prometheus())
+
+
+if __name__ == '__main__':
+    unittest.main()
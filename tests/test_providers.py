@@ -0,0 +1,120 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+from detector.cache import PriceCache
+from detector.providers import HTTPProvider, LocalProvider, YahooProvider, get_price_provider
+from tests.helpers import sample_daily_data
+
+
+class TestLocalProvider(unittest.TestCase):
+    def setUp(self):
+        '''
+        Before each test, create a temporary directory
+        '''
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_store_and_fetch(self):
+        '''
+        Data stored to csv and parquet files is fetched in yahoo format within date range
+        '''
+        for file_format in ['csv', 'parquet']:
+            provider = LocalProvider(os.path.join(
+                self.tmp_dir.name, file_format), file_format)
+            provider.store(sample_daily_data(
+                ['AMZN', 'FB'], '2020-07-01', '2020-07-05'))
+            df = provider.fetch(['FB', 'AMZN', 'TSLA'],
+                                '2020-07-02', '2020-07-03')
+            self.assertEqual(df.columns.names, ['Attributes', 'Symbols'])
+            self.assertEqual(df.shape, (2, 12))
+            self.assertEqual(df[('High', 'FB')].tolist(), [1.0, 2.0])
+            self.assertEqual(df.index.name, 'Date')
+
+    def test_no_data(self):
+        '''
+        Raise error if no symbol has data
+        '''
+        provider = LocalProvider(self.tmp_dir.name)
+        self.assertRaises(ValueError, provider.fetch,
+                          ['TSLA'], '2020-07-01', '2020-07-03')
+
+    def test_cache_provider(self):
+        '''
+        Cache fetches missing data from its provider
+        '''
+        provider = LocalProvider(self.tmp_dir.name)
+        provider.store(sample_daily_data(['AMZN'], '2020-07-01', '2020-07-03'))
+        cache = PriceCache(os.path.join(
+            self.tmp_dir.name, 'cache.sqlite'), provider=provider)
+        df = cache.fetch(['AMZN'], '2020-07-01', '2020-07-03')
+        self.assertEqual(cache.misses, 1)
+        self.assertEqual(df[('Low', 'AMZN')].tolist(), [0.0, 1.0, 2.0])
+
+
+class TestHTTPProvider(unittest.TestCase):
+    def setUp(self):
+        '''
+        Before each test, create provider with mocked requests
+        '''
+        self.provider = HTTPProvider(
+            'http://bars.local/{symbol}?start={start}&end={end}', max_workers=2)
+        self.provider.session.get = MagicMock(side_effect=self.get)
+
+    @staticmethod
+    def get(url, timeout):
+        '''
+        For mock: csv data of AMZN, 404 for unknown symbols, server error for FB
+        '''
+        response = MagicMock()
+        response.status_code = 404
+        if url.startswith('http://bars.local/AMZN'):
+            response.status_code = 200
+            response.text = 'Date,High,Low\n2020-07-01,3.0,1.0\n2020-07-02,4.0,2.0\n'
+        elif url.startswith('http://bars.local/FB'):
+            response.status_code = 500
+            response.raise_for_status.side_effect = Exception('500 Server Error')
+        return response
+
+    def test_fetch(self):
+        '''
+        One request per symbol, symbols without data are left out
+        '''
+        df = self.provider.fetch(
+            ['AMZN', 'FB', 'TSLA'], '2020-07-01', '2020-07-02')
+        self.assertEqual(self.provider.session.get.call_count, 3)
+        self.provider.session.get.assert_any_call(
+            'http://bars.local/AMZN?start=2020-07-01&end=2020-07-02', timeout=30)
+        self.assertEqual(df.columns.unique(level='Symbols').tolist(), ['AMZN'])
+        self.assertEqual(df[('High', 'AMZN')].tolist(), [3.0, 4.0])
+        self.assertTrue(df[('Volume', 'AMZN')].isnull().all())
+
+    def test_retry(self):
+        '''
+        Session retries connection errors and server errors with backoff
+        '''
+        retry = HTTPProvider('http://bars.local/{symbol}', retries=5, backoff=1).session.get_adapter(
+            'http://bars.local/AMZN').max_retries
+        self.assertEqual(retry.total, 5)
+        self.assertEqual(retry.backoff_factor, 1)
+        self.assertIn(503, retry.status_forcelist)
+
+
+class TestGetPriceProvider(unittest.TestCase):
+    def test_get_price_provider(self):
+        self.assertIsInstance(get_price_provider(None), YahooProvider)
+        self.assertIsInstance(get_price_provider(
+            'https://bars.local/{symbol}'), HTTPProvider)
+        self.assertIsInstance(get_price_provider('bars'), LocalProvider)
+
+    def test_yahoo(self):
+        with patch('detector.providers.Reader.fetch_yahoo_stock_data_to_df') as mocked_fetch:
+            YahooProvider().fetch(['AMZN'], '2020-07-01', '2020-07-03')
+            mocked_fetch.assert_called_with(
+                ['AMZN'], '2020-07-01', '2020-07-03')
+
+
+if __name__ == '__main__':
+    unittest.main()
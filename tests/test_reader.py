@@ -1,6 +1,10 @@
+import importlib.util
+import os
+import tempfile
 import unittest
 from unittest.mock import patch
 from detector.reader import Reader
+from detector.schema import TRADERS_COLUMNS, TRADERS_DTYPES
 import pandas as pd
 
 
@@ -16,6 +20,31 @@ class TestGetData(unittest.TestCase):
         df = Reader.load_csv_to_df("traders_data.csv")
         self.assertEqual(df.shape, (1000, 10))
 
+    def test_read_csv_to_df_with_schema(self):
+        '''
+        get columns needed from traders_data.csv with types declared
+        dataframe has 1000 rows and 8 columns, countryCode and stockSymbol are category
+        '''
+        df = Reader.load_csv_to_df(
+            "traders_data.csv", TRADERS_COLUMNS, TRADERS_DTYPES)
+        self.assertEqual(df.shape, (1000, 8))
+        self.assertEqual(df.countryCode.dtype, 'category')
+        self.assertEqual(df.stockSymbol.dtype, 'category')
+
+    @unittest.skipUnless(importlib.util.find_spec('pyarrow'), 'pyarrow not installed')
+    def test_read_csv_to_df_pyarrow(self):
+        '''
+        get data from traders_data.csv with pyarrow engine
+        missing values are the same as c engine
+        '''
+        df = Reader.load_csv_to_df(
+            "traders_data.csv", TRADERS_COLUMNS, TRADERS_DTYPES, 'pyarrow')
+        df_c = Reader.load_csv_to_df(
+            "traders_data.csv", TRADERS_COLUMNS, TRADERS_DTYPES)
+        self.assertEqual(df.shape, (1000, 8))
+        self.assertEqual(df.isnull().sum().to_dict(),
+                         df_c.isnull().sum().to_dict())
+
     def test_read_csv_to_df_error(self):
         ''' 
         get data from non exists file
@@ -23,9 +52,57 @@ class TestGetData(unittest.TestCase):
         self.assertRaises(
             ValueError, Reader.load_csv_to_df, "non_existing_file.csv")
 
+    def test_iter_csv_chunks(self):
+        '''
+        get data from traders_data.csv in chunks of 300 rows
+        4 chunks, 1000 rows in total
+        '''
+        chunks = list(Reader.iter_csv_chunks("traders_data.csv", 300))
+        self.assertEqual([len(df) for df in chunks], [300, 300, 300, 100])
+
+    def test_iter_csv_chunks_error(self):
+        '''
+        get chunks from non exists file
+        '''
+        self.assertRaises(ValueError, list, Reader.iter_csv_chunks(
+            "non_existing_file.csv", 300))
+
+    def test_get_csv_files(self):
+        '''
+        csv files of a directory (compressed or not) or glob pattern are sorted, a list keeps its order
+        '''
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for file in ['b.csv.gz', 'a.csv', 'notes.txt']:
+                open(os.path.join(tmp_dir, file), 'w').close()
+            files = [os.path.join(tmp_dir, file) for file in ['a.csv', 'b.csv.gz']]
+            self.assertEqual(Reader.get_csv_files(tmp_dir), files)
+            self.assertEqual(Reader.get_csv_files(os.path.join(tmp_dir, '*.csv*')), files)
+            self.assertEqual(Reader.get_csv_files(files[::-1]), files[::-1])
+            self.assertEqual(Reader.get_csv_files('traders_data.csv'), ['traders_data.csv'])
+
+    def test_load_csv_files_to_df(self):
+        '''
+        get data from traders_data.csv split in 2 files, one compressed without tradeId:
+        1000 rows in order, optional tradeId missing in the rows of the second file,
+        files without data are skipped
+        '''
+        df = Reader.load_csv_to_df("traders_data.csv")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            files = [os.path.join(tmp_dir, file) for file in ['1.csv', '2.csv.gz', '3.csv']]
+            df.iloc[:600].to_csv(files[0], index=False)
+            df.iloc[600:].drop(columns='tradeId').to_csv(files[1], index=False)
+            open(files[2], 'w').close()
+            loaded = Reader.load_csv_files_to_df(
+                files, TRADERS_COLUMNS + ['tradeId'], TRADERS_DTYPES, optional=['tradeId'], workers=2)
+            self.assertEqual(loaded.shape, (1000, 9))
+            self.assertTrue(loaded.price.equals(df.price))
+            self.assertEqual(loaded.stockSymbol.dtype, 'category')
+            self.assertTrue(loaded.tradeId.iloc[600:].isnull().all())
+            self.assertRaises(ValueError, Reader.load_csv_files_to_df, files[2:])
+
     def test_fetch_yahoo_stock_data_to_df(self):
         ''' mock fetch AMZN stock_data from yahoo '''
-        with patch('detector.reader.data.DataReader') as mocked_reader:
+        with patch('pandas_datareader.data.DataReader') as mocked_reader:
             mocked_df = pd.DataFrame([1, 2, 3])
             mocked_reader.return_value = mocked_df
 
@@ -37,7 +114,7 @@ class TestGetData(unittest.TestCase):
 
     def test_fetch_yahoo_stock_data_to_df_error(self):
         ''' mock fetch non existed stock_data from yahoo '''
-        with patch('detector.reader.data.DataReader') as mocked_reader:
+        with patch('pandas_datareader.data.DataReader') as mocked_reader:
             mocked_df = pd.DataFrame()
             mocked_reader.return_value = mocked_df
             self.assertRaises(ValueError, Reader.fetch_yahoo_stock_data_to_df,
@@ -0,0 +1,109 @@
+import unittest
+from unittest.mock import patch
+from detector.rules import RuleSet, get_rule_names
+import numpy as np
+import pandas as pd
+
+
+class TestRules(unittest.TestCase):
+    def test_default_rules(self):
+        '''
+        Default rules flag trades not on a trading date and out of the price range of the day
+        '''
+        flags = RuleSet().evaluate(self.sample_data)
+        self.assertEqual(flags.tolist(), [0, 0, 2, 1, 0, 0, 0, 0])
+
+    def test_all_rules(self):
+        '''
+        All rules evaluated together, one bit per rule
+        '''
+        flags = RuleSet('all', cluster_size=3).evaluate(self.sample_data)
+        self.assertEqual([get_rule_names(value) for value in flags], [
+            ['price_at_high_low', 'cluster_before_move'],
+            ['large_volume', 'cluster_before_move'],
+            ['price_out_of_range', 'duplicate_trade', 'cluster_before_move'],
+            ['not_trading_day'],
+            [],
+            [],
+            [],
+            ['price_at_high_low']])
+
+    def test_duplicate_trade(self):
+        '''
+        tradeIds seen in data evaluated before by the same rule set are duplicates,
+        missing tradeIds are not
+        '''
+        rules = RuleSet(['duplicate_trade'])
+        data = pd.DataFrame({'tradeId': ['T1', None, 'T2']})
+        self.assertEqual(rules.evaluate(data).tolist(), [0, 0, 0])
+        data = pd.DataFrame({'tradeId': ['T3', 'T2', None, 'T3']})
+        self.assertEqual(rules.evaluate(data).tolist(), [0, 16, 0, 16])
+        self.assertEqual(len(rules.trade_keys), 3)
+
+    def test_duplicate_trade_same_hash(self):
+        '''
+        Distinct tradeIds of the same hash are not duplicates
+        '''
+        rules = RuleSet(['duplicate_trade'])
+        with patch('detector.schema.pd.util.hash_array') as mocked_hash_array:
+            mocked_hash_array.side_effect = lambda values, categorize: np.zeros(len(values), dtype='uint64')
+            data = pd.DataFrame({'tradeId': ['T1', 'T2', 'T1']})
+            self.assertEqual(rules.evaluate(data).tolist(), [0, 0, 16])
+            data = pd.DataFrame({'tradeId': ['T3', 'T2', None, 'T4', 'T3']})
+            self.assertEqual(rules.evaluate(data).tolist(), [0, 16, 0, 0, 16])
+        self.assertEqual(sorted(rules.trade_keys.tradeId), ['T1', 'T2', 'T3', 'T4'])
+
+    def test_count_clusters(self):
+        '''
+        Data evaluated in 2 parts, clusters counted in both parts first: same flags as the whole data
+        '''
+        data = self.sample_data
+        expected = RuleSet(['cluster_before_move']).evaluate(data).tolist()
+        rules = RuleSet(['cluster_before_move'])
+        self.assertEqual(rules.evaluate(data.iloc[:2]).tolist(), [0, 0])
+        for part in [data.iloc[:2], data.iloc[2:]]:
+            rules.count_clusters(part)
+        self.assertEqual(rules.evaluate(data.iloc[:2]).tolist() + rules.evaluate(data.iloc[2:]).tolist(), expected)
+
+    def test_columns(self):
+        '''
+        Extra columns are needed only by rules using them
+        '''
+        self.assertEqual(RuleSet().traders_columns, [])
+        self.assertEqual(RuleSet().stocks_columns, [])
+        rules = RuleSet(['large_volume', 'cluster_before_move'])
+        self.assertEqual(rules.traders_columns, ['volume'])
+        self.assertEqual(rules.stocks_columns, ['NextMove', 'Volume'])
+
+    def test_unknown_rule(self):
+        '''
+        Raise ValueError for unknown rules
+        '''
+        with self.assertRaises(ValueError):
+            RuleSet(['price_out_of_range', 'wash_trade'])
+
+    @property
+    def sample_data(self):
+        '''
+        For mock: manipulated data with all columns used by rules,
+        trader A traded AMZN 3 times on 2020-07-01, the day before a move of 10%
+        '''
+        columns = ['traderId', 'stockSymbol', 'tradeDate', 'tradeId', 'price', 'volume',
+                   'High', 'Low', 'Volume', 'NextMove']
+        data = [['A', 'AMZN', '2020-07-01', 'T1', 2895.0, 100.0, 2895.0, 2754.0, 30000.0, 0.1],
+                ['A', 'AMZN', '2020-07-01', 'T2', 2800.0, 5000.0, 2895.0, 2754.0, 30000.0, 0.1],
+                ['A', 'AMZN', '2020-07-01', 'T1', 2900.0, 100.0, 2895.0, 2754.0, 30000.0, 0.1],
+                ['A', 'AMZN', '2020-07-04', 'T3', 2800.0, 100.0, np.nan, np.nan, np.nan, np.nan],
+                ['B', 'AMZN', '2020-07-01', 'T4', 2800.0, 100.0, 2895.0, 2754.0, 30000.0, 0.1],
+                ['A', 'FB', '2020-07-01', 'T5', 235.0, 100.0, 240.0, 230.0, 20000.0, 0.01],
+                ['A', 'FB', '2020-07-01', None, 235.0, 100.0, 240.0, 230.0, 20000.0, 0.01],
+                ['A', 'FB', '2020-07-01', 'T6', 230.0, 100.0, 240.0, 230.0, 20000.0, 0.01]]
+        df = pd.DataFrame(data, columns=columns)
+        for column in ['traderId', 'stockSymbol']:
+            df[column] = df[column].astype('category')
+        df.tradeDate = pd.to_datetime(df.tradeDate)
+        return df
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,219 @@
+import asyncio
+import json
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+from detector.price_index import PriceIndex
+from detector.stream import StreamDetector, read_queue, serve
+from tests.helpers import sample_stocks_data
+import pandas as pd
+
+
+class TestStreamDetector(unittest.TestCase):
+    def setUp(self):
+        '''
+        Before each test, create detector with a mocked price provider
+        '''
+        self.provider = MagicMock()
+        self.provider.fetch.side_effect = sample_stocks_data
+        self.detector = StreamDetector(price_cache=self.provider)
+
+    def test_detect(self):
+        '''
+        Same rules as Analysis: not a trading date, price above High or below Low of the day
+        '''
+        alerts = self.detector.detect(self.sample_trades)
+        self.assertEqual([alert['reason'] for alert in alerts], [
+            'price below low', 'price above high', 'not a trading date'])
+        self.assertEqual(alerts[0]['name'], 'Brandi Robbins')
+        self.assertEqual(alerts[0]['tradeDate'], '2020-07-01')
+        self.assertEqual((alerts[0]['High'], alerts[0]['Low']), (2500.0, 1500.0))
+        self.assertIsNone(alerts[2]['High'])
+        self.assertEqual(self.detector.trades, 4)
+        self.assertEqual(self.detector.suspicious, 3)
+
+    def test_invalid_trades(self):
+        '''
+        Trades without stockSymbol, traderId or tradeDatetime are skipped, bad values are counted as errors
+        '''
+        alerts = self.detector.detect([
+            {'stockSymbol': 'AMZN', 'traderId': '', 'tradeDatetime': '2020-07-01 10:00:00'},
+            {'stockSymbol': 'AMZN', 'traderId': 'A', 'tradeDatetime': '2020-07-01'},
+            {'stockSymbol': 'AMZN', 'traderId': 'A', 'tradeDatetime': '2020-07-01 10:00:00', 'price': 'x'}])
+        self.assertEqual(alerts, [])
+        self.assertEqual(self.detector.errors, 2)
+        self.assertEqual(self.detector.trades, 0)
+
+    def test_prices_fetched_once(self):
+        '''
+        Stocks data is fetched for whole months and kept in the price table
+        '''
+        self.detector.detect(self.sample_trades)
+        self.detector.detect(self.sample_trades)
+        self.provider.fetch.assert_called_once_with(
+            ['AMZN'], '2020-07-01', '2020-07-31')
+
+    def test_update_prices(self):
+        '''
+        Intraday High / Low replace the prices of the day in place, the price table is only built again
+        to add days, without losing prices replaced before
+        '''
+        self.detector.detect(self.sample_trades)
+        with patch('detector.stream.PriceIndex', wraps=PriceIndex) as price_index:
+            self.detector.update_prices(pd.DataFrame({
+                'Symbols': ['AMZN'], 'Date': ['2020-07-01'], 'High': [3000.0], 'Low': [1000.0]}))
+            self.assertEqual(self.detector.detect(self.sample_trades[:1]), [])
+            self.assertEqual(price_index.call_count, 0)
+            self.detector.update_prices(pd.DataFrame({
+                'Symbols': ['AMZN'], 'Date': ['2020-07-04'], 'High': [2500.0], 'Low': [1500.0]}))
+            self.assertEqual(price_index.call_count, 1)
+        self.assertEqual(self.detector.detect([self.sample_trades[0], self.sample_trades[3]]), [])
+
+    def test_concurrent_updates(self):
+        '''
+        Prices updated by threads at the same time are all kept in the price table
+        '''
+        started, release = threading.Event(), threading.Event()
+
+        def build_index(stocks_data_df):
+            if not started.is_set():
+                started.set()
+                release.wait(5)
+            return PriceIndex(stocks_data_df)
+
+        def update_prices(symbol):
+            self.detector.update_prices(pd.DataFrame({
+                'Symbols': [symbol], 'Date': ['2020-07-01'], 'High': [3000.0], 'Low': [1000.0]}))
+        with patch('detector.stream.PriceIndex', build_index):
+            first = threading.Thread(target=update_prices, args=('AMZN',))
+            first.start()
+            started.wait(5)
+            second = threading.Thread(target=update_prices, args=('FB',))
+            second.start()
+            second.join(0.2)
+            release.set()
+            first.join()
+            second.join()
+        # prices of the updates only
+        self.provider.fetch.side_effect = ValueError("No data available")
+        trades = [self.sample_trades[0], dict(self.sample_trades[0], stockSymbol='FB')]
+        self.assertEqual(self.detector.detect(trades), [])
+
+    def test_fetch_again_after_failure(self):
+        '''
+        Days of a failed fetch are fetched again after refresh_interval, then kept
+        '''
+        self.provider.fetch.side_effect = [ValueError("No data available"),
+                                           sample_stocks_data(['AMZN'], '2020-07-01', '2020-07-31')]
+        trades = self.sample_trades[2:3]
+        detector = StreamDetector(price_cache=self.provider, refresh_interval=3600)
+        self.assertEqual([alert['reason'] for alert in detector.detect(trades)], ['not a trading date'])
+        detector.detect(trades)
+        self.assertEqual(self.provider.fetch.call_count, 1)
+        detector = StreamDetector(price_cache=self.provider, refresh_interval=0)
+        self.provider.fetch.side_effect = [ValueError("No data available"),
+                                           sample_stocks_data(['AMZN'], '2020-07-01', '2020-07-31')]
+        detector.detect(trades)
+        self.assertEqual(detector.detect(trades), [])
+        detector.detect(trades)
+        self.assertEqual(self.provider.fetch.call_count, 3)
+
+    def test_refresh_today(self):
+        '''
+        High / Low of today are fetched again after refresh_interval, not kept as fetched for good
+        '''
+        today = pd.Timestamp.today().normalize()
+        self.provider.fetch.side_effect = lambda stock_syms, start_date, end_date: pd.DataFrame(
+            [[2500.0, 1500.0]], index=pd.DatetimeIndex([today], name='Date'),
+            columns=pd.MultiIndex.from_product([['High', 'Low'], ['AMZN']], names=['Attributes', 'Symbols']))
+        trades = [dict(self.sample_trades[2], tradeDatetime=today.strftime('%Y-%m-%d 09:00:00'))]
+        detector = StreamDetector(price_cache=self.provider, refresh_interval=0)
+        self.assertEqual(detector.detect(trades), [])
+        detector.detect(trades)
+        self.assertEqual(self.provider.fetch.call_count, 2)
+
+    def test_counters(self):
+        '''
+        Running counters in the same format as Analysis reports
+        '''
+        self.detector.detect(self.sample_trades)
+        traders = self.detector.count_suspicious_per_trader()
+        self.assertEqual(traders.to_dict('records'), [
+            {'traderId': 'TzqyQTQjZGeLZuJqlLaQ', 'name': 'Allison Davis', 'suspicious': 2},
+            {'traderId': 'JTzVqzzIkFlrYUQbhnOR', 'name': 'Brandi Robbins', 'suspicious': 1}])
+        self.assertEqual(traders.index.name, 'rank')
+        countries = self.detector.count_suspicious_by_country_per_month()
+        self.assertEqual(countries.to_dict(), {'2020-07': {'BT': 2, 'UZ': 1, 'CV': 0},
+                                               'total': {'BT': 2, 'UZ': 1, 'CV': 0}})
+        self.assertEqual(countries.index.name, 'country code')
+        self.assertEqual((self.detector.start_date, self.detector.end_date),
+                         ('2020-07-01', '2020-07-04'))
+
+    def test_run_csv_lines(self):
+        '''
+        Trades read from csv lines, alerts emitted as they are flagged
+        '''
+        async def lines():
+            yield 'countryCode,firstName,lastName,traderId,stockSymbol,stockName,price,tradeDatetime\n'
+            for trade in self.sample_trades:
+                yield ','.join(trade[column] for column in [
+                    'countryCode', 'firstName', 'lastName', 'traderId', 'stockSymbol',
+                    'stockName', 'price', 'tradeDatetime']) + '\n'
+            yield 'UZ,Brandi,Robbins,JTzVqzzIkFlrYUQbhnOR,AMZN,Amazon,n/a,2020-07-01 10:26:13\n'
+        alerts = []
+        asyncio.run(self.detector.run(lines(), alerts.append, 'csv'))
+        self.assertEqual(len(alerts), 3)
+        stats = self.detector.stats()
+        self.assertEqual(stats['trades'], 4)
+        self.assertEqual(stats['errors'], 1)
+        self.assertIsNotNone(stats['latency_p99_ms'])
+
+    def test_run_queue(self):
+        '''
+        Trades read from a local queue until None
+        '''
+        async def main():
+            queue = asyncio.Queue()
+            for trade in self.sample_trades + [None]:
+                queue.put_nowait(trade)
+            alerts = []
+            await self.detector.run(read_queue(queue), alerts.append)
+            return alerts
+        self.assertEqual(len(asyncio.run(main())), 3)
+
+    def test_serve(self):
+        '''
+        Trades sent as JSON lines over TCP, alerts sent back
+        '''
+        async def main():
+            server = await serve(self.detector, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            async with server:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                for trade in self.sample_trades:
+                    writer.write(json.dumps(trade).encode() + b'\n')
+                writer.write_eof()
+                alerts = [json.loads(line) async for line in reader]
+                writer.close()
+            return alerts
+        alerts = asyncio.run(main())
+        self.assertEqual([alert['traderId'] for alert in alerts], [
+            'JTzVqzzIkFlrYUQbhnOR', 'TzqyQTQjZGeLZuJqlLaQ', 'TzqyQTQjZGeLZuJqlLaQ'])
+
+    @property
+    def sample_trades(self):
+        '''
+        For mock: 4 trades of AMZN, 3 are suspicious
+        (price below Low, price above High, and 2020-07-04 is not a trading date)
+        '''
+        columns = ['countryCode', 'firstName', 'lastName', 'traderId',
+                   'stockSymbol', 'stockName', 'price', 'tradeDatetime']
+        data = [['UZ', 'Brandi', 'Robbins', 'JTzVqzzIkFlrYUQbhnOR', 'AMZN', 'Amazon', '1357.63', '2020-07-01 10:26:13'],
+                ['BT', 'Allison', 'Davis', 'TzqyQTQjZGeLZuJqlLaQ', 'AMZN', 'Amazon', '2678.44', '2020-07-02 15:03:46'],
+                ['CV', 'April', 'Floyd', 'stOzTFyGrgJGPgVPVTJQ', 'AMZN', 'Amazon', '2000.0', '2020-07-03 09:12:01'],
+                ['BT', 'Allison', 'Davis', 'TzqyQTQjZGeLZuJqlLaQ', 'AMZN', 'Amazon', '2103.0', '2020-07-04 11:47:20']]
+        return [dict(zip(columns, values)) for values in data]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import importlib.util
+import os
+import tempfile
+import unittest
+from detector.reader import Reader
+from detector.schema import TRADERS_COLUMNS
+from detector.writer import Writer
+import pandas as pd
+
+
+@unittest.skipUnless(importlib.util.find_spec('pyarrow'), 'pyarrow not installed')
+class TestWriter(unittest.TestCase):
+    def setUp(self):
+        '''
+        Before each test, create a temporary directory
+        '''
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.raw_df = Reader.load_csv_to_df("traders_data.csv")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_write_dataset(self):
+        '''
+        Traders data is partitioned by stock symbol and month, and read back with all rows
+        '''
+        for file_format in ['parquet', 'ipc']:
+            path = os.path.join(self.tmp_dir.name, file_format)
+            Writer.write_dataset(self.raw_df, path, file_format)
+            self.assertEqual(Reader.get_dataset_format(path), file_format)
+            self.assertTrue(os.path.isdir(os.path.join(
+                path, 'stockSymbol=AMZN', 'tradeMonth=2020-03')))
+            df = Reader.load_dataset_to_df(path, TRADERS_COLUMNS)
+            self.assertEqual(df.shape, (1000, 8))
+            self.assertEqual(list(df.columns), TRADERS_COLUMNS)
+            self.assertEqual(df.stockSymbol.isnull().sum(),
+                             self.raw_df.stockSymbol.isnull().sum())
+
+    def test_load_dataset_filters(self):
+        '''
+        Only rows of stock symbols and date range selected are read
+        '''
+        path = os.path.join(self.tmp_dir.name, 'trades')
+        Writer.write_dataset(self.raw_df, path)
+        df = Reader.load_dataset_to_df(
+            path, TRADERS_COLUMNS, ['AMZN'], '2020-03-01', '2020-03-31')
+        expected = self.raw_df[(self.raw_df.stockSymbol == 'AMZN') & (
+            self.raw_df.tradeDatetime >= '2020-03-01') & (self.raw_df.tradeDatetime < '2020-04-01')]
+        self.assertEqual(sorted(df.tradeDatetime),
+                         sorted(expected.tradeDatetime))
+        self.assertRaises(ValueError, Reader.load_dataset_to_df,
+                          path, TRADERS_COLUMNS, ['TSLA'], '2021-01-01')
+
+    def test_write_manipulated_dataset(self):
+        '''
+        Data with tradeDate is filtered on dates
+        '''
+        path = os.path.join(self.tmp_dir.name, 'manipulated')
+        df = pd.DataFrame({
+            'stockSymbol': pd.Categorical(['AMZN', 'FB', 'AMZN']),
+            'tradeDate': pd.to_datetime(['2020-03-31', '2020-04-01', '2020-04-02']),
+            'price': [1.0, 2.0, 3.0]})
+        Writer.write_dataset(df, path, 'ipc')
+        df = Reader.load_dataset_to_df(
+            path, ['stockSymbol', 'tradeDate', 'price'], end_date='2020-04-01')
+        self.assertEqual(sorted(df.price), [1.0, 2.0])
+
+    def test_write_report(self):
+        '''
+        Report index and column names are written as text columns
+        '''
+        path = os.path.join(self.tmp_dir.name, 'report.parquet')
+        report = pd.DataFrame({'2020-01': [1, 2], 'total': [1, 2]},
+                              index=pd.Index(['BT', 'RU'], name='country code'))
+        report.columns.name = 'month'
+        Writer.write_report(report, path)
+        df = Reader.load_dataset_to_df(path)
+        self.assertEqual(list(df.columns), ['country code', '2020-01', 'total'])
+        self.assertEqual(df['country code'].tolist(), ['BT', 'RU'])
+        self.assertRaises(ValueError, Writer.write_report,
+                          report, path, 'csv')
+
+    def test_write_frame(self):
+        '''
+        Data frame is read back the same, with its index, missing values and categories
+        '''
+        path = os.path.join(self.tmp_dir.name, 'frame.arrow')
+        df = pd.DataFrame({
+            'countryCode': pd.Categorical(['BT', None, 'UZ'], categories=['BT', 'CV', 'UZ']),
+            'name': ['Allison Davis', None, 'Brandi Robbins'],
+            'tradeDate': pd.to_datetime(['2020-07-01', None, '2020-07-03']),
+            'price': [1.0, float('nan'), 3.0],
+            'suspicious': [1, 1, 1]}, index=[3, 7, 9])
+        Writer.write_frame(df, path)
+        loaded = Reader.load_frame(path)
+        pd.testing.assert_frame_equal(loaded, df)
+        # numeric columns are not copied from the mapped file
+        self.assertFalse(loaded.price.values.flags.owndata)
+        Writer.write_frame(df.reset_index(drop=True), path)
+        self.assertIsInstance(Reader.load_frame(path).index, pd.RangeIndex)
+
+
+if __name__ == '__main__':
+    unittest.main()